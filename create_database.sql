@@ -110,6 +110,7 @@ create table if not exists account (
 
 -- Индекс для счетов по имени
 create index if not exists account_name_idx on account(name);
+create index if not exists account_active_user_idx on account(user_id) where is_active;
 
 -- Транзакции
 create table if not exists transaction (
@@ -132,6 +133,45 @@ create index if not exists transaction_user_id_idx on transaction(user_id);
 create index if not exists transaction_category_id_idx on transaction(category_id);
 create index if not exists transaction_account_id_idx on transaction(account_id);
 create index if not exists transaction_date_idx on transaction(date);
+create index if not exists transaction_user_date_idx on transaction(user_id, date, id);
+create index if not exists transaction_user_type_date_idx
+    on transaction(user_id, type, date) include (amount);
+create index if not exists transaction_account_type_idx on transaction(account_id, type);
+create index if not exists transaction_user_amount_idx on transaction(user_id, amount, id);
+-- Полнотекстовый поиск по описанию (префиксные запросы to_tsquery('simple', 'слово:*'))
+create index if not exists transaction_description_search_idx
+    on transaction using gin (to_tsvector('simple', coalesce(description, '')));
+
+-- Остаток на счете на конец дня (только дни с транзакциями)
+create table if not exists account_balance_snapshot (
+    id serial primary key,
+    account_id integer not null,
+    date date not null,
+    balance numeric(16, 2) not null,
+    foreign key (account_id) references account(id) on delete cascade,
+    unique(account_id, date)
+);
+
+-- Месячные итоги пользователя по категориям и типам
+create table if not exists monthly_category_rollup (
+    id serial primary key,
+    user_id integer not null,
+    month date not null,
+    category_id integer,
+    type varchar(20) not null,
+    total numeric(18, 2) not null default 0,
+    count integer not null default 0,
+    check (type in ('INCOME', 'OUTCOME')),
+    foreign key (user_id) references "user"(id) on delete cascade,
+    foreign key (category_id) references category(id) on delete cascade
+);
+
+create unique index if not exists monthly_rollup_unique_category
+    on monthly_category_rollup(user_id, month, category_id, type)
+    where category_id is not null;
+create unique index if not exists monthly_rollup_unique_no_category
+    on monthly_category_rollup(user_id, month, type)
+    where category_id is null;
 
 -- Повторяющиеся транзакции транзакций
 create table if not exists recurring_transaction (
@@ -142,6 +182,7 @@ create table if not exists recurring_transaction (
     start_date date not null default current_date,
     end_date date,
     frequency varchar(10) not null default 'monthly',
+    next_run_date date,
     category_id integer,
     user_id integer not null,
     account_id integer,
@@ -156,6 +197,33 @@ create table if not exists recurring_transaction (
 create index if not exists recurring_transaction_user_id_idx on recurring_transaction(user_id);
 create index if not exists recurring_transaction_category_id_idx on recurring_transaction(category_id);
 create index if not exists recurring_transaction_account_id_idx on recurring_transaction(account_id);
+create index if not exists recurring_transaction_next_run_date_idx on recurring_transaction(next_run_date);
+
+-- Выполненные запуски повторяющихся транзакций
+create table if not exists recurring_transaction_occurrence (
+    id bigserial primary key,
+    recurring_id integer not null,
+    date date not null,
+    transaction_id integer,
+    created_at timestamp with time zone not null default current_timestamp,
+    unique(recurring_id, date),
+    foreign key (recurring_id) references recurring_transaction(id) on delete cascade,
+    foreign key (transaction_id) references transaction(id) on delete set null
+);
+
+-- Журнал запусков периодических задач
+create table if not exists job_run (
+    id bigserial primary key,
+    name varchar(100) not null,
+    status varchar(10) not null default 'running',
+    started_at timestamp with time zone not null default current_timestamp,
+    finished_at timestamp with time zone,
+    stats jsonb not null default '{}',
+    error text not null default '',
+    check (status in ('running', 'success', 'failed', 'skipped'))
+);
+
+create index if not exists job_run_name_status_idx on job_run(name, status);
 
 -- Бюджет
 create table if not exists budget (
@@ -176,6 +244,8 @@ create table if not exists budget (
 -- Индекс для бюджета по дате начала
 create index if not exists budget_start_date_idx on budget(start_date desc);
 create index if not exists budget_user_id_idx on budget(user_id);
+create index if not exists budget_active_user_idx
+    on budget(user_id, start_date desc) where is_active;
 
 -- Лимиты категорий в бюджетах
 create table if not exists budget_category_limit (
@@ -246,21 +316,21 @@ create index if not exists budget_history_changed_at_idx
 
 -- VIEWS
 
--- Отчет по доходам и расходам по месяцам
+-- Отчет по доходам и расходам по месяцам (по месячным итогам)
 create or replace view v_monthly_income_expense_report as
 select 
     u.id as user_id,
     u.email,
-    date_trunc('month', t.date) as month,
-    coalesce(sum(case when t.type = 'INCOME' then t.amount else 0 end), 0) as total_income,
-    coalesce(sum(case when t.type = 'OUTCOME' then t.amount else 0 end), 0) as total_expense,
-    coalesce(sum(case when t.type = 'INCOME' then t.amount else 0 end), 0) - 
-    coalesce(sum(case when t.type = 'OUTCOME' then t.amount else 0 end), 0) as net_amount,
-    count(case when t.type = 'INCOME' then 1 end) as income_count,
-    count(case when t.type = 'OUTCOME' then 1 end) as expense_count
+    r.month::timestamp as month,
+    coalesce(sum(case when r.type = 'INCOME' then r.total else 0 end), 0) as total_income,
+    coalesce(sum(case when r.type = 'OUTCOME' then r.total else 0 end), 0) as total_expense,
+    coalesce(sum(case when r.type = 'INCOME' then r.total else 0 end), 0) - 
+    coalesce(sum(case when r.type = 'OUTCOME' then r.total else 0 end), 0) as net_amount,
+    coalesce(sum(case when r.type = 'INCOME' then r.count end), 0) as income_count,
+    coalesce(sum(case when r.type = 'OUTCOME' then r.count end), 0) as expense_count
 from "user" u
-left join transaction t on u.id = t.user_id
-group by u.id, u.email, date_trunc('month', t.date)
+left join monthly_category_rollup r on u.id = r.user_id and r.count > 0
+group by u.id, u.email, r.month
 order by u.id, month desc;
 
 
@@ -348,6 +418,64 @@ order by b.start_date desc;
 
 -- ПРОЦЕДУРЫ
 
+-- Сдвиг дневных снимков остатка счета начиная с даты транзакции
+create or replace function fn_apply_balance_snapshot_delta(
+    p_account_id integer,
+    p_date date,
+    p_delta numeric(16, 2)
+)
+returns void
+language plpgsql
+as $$
+begin
+    insert into account_balance_snapshot (account_id, date, balance)
+    select a.id, p_date, coalesce(
+        (select s.balance
+         from account_balance_snapshot s
+         where s.account_id = a.id and s.date < p_date
+         order by s.date desc
+         limit 1),
+        a.initial_balance
+    )
+    from account a
+    where a.id = p_account_id
+    on conflict (account_id, date) do nothing;
+    
+    update account_balance_snapshot
+    set balance = balance + p_delta
+    where account_id = p_account_id and date >= p_date;
+end;
+$$;
+
+-- Обновление месячных итогов по категориям
+create or replace function fn_apply_monthly_rollup_delta(
+    p_user_id integer,
+    p_category_id integer,
+    p_type varchar(20),
+    p_date date,
+    p_amount numeric(16, 2),
+    p_count integer
+)
+returns void
+language plpgsql
+as $$
+begin
+    if p_category_id is not null then
+        insert into monthly_category_rollup (user_id, month, category_id, type, total, count)
+        values (p_user_id, date_trunc('month', p_date)::date, p_category_id, p_type, p_amount, p_count)
+        on conflict (user_id, month, category_id, type) where category_id is not null
+        do update set total = monthly_category_rollup.total + excluded.total,
+                      count = monthly_category_rollup.count + excluded.count;
+    else
+        insert into monthly_category_rollup (user_id, month, category_id, type, total, count)
+        values (p_user_id, date_trunc('month', p_date)::date, null, p_type, p_amount, p_count)
+        on conflict (user_id, month, type) where category_id is null
+        do update set total = monthly_category_rollup.total + excluded.total,
+                      count = monthly_category_rollup.count + excluded.count;
+    end if;
+end;
+$$;
+
 -- Создание транзакции с автоматическим обновлением баланса счета
 create or replace procedure sp_create_transaction_with_balance_update(
     p_user_id integer,
@@ -384,6 +512,8 @@ begin
         p_user_id, p_account_id, p_category_id, p_type, p_amount, p_date, p_description
     ) returning id into p_transaction_id;
     
+    perform fn_apply_monthly_rollup_delta(p_user_id, p_category_id, p_type, p_date, p_amount, 1);
+    
     if p_account_id is not null then
         if p_type = 'INCOME' then
             update account
@@ -396,6 +526,12 @@ begin
                 updated_at = current_timestamp
             where id = p_account_id;
         end if;
+        
+        perform fn_apply_balance_snapshot_delta(
+            p_account_id,
+            p_date,
+            case when p_type = 'INCOME' then p_amount else -p_amount end
+        );
     end if;
     
     commit;
@@ -433,7 +569,7 @@ $$;
 
 -- ФУНКЦИИ
 
--- Расчет баланса счета на определенную дату
+-- Расчет баланса счета на определенную дату (по дневным снимкам остатка)
 create or replace function fn_get_account_balance_on_date(
     p_account_id integer,
     p_date date default current_date
@@ -445,8 +581,6 @@ as $$
 declare
     v_balance numeric(16, 2);
     v_initial_balance numeric(16, 2);
-    v_income numeric(16, 2);
-    v_expense numeric(16, 2);
 begin
     select initial_balance into v_initial_balance
     from account
@@ -456,19 +590,16 @@ begin
         raise exception 'Account not found: %', p_account_id;
     end if;
     
-    select coalesce(sum(amount), 0) into v_income
-    from transaction
-    where account_id = p_account_id
-        and type = 'INCOME'
-        and date <= p_date;
-    
-    select coalesce(sum(amount), 0) into v_expense
-    from transaction
+    select balance into v_balance
+    from account_balance_snapshot
     where account_id = p_account_id
-        and type = 'OUTCOME'
-        and date <= p_date;
+        and date <= p_date
+    order by date desc
+    limit 1;
     
-    v_balance := v_initial_balance + v_income - v_expense;
+    if not FOUND then
+        v_balance := v_initial_balance;
+    end if;
     
     return v_balance;
 end;
@@ -662,10 +793,13 @@ grant all privileges on all procedures in schema public to admin_role;
 -- Права для оператора (доступ к транзакциям, счетам, категориям, но не к пользователям)
 grant select, insert, update, delete on transaction to operator_role;
 grant select, insert, update, delete on account to operator_role;
+grant select, insert, update, delete on account_balance_snapshot to operator_role;
+grant select, insert, update, delete on monthly_category_rollup to operator_role;
 grant select, insert, update, delete on category to operator_role;
 grant select, insert, update, delete on budget to operator_role;
 grant select, insert, update, delete on budget_category_limit to operator_role;
 grant select, insert, update, delete on recurring_transaction to operator_role;
+grant select, insert, update, delete on recurring_transaction_occurrence to operator_role;
 grant select on "user" to operator_role;
 grant select on currency to operator_role;
 grant select on account_history to operator_role;
@@ -679,6 +813,8 @@ grant select on v_budget_execution_report to operator_role;
 
 -- Права на функции и процедуры для оператора
 grant execute on function fn_get_account_balance_on_date to operator_role;
+grant execute on function fn_apply_balance_snapshot_delta to operator_role;
+grant execute on function fn_apply_monthly_rollup_delta to operator_role;
 grant execute on function fn_check_budget_limits to operator_role;
 grant execute on procedure sp_create_transaction_with_balance_update to operator_role;
 grant execute on procedure sp_close_budget to operator_role;
@@ -686,6 +822,8 @@ grant execute on procedure sp_close_budget to operator_role;
 -- Права для клиента (только чтение)
 grant select on transaction to client_role;
 grant select on account to client_role;
+grant select on account_balance_snapshot to client_role;
+grant select on monthly_category_rollup to client_role;
 grant select on category to client_role;
 grant select on budget to client_role;
 grant select on budget_category_limit to client_role;
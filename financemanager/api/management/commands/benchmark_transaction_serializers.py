@@ -0,0 +1,114 @@
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import TransactionReadSerializer, TransactionSerializer
+from transaction.models import Category, Transaction, Type
+from utils.benchmarks import rolled_back
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare throughput of transaction list serialization: ModelSerializer '
+        'against the values() fast path, sparse fields and the orjson renderer. '
+        'All data is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-sizes',
+            type=int,
+            nargs='+',
+            default=[50, 1000],
+            help='Rows per page to measure (default: 50 1000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Pages rendered per variant (default: 50)',
+        )
+
+    def handle(self, *args, **options):
+        page_sizes = sorted(options['page_sizes'])
+        repeat = options['repeat']
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed, fast renderer = json'))
+
+        self.stdout.write(
+            f'{"variant":>14} {"rows":>6} {"mean ms":>10} {"rows/s":>12} {"speedup":>8}'
+        )
+        with rolled_back():
+            user = User.objects.create_user(
+                email='serializer-benchmark@example.com', password=None
+            )
+            self._seed(user, max(page_sizes))
+            queryset = Transaction.objects.filter(user=user).order_by('-date', '-id')
+
+            for size in page_sizes:
+                baseline = None
+                for name, render in self._variants(queryset, size):
+                    timings = self._measure(render, repeat)
+                    mean = statistics.mean(timings)
+                    baseline = baseline or mean
+                    self.stdout.write(
+                        f'{name:>14} {size:>6} {mean * 1000:>10.3f} '
+                        f'{size / mean:>12.0f} {baseline / mean:>7.2f}x'
+                    )
+
+    def _seed(self, user, count):
+        category = Category.objects.create(name='Benchmark', user=user, type=Type.OUTCOME)
+        start = date.today() - timedelta(days=365)
+        Transaction.objects.bulk_create(
+            (
+                Transaction(
+                    user=user,
+                    category=category if i % 2 else None,
+                    type=Type.OUTCOME,
+                    amount=Decimal('10.00') + i,
+                    date=start + timedelta(days=i % 365),
+                    description=f'Benchmark transaction {i}',
+                )
+                for i in range(count)
+            ),
+            batch_size=5000,
+        )
+
+    def _variants(self, queryset, size):
+        json_renderer = JSONRenderer()
+        fast_renderer = FastJSONRenderer()
+        sparse = ['id', 'amount', 'date']
+
+        def model():
+            data = TransactionSerializer(queryset[:size], many=True).data
+            return json_renderer.render({'results': data})
+
+        def fast(renderer, fields=None):
+            rows = queryset.values(*TransactionReadSerializer.columns(fields))[:size]
+            data = TransactionReadSerializer(rows, many=True, fields=fields).data
+            return renderer.render({'results': data})
+
+        return [
+            ('model', model),
+            ('values', lambda: fast(json_renderer)),
+            ('values+orjson', lambda: fast(fast_renderer)),
+            ('sparse+orjson', lambda: fast(fast_renderer, sparse)),
+        ]
+
+    @staticmethod
+    def _measure(render, repeat):
+        render()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started)
+        return timings
@@ -1,9 +1,10 @@
 from django.db import IntegrityError
+from django.utils import timezone
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 
-from transaction.models import Transaction, Category
+from transaction.models import Transaction, Category, Type
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -12,6 +13,81 @@ class TransactionSerializer(serializers.ModelSerializer):
         fields = ('id', 'type', 'amount', 'date', 'description', 'category')
 
 
+class TransactionReadSerializer(serializers.BaseSerializer):
+    """
+    Read-only fast path for transaction lists. Rows come from values()
+    and are mapped to dicts directly, without a Field object per value.
+    Output is the same as TransactionSerializer, optionally narrowed to
+    fields.
+    """
+    # Поле ответа -> столбец values() и преобразование значения
+    FIELDS = {
+        'id': ('id', None),
+        'type': ('type', None),
+        'amount': ('amount', str),
+        'date': ('date', lambda value: value.isoformat()),
+        'description': ('description', None),
+        'category': ('category_id', None),
+    }
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output_fields = [
+            (name, *self.FIELDS[name]) for name in (fields or TransactionSerializer.Meta.fields)
+        ]
+
+    @classmethod
+    def columns(cls, fields=None):
+        return [cls.FIELDS[name][0] for name in (fields or TransactionSerializer.Meta.fields)]
+
+    def to_representation(self, row):
+        return {
+            name: row[column] if convert is None or row[column] is None else convert(row[column])
+            for name, column, convert in self.output_fields
+        }
+
+
+class TransactionBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Validates one item of a bulk upload. Categories and accounts are
+    resolved from maps preloaded by the view (context['categories'],
+    context['accounts']) instead of a query per item.
+    """
+    category = serializers.IntegerField(required=False, allow_null=True)
+    account = serializers.IntegerField(required=False, allow_null=True)
+
+    def _resolve(self, name, pk):
+        if pk is None:
+            return None
+        obj = self.context[name].get(pk)
+        if obj is None:
+            raise serializers.ValidationError(
+                f'Invalid pk "{pk}" - object does not exist.'
+            )
+        return obj
+
+    def validate_category(self, value):
+        return self._resolve('categories', value)
+
+    def validate_account(self, value):
+        return self._resolve('accounts', value)
+
+    def validate(self, attrs):
+        attrs.setdefault('type', Type.OUTCOME)
+        attrs.setdefault('date', timezone.now().date())
+        category = attrs.get('category')
+        if category and category.type != attrs['type']:
+            raise serializers.ValidationError({
+                'category': f"Category '{category.translated_name}' does not match "
+                            f"Transaction type '{attrs['type']}'"
+            })
+        return attrs
+
+    class Meta:
+        model = Transaction
+        fields = ('type', 'amount', 'date', 'description', 'category', 'account')
+
+
 class CategorySerializer(serializers.ModelSerializer):    
     def create(self, validated_data):
         validated_data['is_system'] = False
@@ -1,12 +1,20 @@
-from datetime import datetime
+import json
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from transaction.models import Transaction, Category
+from transaction.models import Transaction, Category, Account
 from authapp.models import Currency
+from .renderers import FastJSONRenderer
+from .serializers import TransactionSerializer
 
 User = get_user_model()
 
@@ -164,3 +172,198 @@ class CategoryAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND2)
     
     
+
+class TransactionAPITestCase(APITestCase):
+    def setUp(self):
+        self.currency = Currency.objects.create(
+            name='USD',
+            symbol='$'
+        )
+        self.user1 = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com',
+            currency=self.currency
+        )
+        self.user2 = User.objects.create_user(
+            password='testpass2',
+            email='testuser2@example.com',
+            currency=self.currency
+        )
+        self.account = Account.objects.create(
+            name='Main',
+            account_type='BANK',
+            user=self.user1
+        )
+        self.foreign_account = Account.objects.create(
+            name='Main',
+            account_type='BANK',
+            user=self.user2
+        )
+        self.food = Category.objects.create(name='Food', is_system=True, type='OUTCOME')
+        self.salary = Category.objects.create(name='Salary', is_system=True, type='INCOME')
+
+        self.token_user1 = RefreshToken.for_user(self.user1)
+
+    def authenticate_user1(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token_user1.access_token}')
+
+
+class TransactionBulkAPITests(TransactionAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.bulk_url = reverse('api-transactions-bulk')
+
+    def test_bulk_not_authenticated(self):
+        response = self.client.post(self.bulk_url, data=[], format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bulk_create_with_partial_errors(self):
+        self.authenticate_user1()
+        items = [
+            {'type': 'OUTCOME', 'amount': '10.00', 'date': '2025-01-01',
+             'category': self.food.id, 'account': self.account.id},
+            {'type': 'INCOME', 'amount': '100.00', 'date': '2025-01-02',
+             'category': self.salary.id, 'account': self.account.id},
+            # category type mismatch
+            {'type': 'INCOME', 'amount': '5.00', 'category': self.food.id},
+            # account of another user
+            {'type': 'OUTCOME', 'amount': '5.00', 'account': self.foreign_account.id},
+            {'type': 'OUTCOME'},
+        ]
+        response = self.client.post(self.bulk_url, data=items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual([e['index'] for e in response.data['errors']], [2, 3, 4])
+        self.assertEqual(Transaction.objects.filter(user=self.user1).count(), 2)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('90.00'))
+
+    def test_bulk_all_invalid(self):
+        self.authenticate_user1()
+        response = self.client.post(self.bulk_url, data=[{'amount': 'x'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_expects_list(self):
+        self.authenticate_user1()
+        response = self.client.post(self.bulk_url, data={'amount': '1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TransactionExportAPITests(TransactionAPITestCase):
+    def test_export_streams_filtered_rows(self):
+        self.authenticate_user1()
+        Transaction.objects.create(
+            user=self.user1, account=self.account, type='OUTCOME',
+            category=self.food, amount=Decimal('10.00'), date='2025-01-01'
+        )
+        Transaction.objects.create(
+            user=self.user1, account=self.account, type='INCOME',
+            category=self.salary, amount=Decimal('20.00'), date='2025-02-01'
+        )
+        Transaction.objects.create(
+            user=self.user2, type='INCOME', amount=Decimal('30.00'), date='2025-02-01'
+        )
+        url = reverse('api-transactions-export')
+
+        response = self.client.get(url, {'date_from': '2025-01-15'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,type,amount,category,account,description')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('2025-02-01,INCOME,20.00,Salary,Main', lines[1])
+
+        response = self.client.get(url, {'export_format': 'jsonl'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['amount'] for row in rows], ['20.00', '10.00'])
+
+
+class TransactionListAPITests(TransactionAPITestCase):
+    def test_list_uses_cursor_pagination(self):
+        self.authenticate_user1()
+        for day in (1, 1, 2, 3):
+            Transaction.objects.create(
+                user=self.user1, type='OUTCOME', amount=Decimal('1.00'),
+                date=f'2025-01-0{day}'
+            )
+        url = reverse('api-transactions-list')
+
+        response = self.client.get(url, {'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(
+            [row['date'] for row in response.data['results']],
+            ['2025-01-03', '2025-01-02', '2025-01-01']
+        )
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['date'] for row in response.data['results']], ['2025-01-01'])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(url, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_fast_list_matches_model_serializer(self):
+        self.authenticate_user1()
+        Transaction.objects.create(
+            user=self.user1, account=self.account, type='OUTCOME', category=self.food,
+            amount=Decimal('10.50'), date='2025-01-01', description='Кофе'
+        )
+        Transaction.objects.create(user=self.user1, type='INCOME', amount=Decimal('3'))
+
+        response = self.client.get(reverse('api-transactions-list'))
+        expected = TransactionSerializer(
+            Transaction.objects.filter(user=self.user1).order_by('-date', '-id'), many=True
+        ).data
+        self.assertEqual(response.json()['results'], json.loads(json.dumps(expected)))
+
+    def test_sparse_fields(self):
+        self.authenticate_user1()
+        for day in (1, 2, 3):
+            Transaction.objects.create(
+                user=self.user1, type='OUTCOME', amount=Decimal('1.00'),
+                date=f'2025-01-0{day}', description='Secret'
+            )
+        url = reverse('api-transactions-list')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'amount,amount', 'page_size': 2})
+        self.assertEqual(response.json()['results'], [{'amount': '1.00'}, {'amount': '1.00'}])
+        select = [q['sql'] for q in queries.captured_queries if 'transaction_transaction' in q['sql']]
+        self.assertNotIn('description', select[-1])
+
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(response.json()['results'], [{'amount': '1.00'}])
+
+        response = self.client.get(url, {'fields': 'amount,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TransactionSearchAPITests(TransactionAPITestCase):
+    def test_search_returns_ranked_matches(self):
+        self.authenticate_user1()
+        for description in ('Business lunch with the whole team', 'Dinner', 'Lunch'):
+            Transaction.objects.create(
+                user=self.user1, type='OUTCOME', amount=Decimal('1.00'), description=description
+            )
+        Transaction.objects.create(
+            user=self.user2, type='OUTCOME', amount=Decimal('1.00'), description='Lunch'
+        )
+        url = reverse('api-transactions-search')
+
+        response = self.client.get(url, {'q': 'lun'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row['description'] for row in response.data['results']],
+            ['Lunch', 'Business lunch with the whole team']
+        )
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'Кофе ✓', 'amount': Decimal('1.50'), 'day': date(2025, 1, 2),
+            'at': datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc), 1: None,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
@@ -1,27 +1,166 @@
-from rest_framework import viewsets, permissions, generics
+from rest_framework import viewsets, permissions, generics, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 from django.db.models import Q
+from django.utils.decorators import method_decorator
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 
-from transaction.models import Transaction, Category
+from transaction.exporters import EXPORT_FORMATS, export_response
+from transaction.filters import TransactionFilter
+from transaction.ledger import bulk_create_transactions
+from transaction.models import Transaction, Category, Account
 from transaction.permissions import CategoryPermission
+from transaction.search import search_transactions
+from financemanager.querycount import query_budget
+from financemanager.routers import replica_reads
+from stats.conditional import user_data_condition
+from .pagination import TransactionCursorPagination
 from .serializers import (
     TransactionSerializer, 
+    TransactionReadSerializer,
+    TransactionBulkItemSerializer,
     CategorySerializer,
     UserRegistrationSerializer
 )
 
 
+def _collect_ids(items, field):
+    ids = set()
+    for item in items:
+        value = item.get(field) if isinstance(item, dict) else None
+        if isinstance(value, int) and not isinstance(value, bool):
+            ids.add(value)
+        elif isinstance(value, str) and value.isdigit():
+            ids.add(int(value))
+    return ids
+
+
+@method_decorator(replica_reads, name='list')
+@method_decorator(user_data_condition, name='list')
+@method_decorator(user_data_condition, name='retrieve')
 class TransactionViewset(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'delete']
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TransactionCursorPagination
+
+    bulk_max_items = 1000
+    search_max_results = 100
 
     def get_queryset(self):
         user = self.request.user
         return Transaction.objects.filter(user=user)
 
+    def get_list_fields(self):
+        value = self.request.query_params.get('fields')
+        if not value:
+            return None
+        fields = list(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+        unknown = [f for f in fields if f not in TransactionReadSerializer.FIELDS]
+        if unknown or not fields:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(unknown)}'})
+        return fields
+
+    @extend_schema(parameters=[OpenApiParameter(
+        'fields', str, description='Comma separated fields to return, e.g. id,amount,date'
+    )])
+    @query_budget(8)
+    def list(self, request, *args, **kwargs):
+        fields = self.get_list_fields()
+        # id и date нужны курсору пагинации, даже если их нет в ответе
+        columns = {'id', 'date', *TransactionReadSerializer.columns(fields)}
+        page = self.paginate_queryset(self.get_queryset().values(*columns))
+        serializer = TransactionReadSerializer(page, many=True, fields=fields)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'detail': f'Unsupported export format: {export_format}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        list_filter = TransactionFilter(
+            request.query_params,
+            queryset=self.get_queryset().order_by('-date'),
+            user=request.user
+        )
+        return export_response(list_filter.qs, export_format)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'detail': 'Query parameter q is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.search_max_results)
+        except ValueError:
+            limit = 20
+
+        results = search_transactions(self.get_queryset(), query).order_by(
+            '-search_rank', '-date', '-id'
+        )[:max(limit, 1)]
+        return Response({'results': self.get_serializer(results, many=True).data})
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {'detail': 'Expected a list of transactions.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.bulk_max_items:
+            return Response(
+                {'detail': f'At most {self.bulk_max_items} transactions per request.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user = request.user
+        context = {
+            'request': request,
+            'categories': Category.objects.filter(
+                Q(user=user) | Q(is_system=True),
+                id__in=_collect_ids(items, 'category')
+            ).in_bulk(),
+            'accounts': Account.objects.filter(
+                user=user,
+                is_active=True,
+                id__in=_collect_ids(items, 'account')
+            ).in_bulk(),
+        }
+
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            serializer = TransactionBulkItemSerializer(data=item, context=context)
+            if serializer.is_valid():
+                valid.append(Transaction(user=user, **serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        created = bulk_create_transactions(valid) if valid else []
+
+        return Response(
+            {
+                'created': TransactionSerializer(created, many=True).data,
+                'errors': errors,
+            },
+            status=status.HTTP_201_CREATED if created or not errors
+            else status.HTTP_400_BAD_REQUEST
+        )
+
 
+@method_decorator(replica_reads, name='list')
+@method_decorator(user_data_condition, name='list')
+@method_decorator(user_data_condition, name='retrieve')
+@query_budget(9)
 class CategoryViewset(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'delete']
     serializer_class = CategorySerializer
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from transaction.ledger import ledger_changed
+from transaction.models import Account, Budget, BudgetCategoryLimit, Category
+
+from .snapshots import schedule_rebuild
+
+
+@receiver(ledger_changed)
+def rebuild_after_ledger_change(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        schedule_rebuild(user_id)
+
+
+@receiver([post_save, post_delete], sender=Account)
+@receiver([post_save, post_delete], sender=Budget)
+@receiver([post_save, post_delete], sender=Category)
+def rebuild_after_user_data_change(sender, instance, **kwargs):
+    if instance.user_id:
+        schedule_rebuild(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=BudgetCategoryLimit)
+def rebuild_after_limit_change(sender, instance, origin=None, **kwargs):
+    # Каскад от удаления бюджета уже обработан сигналом Budget
+    if isinstance(origin, Budget):
+        return
+    # Формсет лимитов передает загруженный бюджет, запроса нет
+    if instance.budget.user_id:
+        schedule_rebuild(instance.budget.user_id)
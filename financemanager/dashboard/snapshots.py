@@ -0,0 +1,228 @@
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connections, transaction as db_transaction
+from django.http import QueryDict
+from django.utils import timezone
+from financemanager.routers import read_alias
+from stats.cache import compute_payload, current_payload, get_payload, language_neutral
+from transaction.models import Account, Budget, Category, Transaction, lazy_category_name
+from utils.concurrency import run_queries
+from utils.diagram_data import period_stats
+
+logger = logging.getLogger(__name__)
+
+
+# Снимок живет дольше суток, после смены дня используется ключ новой даты
+SNAPSHOT_TTL = 26 * 60 * 60
+
+# Пересборка откладывается, чтобы серия записей дала одну задачу
+REBUILD_DEBOUNCE = 5
+
+REBUILD_FLAG_TIMEOUT = 60
+
+
+def _budget_report(budget, user_id):
+    with connections[read_alias()].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT 
+                actual_expense, 
+                actual_income, 
+                expense_remaining, 
+                total_expense_limit,
+                expense_percentage_used
+            FROM v_budget_execution_report
+            WHERE budget_id = %s AND user_id = %s
+        """,
+            [budget.id, user_id],
+        )
+
+        row = cursor.fetchone()
+
+    if row:
+        return row[0] or Decimal("0"), row[1] or Decimal("0"), row[2], row[3], row[4]
+
+    spent = budget.get_spent_amount()
+    budget_limit = budget.total_expense_limit
+    return (
+        spent,
+        budget.get_income_amount(),
+        budget.get_remaining_budget(),
+        budget_limit,
+        (spent / budget_limit * 100) if budget_limit else None,
+    )
+
+
+def _budget_limits(budget):
+    with connections[read_alias()].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT 
+                category_name,
+                spent_amount,
+                limit_amount,
+                percentage_used
+            FROM fn_check_budget_limits(%s)
+            ORDER BY percentage_used DESC
+        """,
+            [budget.id],
+        )
+
+        return cursor.fetchall()
+
+
+@language_neutral
+def dashboard_payload(user_id, params):
+    """
+    Everything on the dashboard except request-bound forms.
+
+    Independent queries run concurrently through run_queries: the period
+    stats, accounts and current budget first, then the three budget
+    queries that only need its id. Category labels stay lazy, so the
+    snapshot built by a worker serves users of every language.
+    """
+    end_date = date.fromisoformat(params["date"])
+    start_date = end_date - timedelta(days=30)
+
+    qs = Transaction.objects.filter(
+        date__range=(start_date, end_date), user_id=user_id
+    )
+    data, accounts, current_budget = run_queries(
+        lambda: period_stats(
+            qs,
+            scope={"user_id": user_id, "date_from": start_date, "date_to": end_date},
+            translate=lazy_category_name,
+        ),
+        lambda: list(Account.objects.filter(user_id=user_id, is_active=True)),
+        lambda: (
+            Budget.objects.filter(
+                user_id=user_id,
+                is_active=True,
+                start_date__lte=end_date,
+                end_date__gte=start_date,
+            )
+            .order_by("-start_date")
+            .first()
+        ),
+    )
+    total_balance = sum((account.balance for account in accounts), Decimal("0"))
+
+    budget_data = {}
+    budget_categories = []
+
+    if current_budget:
+        report, budget_categories, rows = run_queries(
+            lambda: _budget_report(current_budget, user_id),
+            lambda: list(
+                Category.objects.filter(
+                    budgetcategorylimit__budget=current_budget
+                ).distinct()
+            ),
+            lambda: _budget_limits(current_budget),
+        )
+        spent, income, remaining, budget_limit, budget_percentage = report
+
+        # Переводы системных категорий одним запросом
+        labels = Category.system_labels(
+            (row[0] for row in rows), translate=lazy_category_name
+        )
+
+        budget_expense_by_category = []
+        for row in rows:
+            budget_expense_by_category.append(
+                {
+                    "category__name": labels[row[0]],
+                    "total": row[1],
+                    "limit": row[2],
+                    "usage_percent": row[3] or 0,
+                }
+            )
+
+        budget_data = {
+            "budget": current_budget,
+            "budget_spent": spent,
+            "budget_income": income,
+            "budget_remaining": remaining,
+            "budget_limit": budget_limit,
+            "budget_percentage": budget_percentage,
+            "budget_expense_by_category": budget_expense_by_category,
+        }
+
+    return {
+        "total_income": data["total_income"],
+        "total_expense": data["total_expense"],
+        "balance": total_balance,
+        "labels": data["labels"],
+        "income_data": data["income_data"],
+        "expense_data": data["expense_data"],
+        "expense_categories": data["expense_categories"],
+        "accounts": accounts,
+        **budget_data,
+        "categories": budget_categories,
+    }
+
+
+def snapshot_params(day):
+    return QueryDict(f"date={day.isoformat()}")
+
+
+def get_snapshot(user_id):
+    """
+    Dashboard payload of the user for today.
+
+    Normally a single cache read of the snapshot prebuilt by
+    rebuild_dashboard_snapshot. A snapshot older than the user's last write
+    (rebuild still pending) is rebuilt synchronously.
+    """
+    return get_payload(
+        dashboard_payload,
+        user_id,
+        snapshot_params(timezone.now().date()),
+        soft_ttl=None,
+        timeout=SNAPSHOT_TTL,
+    )
+
+
+def rebuild_snapshot(user_id, day=None):
+    """
+    Builds the snapshot unless one of the current generation exists: the
+    first request after a write usually rebuilds it before the debounced
+    task runs. Returns whether it was built.
+    """
+    params = snapshot_params(day or timezone.now().date())
+    if current_payload(dashboard_payload, user_id, params) is not None:
+        return False
+    compute_payload(dashboard_payload, user_id, params, timeout=SNAPSHOT_TTL)
+    return True
+
+
+def _rebuild_flag_key(user_id):
+    return f"dashboard_rebuild_{user_id}"
+
+
+def clear_rebuild_flag(user_id):
+    cache.delete(_rebuild_flag_key(user_id))
+
+
+def schedule_rebuild(user_id):
+    """
+    Queues a snapshot rebuild after the current transaction commits.
+    Writes within REBUILD_DEBOUNCE seconds share one task.
+    """
+    from .tasks import rebuild_dashboard_snapshot
+
+    def enqueue():
+        if not cache.add(_rebuild_flag_key(user_id), 1, REBUILD_FLAG_TIMEOUT):
+            return
+        try:
+            rebuild_dashboard_snapshot.apply_async(
+                (user_id,), countdown=REBUILD_DEBOUNCE, retry=False
+            )
+        except Exception as e:
+            clear_rebuild_flag(user_id)
+            logger.warning(f"Не удалось поставить пересборку дашборда {user_id}: {e}")
+
+    db_transaction.on_commit(enqueue)
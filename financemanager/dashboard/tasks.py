@@ -0,0 +1,59 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from financemanager.querycount import query_budget
+from transaction.jobs import finish_run, start_run
+
+from .snapshots import clear_rebuild_flag, rebuild_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+SNAPSHOTS_JOB = "rebuild-dashboard-snapshots"
+
+# Снимки на новый день строятся только для недавно заходивших пользователей
+ACTIVE_USER_DAYS = 30
+
+ROLLOVER_CHUNK_SIZE = 100
+
+
+@shared_task
+@query_budget(14)
+def rebuild_dashboard_snapshot(user_id):
+    # Флаг снимается до расчета: запись во время расчета поставит новую задачу
+    clear_rebuild_flag(user_id)
+    try:
+        rebuilt = rebuild_snapshot(user_id)
+    except Exception as e:
+        logger.error(f"Ошибка пересборки дашборда пользователя {user_id}: {e}")
+        return f"Ошибка: {e}"
+    if not rebuilt:
+        return f"Дашборд пользователя {user_id} уже актуален"
+    return f"Дашборд пересобран для пользователя {user_id}"
+
+
+@shared_task
+@query_budget(8)
+def rebuild_dashboard_snapshots():
+    """Builds snapshots for the new day after midnight"""
+    run = start_run(SNAPSHOTS_JOB)
+    if run is None:
+        return "Пересборка уже выполняется"
+
+    active_since = timezone.now() - timedelta(days=ACTIVE_USER_DAYS)
+    user_ids = list(
+        get_user_model()
+        .objects.filter(is_active=True, last_login__gte=active_since)
+        .values_list("id", flat=True)
+    )
+    if user_ids:
+        rebuild_dashboard_snapshot.chunks(
+            [(user_id,) for user_id in user_ids], ROLLOVER_CHUNK_SIZE
+        ).apply_async()
+
+    finish_run(run.id, stats={"users": len(user_ids)})
+    logger.info(f"Запущена пересборка дашбордов: {len(user_ids)}")
+    return f"Пользователей: {len(user_ids)}"
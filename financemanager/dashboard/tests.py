@@ -1,3 +1,211 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, transaction as db_transaction
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+from django.utils.functional import Promise
+
+from dashboard.snapshots import (
+    REBUILD_DEBOUNCE, dashboard_payload, get_snapshot, rebuild_snapshot, snapshot_params
+)
+from dashboard.tasks import rebuild_dashboard_snapshot, rebuild_dashboard_snapshots
+from stats.cache import payload_key
+from transaction.models import Account, Category, JobRun, JobStatus, Transaction, Type
+from utils.concurrency import run_queries, shutdown_workers
+
+User = get_user_model()
+
+
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            password="testpass1",
+            email="testuser1@example.com"
+        )
+        self.account = Account.objects.create(
+            user=self.user, name="Card", balance=Decimal("100.00")
+        )
+
+    def test_prebuilt_snapshot_needs_no_queries(self):
+        rebuild_snapshot(self.user.id)
+        with self.assertNumQueries(0):
+            data = get_snapshot(self.user.id)
+        self.assertEqual(data["balance"], Decimal("100.00"))
+
+    def test_writes_schedule_one_rebuild(self):
+        with mock.patch(
+            "dashboard.tasks.rebuild_dashboard_snapshot.apply_async"
+        ) as apply_async, self.captureOnCommitCallbacks(execute=True):
+            for amount in ("1.00", "2.00"):
+                Transaction.objects.create(
+                    user=self.user, account=self.account, type=Type.OUTCOME,
+                    amount=Decimal(amount), date=timezone.now().date()
+                )
+        apply_async.assert_called_once_with(
+            (self.user.id,), countdown=REBUILD_DEBOUNCE, retry=False
+        )
+
+        rebuild_dashboard_snapshot(self.user.id)
+        with self.assertNumQueries(0):
+            data = get_snapshot(self.user.id)
+        self.assertEqual(data["total_expense"], Decimal("3.00"))
+
+    def test_snapshot_serves_every_language(self):
+        food = Category.objects.create(name="food_dining", is_system=True, type=Type.OUTCOME)
+        Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.OUTCOME, category=food,
+            amount=Decimal("5.00"), date=timezone.now().date()
+        )
+        rebuild_snapshot(self.user.id)
+
+        # Снимок собран воркером на языке по умолчанию и не пересобирается для ru
+        with translation.override("ru"), self.assertNumQueries(0):
+            data = get_snapshot(self.user.id)
+            label = data["expense_categories"][0]["category__name"]
+            self.assertIsInstance(label, Promise)
+            self.assertEqual(str(label), translation.gettext("Food & Dining"))
+
+    def test_task_skips_snapshot_rebuilt_by_request(self):
+        get_snapshot(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                rebuild_dashboard_snapshot(self.user.id),
+                f"Дашборд пользователя {self.user.id} уже актуален",
+            )
+
+    def test_fresh_after_write(self):
+        self.client.force_login(self.user)
+        url = reverse("dashboard:dashboard")
+        self.assertEqual(self.client.get(url).context["total_expense"], 0)
+        # Пересборка еще не выполнена, снимок устарел по поколению
+        with self.captureOnCommitCallbacks(execute=True), mock.patch(
+            "dashboard.tasks.rebuild_dashboard_snapshot.apply_async"
+        ):
+            Transaction.objects.create(
+                user=self.user, type=Type.OUTCOME, amount=Decimal("7.00"),
+                date=timezone.now().date()
+            )
+        self.assertEqual(
+            self.client.get(url).context["total_expense"], Decimal("7.00")
+        )
+
+    def test_day_rollover_rebuilds_active_users(self):
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+        idle = User.objects.create_user(
+            password="testpass1",
+            email="testuser2@example.com",
+            last_login=timezone.now() - timedelta(days=90),
+        )
+
+        rebuild_dashboard_snapshots.app.conf.task_always_eager = True
+        self.addCleanup(
+            setattr, rebuild_dashboard_snapshots.app.conf, "task_always_eager", False
+        )
+        self.assertEqual(rebuild_dashboard_snapshots(), "Пользователей: 1")
+
+        with self.assertNumQueries(0):
+            get_snapshot(self.user.id)
+        run = JobRun.objects.get(name="rebuild-dashboard-snapshots")
+        self.assertEqual((run.status, run.stats), (JobStatus.SUCCESS, {"users": 1}))
+        idle_key = payload_key(
+            dashboard_payload, idle.id, snapshot_params(timezone.now().date())
+        )
+        self.assertIsNone(cache.get(idle_key))
+
+
+class RunQueriesTests(SimpleTestCase):
+    def test_calls_run_concurrently(self):
+        # Оба вызова дождутся друг друга, только если выполняются одновременно
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait(value):
+            barrier.wait()
+            return value
+
+        self.assertEqual(run_queries(lambda: wait(1), lambda: wait(2)), [1, 2])
+
+    @override_settings(CONCURRENT_QUERY_WORKERS=1)
+    def test_single_worker_runs_in_caller_thread(self):
+        caller = threading.get_ident()
+        self.assertEqual(
+            run_queries(threading.get_ident, threading.get_ident), [caller, caller]
+        )
+
+    def test_errors_are_raised_to_caller(self):
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            run_queries(lambda: 1, fail)
+
+
+class ConcurrentDashboardTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # Записи фиксируются и ставят пересборку снимка в очередь
+        patcher = mock.patch("dashboard.tasks.rebuild_dashboard_snapshot.apply_async")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            password="testpass1",
+            email="testuser1@example.com"
+        )
+        Account.objects.create(user=self.user, name="Card", balance=Decimal("100.00"))
+        for amount, type in (("5.00", Type.OUTCOME), ("20.00", Type.INCOME)):
+            Transaction.objects.create(
+                user=self.user, type=type, amount=Decimal(amount),
+                date=timezone.now().date()
+            )
+
+    def test_concurrent_payload_matches_sequential(self):
+        params = snapshot_params(timezone.now().date())
+        with override_settings(CONCURRENT_QUERY_WORKERS=1):
+            sequential = dashboard_payload(self.user.id, params)
+        concurrent = dashboard_payload(self.user.id, params)
+
+        self.assertEqual(concurrent["total_expense"], Decimal("5.00"))
+        self.assertEqual(concurrent["balance"], Decimal("100.00"))
+        self.assertEqual(
+            {k: v for k, v in concurrent.items() if k != "accounts"},
+            {k: v for k, v in sequential.items() if k != "accounts"},
+        )
+
+    @override_settings(QUERY_WORKER_CONN_MAX_AGE=600)
+    def test_workers_reuse_connections(self):
+        shutdown_workers()
+        self.addCleanup(shutdown_workers)
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count)
+        self.addCleanup(connection_created.disconnect, count)
+        call = Transaction.objects.count
+        # SQLite в памяти не закрывает соединения, поэтому считаются и вызовы close()
+        wrapper = type(connections["default"])
+        with mock.patch.object(wrapper, "close", autospec=True, side_effect=wrapper.close) as close:
+            for _ in range(5):
+                self.assertEqual(run_queries(call, call), [2, 2])
+        # Новое соединение открывает только новый поток пула
+        self.assertLessEqual(len(opened), settings.CONCURRENT_QUERY_WORKERS)
+        close.assert_not_called()
+
+    def test_transaction_keeps_queries_on_its_connection(self):
+        with db_transaction.atomic():
+            Transaction.objects.create(
+                user=self.user, type=Type.OUTCOME, amount=Decimal("1.00"),
+                date=timezone.now().date()
+            )
+            # Незафиксированная запись видна только текущему соединению
+            data = dashboard_payload(self.user.id, snapshot_params(timezone.now().date()))
+        self.assertEqual(data["total_expense"], Decimal("6.00"))
@@ -0,0 +1,5 @@
+# Приложение Celery загружается вместе с Django, чтобы shared_task
+# использовали его настройки и базовый класс задач
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -1,9 +1,25 @@
 import os
-from celery import Celery
+from celery import Celery, Task
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'financemanager.settings')
 
-app = Celery('financemanager')
+
+class QueryBudgetTask(Task):
+    """Checks queries of every run against the @query_budget of the task"""
+
+    def __call__(self, *args, **kwargs):
+        from financemanager.querycount import track_queries
+
+        # Встроенные задачи (celery.starmap для chunks и т.п.) только вызывают наши
+        if self.name.startswith('celery.'):
+            return super().__call__(*args, **kwargs)
+
+        budget = getattr(self.run, 'query_budget', None)
+        with track_queries(self.name, budget):
+            return super().__call__(*args, **kwargs)
+
+
+app = Celery('financemanager', task_cls=QueryBudgetTask)
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
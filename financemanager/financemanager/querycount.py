@@ -0,0 +1,228 @@
+import logging
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+
+_current_log = ContextVar('query_log', default=None)
+
+# Значение по умолчанию для repeats, None отключает проверку N+1
+DEFAULT = object()
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """Shape of sql with literals and IN lists collapsed, equal for every row of an N+1 loop"""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _LITERAL_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryBudget:
+    def __init__(self, queries=None, repeats=DEFAULT):
+        self.queries = queries
+        self.repeats = repeats
+
+    @property
+    def max_repeats(self):
+        if self.repeats is DEFAULT:
+            return settings.QUERY_REPEAT_LIMIT
+        return self.repeats
+
+
+def query_budget(queries=None, repeats=DEFAULT):
+    """
+    Declares the query budget of a view function, a class-based view or
+    one of its methods (get, list, ...), or a Celery task: at most queries
+    statements in total and at most repeats runs of one query shape,
+    QUERY_REPEAT_LIMIT by default.
+    Batch jobs check every chunk against its own budget with query_batch.
+    """
+    def decorator(func):
+        func.query_budget = QueryBudget(queries, repeats)
+        return func
+
+    return decorator
+
+
+class QueryLog:
+    """
+    SQL statements of a request or task, counted per statement text.
+    Statements of isolated nested logs are only counted in nested and
+    are not checked against this budget.
+    """
+
+    def __init__(self, name, budget=None, parent=None, isolated=False):
+        self.name = name
+        self.budget = budget or QueryBudget()
+        self.parent = parent
+        self.isolated = isolated
+        self.statements = Counter()
+        self.nested = 0
+        self._lock = threading.Lock()
+
+    def add(self, sql):
+        # Запросы run_queries приходят из нескольких потоков
+        with self._lock:
+            self.statements[sql] += 1
+
+    def add_nested(self):
+        with self._lock:
+            self.nested += 1
+
+    @property
+    def own_count(self):
+        return sum(self.statements.values())
+
+    @property
+    def count(self):
+        return self.own_count + self.nested
+
+    def shapes(self):
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[fingerprint(sql)] += count
+        return shapes
+
+    def violations(self):
+        problems = []
+        count, limit = self.own_count, self.budget.queries
+        if limit is not None and count > limit:
+            problems.append(f'{count} queries, budget {limit}')
+
+        repeats = self.budget.max_repeats
+        if repeats is not None:
+            for shape, times in self.shapes().most_common():
+                if times <= repeats:
+                    break
+                problems.append(f'N+1: {times} x {shape[:300]}')
+        return problems
+
+    def check(self, strict=None):
+        problems = self.violations()
+        if not problems:
+            return
+        message = f'Query budget of {self.name} exceeded: ' + '; '.join(problems)
+        if settings.QUERY_BUDGET_STRICT if strict is None else strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def _record(execute, sql, params, many, context):
+    log = _current_log.get()
+    # Вложенные журналы (задача, выполненная внутри запроса) считаются и в родителе,
+    # запросы изолированного журнала родитель только подсчитывает
+    isolated = False
+    while log is not None:
+        if isolated:
+            log.add_nested()
+        else:
+            log.add(sql)
+        isolated = isolated or log.isolated
+        log = log.parent
+    return execute(sql, params, many, context)
+
+
+def install_counter(sender=None, connection=None, **kwargs):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record)
+
+
+# Новые соединения, включая соединения потоков run_queries
+connection_created.connect(install_counter)
+
+
+@contextmanager
+def track_queries(name, budget=None, strict=None, isolated=False):
+    """
+    Counts the SQL statements run in the block, also by run_queries
+    workers, and checks them against budget when the block succeeds.
+    Over budget raises QueryBudgetExceeded if strict (QUERY_BUDGET_STRICT
+    by default) and logs a warning otherwise. Yields the QueryLog.
+
+    The statements of an isolated block only count towards the total of
+    the enclosing blocks, not towards their budgets.
+    """
+    for connection in connections.all(initialized_only=True):
+        install_counter(connection=connection)
+
+    log = QueryLog(name, budget, _current_log.get(), isolated)
+    token = _current_log.set(log)
+    try:
+        yield log
+    finally:
+        _current_log.reset(token)
+    log.check(strict)
+
+
+def query_batch(name, queries=None, repeats=DEFAULT):
+    """
+    Budget of one chunk of a batch job: the chunk is checked on its own
+    and its queries do not count towards the budget of the job.
+    """
+    return track_queries(name, QueryBudget(queries, repeats), isolated=True)
+
+
+def assert_query_budget(queries=None, repeats=DEFAULT):
+    """Test helper: fails the test if the block exceeds the budget"""
+    return track_queries('block', QueryBudget(queries, repeats), strict=True)
+
+
+def view_budget(view_func, method):
+    """
+    Budget of the handler method of a class-based view, of the class,
+    or of the view function, whichever is declared first.
+    """
+    view_class = getattr(view_func, 'view_class', None)
+    if view_class is not None:
+        # Действия ViewSet (list, retrieve) сопоставлены методам HTTP
+        actions = getattr(view_func, 'actions', None) or {}
+        method = method.lower()
+        handler = getattr(view_class, actions.get(method, method), None)
+        budget = getattr(handler, 'query_budget', None)
+        if budget is None:
+            budget = getattr(view_class, 'query_budget', None)
+        if budget is not None:
+            return budget
+    return getattr(view_func, 'query_budget', None)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries of every request and checks them against the
+    @query_budget of the view; views without one are checked for N+1.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track_queries(request.path) as log:
+            request.query_log = log
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        log = getattr(request, 'query_log', None)
+        if log is None:
+            return None
+        if request.resolver_match is not None:
+            log.name = request.resolver_match.view_name
+        budget = view_budget(view_func, request.method)
+        if budget is not None:
+            log.budget = budget
+        return None
@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def _sticky_key(user_id):
+    return f'replica_sticky_{user_id}'
+
+
+def stick_to_primary(user_id):
+    """Sends reads of the user to the primary until the replica catches up"""
+    cache.set(_sticky_key(user_id), time.time(), settings.REPLICA_STICKY_SECONDS)
+
+
+def replica_alias(user_id=None):
+    """
+    Alias of the replica for reads of the user, or None if no replica is
+    configured or the user wrote within REPLICA_STICKY_SECONDS.
+    """
+    alias = settings.DATABASE_REPLICA_ALIAS
+    if not alias or alias not in connections.settings:
+        return None
+    if user_id is not None and cache.get(_sticky_key(user_id)) is not None:
+        return None
+    return alias
+
+
+def read_alias():
+    """Database for raw SQL reads in the current scope"""
+    return _read_alias.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def read_from_replica(user_id=None):
+    token = _read_alias.set(replica_alias(user_id))
+    try:
+        yield read_alias()
+    finally:
+        _read_alias.reset(token)
+
+
+def replica_reads(view):
+    """Runs GET and HEAD requests of the view against the replica"""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        user_id = request.user.id if request.user.is_authenticated else None
+        with read_from_replica(user_id):
+            return view(request, *args, **kwargs)
+
+    return inner
+
+
+class ReplicaRouter:
+    """
+    Reads inside read_from_replica() go to the replica, everything else
+    (writes, reads of the write path, select_for_update) to default.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        return True
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import sys
 from datetime import timedelta
 from pathlib import Path
 from decouple import config
@@ -27,6 +28,8 @@ SECRET_KEY = config('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', cast=bool)
 
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ["*"]
 
 
@@ -63,6 +66,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'PAGE_SIZE': 50,
@@ -75,6 +82,7 @@ SIMPLE_JWT = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'financemanager.querycount.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -123,6 +131,42 @@ else:
         }
     }
 
+# Реплика для аналитических чтений, см. financemanager/routers.py.
+# Без REPLICA_DATABASE_URL все запросы идут в default; тесты запускаются без реплики.
+DATABASE_REPLICA_ALIAS = config('DATABASE_REPLICA_ALIAS', default='replica')
+
+if config('REPLICA_DATABASE_URL', default=None):
+    import dj_database_url
+    DATABASES[DATABASE_REPLICA_ALIAS] = dj_database_url.parse(config('REPLICA_DATABASE_URL'))
+    DATABASES[DATABASE_REPLICA_ALIAS]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['financemanager.routers.ReplicaRouter']
+
+# После записи пользователь читает из основной базы, пока реплика догоняет
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# Потоки для независимых запросов дашборда и статистики (utils.concurrency.run_queries).
+# Каждый поток держит свое соединение, пул базы должен это учитывать.
+# Представления остаются синхронными: приложение обслуживается WSGI, а параллельность
+# запросов одного представления дают эти потоки, а не async-представления.
+CONCURRENT_QUERY_WORKERS = config('CONCURRENT_QUERY_WORKERS', default=4, cast=int)
+
+# Сколько секунд поток run_queries держит соединение между вызовами, независимо от
+# CONN_MAX_AGE запросов. В тестах соединения закрываются, иначе тестовую базу не удалить.
+QUERY_WORKER_CONN_MAX_AGE = config(
+    'QUERY_WORKER_CONN_MAX_AGE', default=0 if TESTING else 600, cast=int
+)
+
+# Бюджеты запросов представлений и задач (financemanager/querycount.py):
+# в тестах превышение роняет тест, в продакшене пишется предупреждение в лог
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=TESTING, cast=bool)
+
+# Сколько раз один и тот же по форме запрос может выполниться до признания N+1
+QUERY_REPEAT_LIMIT = config('QUERY_REPEAT_LIMIT', default=5, cast=int)
+
+# INCLUDE-столбцы покрывающих индексов есть только в PostgreSQL, SQLite их пропускает
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -190,9 +234,16 @@ CELERY_BEAT_SCHEDULE = {
     'process-recurring-transactions': {
         'task': 'transaction.tasks.process_recurring_transaction',
         'schedule': crontab(minute='0', hour='0')
+    },
+    'rebuild-dashboard-snapshots': {
+        'task': 'dashboard.tasks.rebuild_dashboard_snapshots',
+        'schedule': crontab(minute='5', hour='0')
     }
 }
 
+# Количество повторяющихся транзакций в одной задаче-шарде
+RECURRING_SHARD_SIZE = config('RECURRING_SHARD_SIZE', default=2000, cast=int)
+
 # EMAIL
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = config('EMAIL_HOST')
@@ -46,21 +46,21 @@ CREATE INDEX IF NOT EXISTS transaction_budget_history_changed_at_idx
 
 
 
--- Отчет по доходам и расходам по месяцам
+-- Отчет по доходам и расходам по месяцам (по месячным итогам)
 CREATE OR REPLACE VIEW v_monthly_income_expense_report AS
 SELECT 
     u.id AS user_id,
     u.email,
-    DATE_TRUNC('month', t.date) AS month,
-    COALESCE(SUM(CASE WHEN t.type = 'INCOME' THEN t.amount ELSE 0 END), 0) AS total_income,
-    COALESCE(SUM(CASE WHEN t.type = 'OUTCOME' THEN t.amount ELSE 0 END), 0) AS total_expense,
-    COALESCE(SUM(CASE WHEN t.type = 'INCOME' THEN t.amount ELSE 0 END), 0) - 
-    COALESCE(SUM(CASE WHEN t.type = 'OUTCOME' THEN t.amount ELSE 0 END), 0) AS net_amount,
-    COUNT(CASE WHEN t.type = 'INCOME' THEN 1 END) AS income_count,
-    COUNT(CASE WHEN t.type = 'OUTCOME' THEN 1 END) AS expense_count
+    r.month::timestamp AS month,
+    COALESCE(SUM(CASE WHEN r.type = 'INCOME' THEN r.total ELSE 0 END), 0) AS total_income,
+    COALESCE(SUM(CASE WHEN r.type = 'OUTCOME' THEN r.total ELSE 0 END), 0) AS total_expense,
+    COALESCE(SUM(CASE WHEN r.type = 'INCOME' THEN r.total ELSE 0 END), 0) - 
+    COALESCE(SUM(CASE WHEN r.type = 'OUTCOME' THEN r.total ELSE 0 END), 0) AS net_amount,
+    COALESCE(SUM(CASE WHEN r.type = 'INCOME' THEN r.count END), 0) AS income_count,
+    COALESCE(SUM(CASE WHEN r.type = 'OUTCOME' THEN r.count END), 0) AS expense_count
 FROM authapp_usermodel u
-LEFT JOIN transaction_transaction t ON u.id = t.user_id
-GROUP BY u.id, u.email, DATE_TRUNC('month', t.date)
+LEFT JOIN transaction_monthlycategoryrollup r ON u.id = r.user_id AND r.count > 0
+GROUP BY u.id, u.email, r.month
 ORDER BY u.id, month DESC;
 
 
@@ -145,6 +145,65 @@ GROUP BY b.id, b.name, b.period_type, b.start_date, b.end_date,
 ORDER BY b.start_date DESC;
 
 
+-- Сдвиг дневных снимков остатка счета начиная с даты транзакции
+CREATE OR REPLACE FUNCTION fn_apply_balance_snapshot_delta(
+    p_account_id INTEGER,
+    p_date DATE,
+    p_delta NUMERIC(16, 2)
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO transaction_accountbalancesnapshot (account_id, date, balance)
+    SELECT a.id, p_date, COALESCE(
+        (SELECT s.balance
+         FROM transaction_accountbalancesnapshot s
+         WHERE s.account_id = a.id AND s.date < p_date
+         ORDER BY s.date DESC
+         LIMIT 1),
+        a.initial_balance
+    )
+    FROM transaction_account a
+    WHERE a.id = p_account_id
+    ON CONFLICT (account_id, date) DO NOTHING;
+    
+    UPDATE transaction_accountbalancesnapshot
+    SET balance = balance + p_delta
+    WHERE account_id = p_account_id AND date >= p_date;
+END;
+$$;
+
+
+-- Обновление месячных итогов по категориям
+CREATE OR REPLACE FUNCTION fn_apply_monthly_rollup_delta(
+    p_user_id INTEGER,
+    p_category_id INTEGER,
+    p_type VARCHAR(20),
+    p_date DATE,
+    p_amount NUMERIC(16, 2),
+    p_count INTEGER
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_category_id IS NOT NULL THEN
+        INSERT INTO transaction_monthlycategoryrollup (user_id, month, category_id, type, total, count)
+        VALUES (p_user_id, date_trunc('month', p_date)::date, p_category_id, p_type, p_amount, p_count)
+        ON CONFLICT (user_id, month, category_id, type) WHERE category_id IS NOT NULL
+        DO UPDATE SET total = transaction_monthlycategoryrollup.total + EXCLUDED.total,
+                      count = transaction_monthlycategoryrollup.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO transaction_monthlycategoryrollup (user_id, month, category_id, type, total, count)
+        VALUES (p_user_id, date_trunc('month', p_date)::date, NULL, p_type, p_amount, p_count)
+        ON CONFLICT (user_id, month, type) WHERE category_id IS NULL
+        DO UPDATE SET total = transaction_monthlycategoryrollup.total + EXCLUDED.total,
+                      count = transaction_monthlycategoryrollup.count + EXCLUDED.count;
+    END IF;
+END;
+$$;
+
 -- Создание транзакции с автоматическим обновлением баланса счета
 CREATE OR REPLACE PROCEDURE sp_create_transaction_with_balance_update(
     p_user_id INTEGER,
@@ -181,6 +240,8 @@ BEGIN
         p_user_id, p_account_id, p_category_id, p_type, p_amount, p_date, p_description
     ) RETURNING id INTO p_transaction_id;
     
+    PERFORM fn_apply_monthly_rollup_delta(p_user_id, p_category_id, p_type, p_date, p_amount, 1);
+    
     IF p_account_id IS NOT NULL THEN
         IF p_type = 'INCOME' THEN
             UPDATE transaction_account
@@ -193,6 +254,12 @@ BEGIN
                 updated_at = CURRENT_TIMESTAMP
             WHERE id = p_account_id;
         END IF;
+        
+        PERFORM fn_apply_balance_snapshot_delta(
+            p_account_id,
+            p_date,
+            CASE WHEN p_type = 'INCOME' THEN p_amount ELSE -p_amount END
+        );
     END IF;
     
     COMMIT;
@@ -226,7 +293,7 @@ BEGIN
 END;
 $$;
 
--- Расчет баланса счета на определенную дату
+-- Расчет баланса счета на определенную дату (по дневным снимкам остатка)
 CREATE OR REPLACE FUNCTION fn_get_account_balance_on_date(
     p_account_id INTEGER,
     p_date DATE DEFAULT CURRENT_DATE
@@ -238,8 +305,6 @@ AS $$
 DECLARE
     v_balance NUMERIC(16, 2);
     v_initial_balance NUMERIC(16, 2);
-    v_income NUMERIC(16, 2);
-    v_expense NUMERIC(16, 2);
 BEGIN
     SELECT initial_balance INTO v_initial_balance
     FROM transaction_account
@@ -249,19 +314,16 @@ BEGIN
         RAISE EXCEPTION 'Account not found: %', p_account_id;
     END IF;
     
-    SELECT COALESCE(SUM(amount), 0) INTO v_income
-    FROM transaction_transaction
+    SELECT balance INTO v_balance
+    FROM transaction_accountbalancesnapshot
     WHERE account_id = p_account_id
-        AND type = 'INCOME'
-        AND date <= p_date;
+        AND date <= p_date
+    ORDER BY date DESC
+    LIMIT 1;
     
-    SELECT COALESCE(SUM(amount), 0) INTO v_expense
-    FROM transaction_transaction
-    WHERE account_id = p_account_id
-        AND type = 'OUTCOME'
-        AND date <= p_date;
-    
-    v_balance := v_initial_balance + v_income - v_expense;
+    IF NOT FOUND THEN
+        v_balance := v_initial_balance;
+    END IF;
     
     RETURN v_balance;
 END;
@@ -455,6 +517,8 @@ GRANT SELECT, INSERT, UPDATE, DELETE ON transaction_recurringtransaction TO oper
 GRANT SELECT ON authapp_usermodel TO operator_role;
 GRANT SELECT ON authapp_currency TO operator_role;
 GRANT SELECT ON transaction_account_history TO operator_role;
+GRANT SELECT, INSERT, UPDATE, DELETE ON transaction_accountbalancesnapshot TO operator_role;
+GRANT SELECT, INSERT, UPDATE, DELETE ON transaction_monthlycategoryrollup TO operator_role;
 GRANT SELECT ON transaction_budget_history TO operator_role;
 
 GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA public TO operator_role;
@@ -465,12 +529,16 @@ GRANT SELECT ON v_account_balance_report TO operator_role;
 GRANT SELECT ON v_budget_execution_report TO operator_role;
 
 GRANT EXECUTE ON FUNCTION fn_get_account_balance_on_date TO operator_role;
+GRANT EXECUTE ON FUNCTION fn_apply_balance_snapshot_delta TO operator_role;
+GRANT EXECUTE ON FUNCTION fn_apply_monthly_rollup_delta TO operator_role;
 GRANT EXECUTE ON FUNCTION fn_check_budget_limits TO operator_role;
 GRANT EXECUTE ON PROCEDURE sp_create_transaction_with_balance_update TO operator_role;
 GRANT EXECUTE ON PROCEDURE sp_close_budget TO operator_role;
 
 GRANT SELECT ON transaction_transaction TO client_role;
 GRANT SELECT ON transaction_account TO client_role;
+GRANT SELECT ON transaction_accountbalancesnapshot TO client_role;
+GRANT SELECT ON transaction_monthlycategoryrollup TO client_role;
 GRANT SELECT ON transaction_category TO client_role;
 GRANT SELECT ON transaction_budget TO client_role;
 GRANT SELECT ON transaction_budgetcategorylimit TO client_role;
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import time
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+from financemanager.routers import read_from_replica
+
+logger = logging.getLogger(__name__)
+
+
+# Меняется при изменении формата закешированных данных
+STATS_CACHE_VERSION = 2
+
+# До SOFT_TTL данные свежие, до HARD_TTL отдаются устаревшие данные,
+# пока фоновая задача считает новые
+SOFT_TTL = 45
+
+HARD_TTL = 15 * 60
+
+LOCK_TIMEOUT = 30
+
+LOCK_WAIT = 5
+
+
+def _generation_key(user_id):
+    return f'stats_gen_{user_id}'
+
+
+def get_generation(user_id):
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Начальное значение по времени, чтобы после вытеснения счетчика
+        # не совпасть с ключами предыдущих поколений
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def _modified_key(user_id):
+    return f'stats_modified_{user_id}'
+
+
+def get_last_modified(user_id):
+    """Unix time of the user's last write, seeded with now if unknown"""
+    key = _modified_key(user_id)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time.time(), None)
+        modified = cache.get(key)
+    return modified
+
+
+def bump_generation(user_id):
+    """Invalidates all cached payloads of the user with one atomic INCR"""
+    # Время записывается до смены поколения: новое поколение не увидят со старым временем
+    cache.set(_modified_key(user_id), time.time(), None)
+    key = _generation_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_generation(user_id)
+
+
+def params_digest(params, localized=True):
+    """
+    Stable digest of request params: keys and values are sorted, empty
+    values dropped. The active language is included for localized
+    payloads, which contain translated labels.
+    """
+    canonical = sorted(
+        (key, sorted(value for value in params.getlist(key) if value))
+        for key in params
+    )
+    canonical = [[key, values] for key, values in canonical if values]
+    language = get_language() if localized else None
+    payload = json.dumps([language, canonical], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def builder_path(builder):
+    return f'{builder.__module__}.{builder.__qualname__}'
+
+
+def language_neutral(builder):
+    """
+    Marks a builder whose payload keeps labels lazy, translated when
+    rendered: one cached payload then serves every language.
+    """
+    builder.localized = False
+    return builder
+
+
+def payload_key(builder, user_id, params):
+    digest = params_digest(params, getattr(builder, 'localized', True))
+    return f'payload:v{STATS_CACHE_VERSION}:{builder_path(builder)}:{user_id}:{digest}'
+
+
+def current_payload(builder, user_id, params):
+    """Cache entry of the payload if it was built for the current generation"""
+    entry = cache.get(payload_key(builder, user_id, params))
+    if entry is not None and entry['generation'] == get_generation(user_id):
+        return entry
+    return None
+
+
+def compute_payload(builder, user_id, params, timeout=HARD_TTL):
+    """Builds the payload and stores it with the generation it was built for"""
+    # Поколение читаем до расчета: запись во время расчета сделает результат устаревшим
+    generation = get_generation(user_id)
+    with read_from_replica(user_id):
+        data = builder(user_id, params)
+    cache.set(
+        payload_key(builder, user_id, params),
+        {'data': data, 'generation': generation, 'computed_at': time.time()},
+        timeout,
+    )
+    return data
+
+
+def schedule_refresh(builder, user_id, params):
+    """Queues one background recompute per key and soft TTL window"""
+    from .tasks import refresh_payload
+
+    key = payload_key(builder, user_id, params)
+    if not cache.add(f'{key}:refresh', 1, SOFT_TTL):
+        return
+    try:
+        refresh_payload.apply_async(
+            (builder_path(builder), user_id, params.urlencode(), get_language()),
+            retry=False,
+        )
+    except Exception as e:
+        cache.delete(f'{key}:refresh')
+        logger.warning(f"Не удалось поставить пересчет {key} в очередь: {e}")
+
+
+def get_payload(builder, user_id, params, wait=LOCK_WAIT, soft_ttl=SOFT_TTL, timeout=HARD_TTL):
+    """
+    Returns builder(user_id, params) from cache with stale-while-revalidate.
+
+    - entry of the current generation younger than soft_ttl: served as is;
+    - older than soft_ttl: served immediately, recomputed by a Celery task;
+    - missing, older than timeout or built before the user's last write:
+      computed synchronously, so a write is visible on the next request.
+
+    With soft_ttl=None entries are only replaced by writes and expiry.
+
+    A cold key is computed by one worker only, the others wait up to
+    wait seconds for its result before computing it themselves.
+    """
+    key = payload_key(builder, user_id, params)
+    generation = get_generation(user_id)
+
+    def current():
+        entry = cache.get(key)
+        if entry is not None and entry['generation'] == generation:
+            return entry
+        return None
+
+    entry = current()
+    if entry is not None:
+        if soft_ttl is not None and time.time() - entry['computed_at'] > soft_ttl:
+            schedule_refresh(builder, user_id, params)
+        return entry['data']
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return compute_payload(builder, user_id, params, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = current()
+        if entry is not None:
+            return entry['data']
+    return builder(user_id, params)
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.utils.cache import patch_cache_control
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+
+from .cache import get_generation, get_last_modified
+
+
+def user_data_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    user_id = request.user.id
+    return f'{user_id}-{get_generation(user_id)}-{get_language()}'
+
+
+def user_data_last_modified(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return datetime.fromtimestamp(get_last_modified(request.user.id), tz=timezone.utc)
+
+
+def user_data_condition(view):
+    """
+    Conditional GET by the user's data version: ETag and Last-Modified
+    come from the cache, so an unchanged response is answered with 304
+    before the view runs any query.
+
+    Clients must revalidate every time (Cache-Control: private, no-cache),
+    otherwise browsers would reuse responses by Last-Modified heuristics.
+    """
+    conditional_view = condition(
+        etag_func=user_data_etag, last_modified_func=user_data_last_modified
+    )(view)
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        response = conditional_view(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return inner
@@ -0,0 +1,48 @@
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from transaction.ledger import ledger_changed
+from transaction.models import Account, Budget, BudgetCategoryLimit, Category
+
+from financemanager.routers import stick_to_primary
+
+from .cache import bump_generation
+
+
+def user_data_changed(user_id):
+    """
+    Invalidates the user's payloads and pins reads to the primary once the
+    current transaction commits. A bump before the commit would let a
+    concurrent read cache the old rows under the new generation.
+    """
+    def invalidate():
+        bump_generation(user_id)
+        stick_to_primary(user_id)
+
+    db_transaction.on_commit(invalidate)
+
+
+@receiver(ledger_changed)
+def invalidate_stats_cache(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        user_data_changed(user_id)
+
+
+@receiver([post_save, post_delete], sender=Account)
+@receiver([post_save, post_delete], sender=Budget)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_user_payloads(sender, instance, **kwargs):
+    # Системные категории общие для всех, их изменения ждут истечения SOFT_TTL
+    if instance.user_id:
+        user_data_changed(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=BudgetCategoryLimit)
+def invalidate_budget_payloads(sender, instance, origin=None, **kwargs):
+    # Каскад от удаления бюджета уже обработан сигналом Budget
+    if isinstance(origin, Budget):
+        return
+    # Формсет лимитов передает загруженный бюджет, запроса нет
+    if instance.budget.user_id:
+        user_data_changed(instance.budget.user_id)
@@ -0,0 +1,22 @@
+import logging
+
+from celery import shared_task
+from django.http import QueryDict
+from django.utils import translation
+from django.utils.module_loading import import_string
+
+from .cache import compute_payload
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_payload(builder, user_id, query_string, language):
+    """Recomputes a cached payload served stale by get_payload()"""
+    try:
+        with translation.override(language):
+            compute_payload(import_string(builder), user_id, QueryDict(query_string))
+    except Exception as e:
+        logger.error(f"Ошибка пересчета {builder} для пользователя {user_id}: {e}")
+        return f"Ошибка: {e}"
+    return f"Пересчитано: {builder} для пользователя {user_id}"
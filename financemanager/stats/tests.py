@@ -1,3 +1,396 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import date
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction as db_transaction
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from financemanager.routers import read_alias, read_from_replica, replica_reads
+from transaction.filters import TransactionFilter
+from transaction.forms import BudgetCategoryLimitFormSet
+from transaction.models import (
+    Account, Budget, BudgetCategoryLimit, Category, MonthlyCategoryRollup, Transaction, Type
+)
+from stats import cache as stats_cache
+from stats.cache import compute_payload, get_payload, params_digest, payload_key
+from stats.tasks import refresh_payload
+from utils.diagram_data import (
+    aggregate_period, expense_frequency_data, get_data_for_heatmap, period_stats
+)
+
+User = get_user_model()
+
+
+class PeriodAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.food = Category.objects.create(name='Food', user=self.user, type=Type.OUTCOME)
+        self.dining = Category.objects.create(name='food_dining', is_system=True, type=Type.OUTCOME)
+        for day, type, category, amount in [
+            (1, Type.OUTCOME, self.food, '10.00'),
+            (1, Type.OUTCOME, None, '2.50'),
+            (1, Type.INCOME, None, '100.00'),
+            (3, Type.OUTCOME, self.food, '5.00'),
+            (2, Type.INCOME, None, '1.00'),
+            (2, Type.OUTCOME, self.dining, '4.00'),
+        ]:
+            Transaction.objects.create(
+                user=self.user, type=type, category=category,
+                amount=Decimal(amount), date=date(2025, 1, day)
+            )
+        self.qs = Transaction.objects.filter(user=self.user)
+
+    def test_single_query(self):
+        # Переводы категорий не добавляют запросов
+        with self.assertNumQueries(1):
+            aggregate = aggregate_period(self.qs)
+            period_stats(self.qs, aggregate)
+            expense_frequency_data(self.qs, aggregate)
+
+    def test_period_stats(self):
+        data = period_stats(self.qs)
+        self.assertEqual(data['total_income'], Decimal('101.00'))
+        self.assertEqual(data['total_expense'], Decimal('21.50'))
+        self.assertEqual(data['labels'], ['2025-01-01', '2025-01-02', '2025-01-03'])
+        self.assertEqual(data['income_data'], [100.0, 1.0, 0])
+        self.assertEqual(data['expense_data'], [12.5, 4.0, 5.0])
+        self.assertEqual(data['expense_categories'], [
+            {'category__name': 'Other', 'total': Decimal('2.50')},
+            {'category__name': 'Food', 'total': Decimal('15.00')},
+            {'category__name': 'Food & Dining', 'total': Decimal('4.00')},
+        ])
+
+    def test_expense_frequency(self):
+        data = expense_frequency_data(self.qs)
+        self.assertEqual(
+            data['expense_frequency_categories'], ['Other', 'Food', 'Food & Dining']
+        )
+        self.assertEqual(data['expense_frequency_values'], [1, 2, 1])
+
+    def test_rollups_match_raw_rows(self):
+        for day, amount in [(date(2024, 12, 10), '7.00'), (date(2025, 2, 10), '3.00')]:
+            Transaction.objects.create(
+                user=self.user, type=Type.OUTCOME, category=self.food,
+                amount=Decimal(amount), date=day
+            )
+        transaction_filter = TransactionFilter(
+            QueryDict('date_from=2024-12-15&date_to=2025-02-20'), queryset=self.qs
+        )
+        scope = transaction_filter.rollup_scope(self.user.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            aggregate = aggregate_period(transaction_filter.qs, scope)
+        self.assertEqual(aggregate, aggregate_period(transaction_filter.qs))
+        self.assertTrue(any(
+            MonthlyCategoryRollup._meta.db_table in query['sql']
+            for query in queries.captured_queries
+        ))
+
+        account = Account.objects.create(name='Main', account_type='BANK', user=self.user)
+        transaction_filter = TransactionFilter(
+            QueryDict(f'account={account.id}'), queryset=self.qs, user=self.user
+        )
+        self.assertIsNone(transaction_filter.rollup_scope(self.user.id))
+
+    def test_empty_period(self):
+        data = period_stats(Transaction.objects.none())
+        self.assertEqual((data['total_income'], data['total_expense'], data['labels']), (0, 0, []))
+
+    def test_heatmap(self):
+        with self.assertNumQueries(1):
+            data = get_data_for_heatmap(self.qs)
+        self.assertEqual(data['weeks_names_for_heatmap'], ['6Jan-12Jan'])
+        self.assertEqual(data['heatmap'], [
+            {'x': 'Wednesday', 'y': '6Jan-12Jan', 'heat': 12.5},
+            {'x': 'Thursday', 'y': '6Jan-12Jan', 'heat': 4.0},
+            {'x': 'Friday', 'y': '6Jan-12Jan', 'heat': 5.0},
+        ])
+
+    def test_system_labels(self):
+        with self.assertNumQueries(1):
+            labels = Category.system_labels(['food_dining', 'Food', 'salary'])
+        self.assertEqual(
+            labels, {'food_dining': 'Food & Dining', 'Food': 'Food', 'salary': 'salary'}
+        )
+
+
+def count_payload(user_id, params):
+    return {'total': Transaction.objects.filter(user_id=user_id).count()}
+
+
+class StatsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Зафиксированные записи ставят пересборку снимка дашборда в очередь
+        patcher = mock.patch('dashboard.tasks.rebuild_dashboard_snapshot.apply_async')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+
+    def test_params_digest_is_canonical(self):
+        self.assertEqual(
+            params_digest(QueryDict('type=OUTCOME&date_from=2025-01-01&category=')),
+            params_digest(QueryDict('date_from=2025-01-01&type=OUTCOME')),
+        )
+        self.assertNotEqual(
+            params_digest(QueryDict('type=OUTCOME')), params_digest(QueryDict('type=INCOME'))
+        )
+
+    def test_payload_key_is_stable(self):
+        params = QueryDict('type=OUTCOME')
+        key = payload_key(count_payload, self.user.id, params)
+        Transaction.objects.create(user=self.user, type=Type.OUTCOME, amount=1)
+        # Запись меняет поколение внутри записи кеша, а не ключ
+        self.assertEqual(key, payload_key(count_payload, self.user.id, params))
+
+    def test_write_invalidates_payload(self):
+        params = QueryDict('')
+        self.assertEqual(get_payload(count_payload, self.user.id, params), {'total': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(user=self.user, type=Type.OUTCOME, amount=1)
+        self.assertEqual(get_payload(count_payload, self.user.id, params), {'total': 1})
+
+    def test_stale_payload_is_served_and_refreshed(self):
+        params = QueryDict('')
+        compute_payload(count_payload, self.user.id, params)
+        key = payload_key(count_payload, self.user.id, params)
+        entry = cache.get(key)
+        entry['data'] = {'total': 'stale'}
+        entry['computed_at'] -= stats_cache.SOFT_TTL + 1
+        cache.set(key, entry)
+
+        with mock.patch('stats.tasks.refresh_payload.apply_async') as apply_async:
+            self.assertEqual(get_payload(count_payload, self.user.id, params), {'total': 'stale'})
+            # Повторный запрос в том же окне не ставит вторую задачу
+            get_payload(count_payload, self.user.id, params)
+        apply_async.assert_called_once()
+
+        refresh_args = apply_async.call_args.args[0]
+        refresh_payload(*refresh_args)
+        self.assertEqual(get_payload(count_payload, self.user.id, params), {'total': 0})
+
+    def test_waits_for_concurrent_computation(self):
+        def builder(user_id, params):
+            raise AssertionError('computed twice')
+
+        params = QueryDict('')
+        key = payload_key(builder, self.user.id, params)
+        cache.add(f'{key}:lock', 1)
+        entry = {
+            'data': {'total': 1},
+            'generation': stats_cache.get_generation(self.user.id),
+            'computed_at': time.time(),
+        }
+        timer = threading.Timer(0.1, cache.set, args=(key, entry))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        self.assertEqual(get_payload(builder, self.user.id, params, wait=5), {'total': 1})
+
+    def test_limit_formset_invalidates_without_budget_lookups(self):
+        budget = Budget.objects.create(
+            user=self.user, name='Month', period_type='MONTHLY',
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 31),
+            total_expense_limit=Decimal('100.00'),
+        )
+        categories = [
+            Category.objects.create(name=f'Category {n}', user=self.user, type=Type.OUTCOME)
+            for n in range(3)
+        ]
+        data = {
+            'category_limits-TOTAL_FORMS': '3',
+            'category_limits-INITIAL_FORMS': '0',
+        }
+        for n, category in enumerate(categories):
+            data[f'category_limits-{n}-category'] = category.id
+            data[f'category_limits-{n}-limit_amount'] = '10.00'
+        formset = BudgetCategoryLimitFormSet(
+            data, instance=budget, prefix='category_limits', user=self.user
+        )
+        self.assertTrue(formset.is_valid())
+
+        generation = stats_cache.get_generation(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as ctx:
+            formset.save()
+        self.assertEqual(BudgetCategoryLimit.objects.filter(budget=budget).count(), 3)
+        self.assertFalse(any('FROM "transaction_budget"' in q['sql'] for q in ctx.captured_queries))
+        self.assertGreater(stats_cache.get_generation(self.user.id), generation)
+
+    def test_stats_view_fresh_after_write(self):
+        self.client.force_login(self.user)
+        url = reverse('stats:stats')
+        self.assertEqual(self.client.get(url).context['total_expense'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(user=self.user, type=Type.OUTCOME, amount=Decimal('7.00'))
+        self.assertEqual(self.client.get(url).context['total_expense'], Decimal('7.00'))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Зафиксированные записи ставят пересборку снимка дашборда в очередь
+        patcher = mock.patch('dashboard.tasks.rebuild_dashboard_snapshot.apply_async')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.client.force_login(self.user)
+
+    def revalidate(self, url, response):
+        with CaptureQueriesContext(connection) as queries:
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        return revalidated, [q['sql'] for q in queries.captured_queries]
+
+    def test_unchanged_responses_are_not_modified(self):
+        for url in [
+            reverse('api-transactions-list'),
+            reverse('api-categories-list'),
+            reverse('transaction:trans-list-part'),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertTrue(response.has_header('Last-Modified'))
+
+                revalidated, queries = self.revalidate(url, response)
+                self.assertEqual(revalidated.status_code, 304)
+                # Только сессия и пользователь
+                self.assertFalse([sql for sql in queries if 'transaction_' in sql])
+
+    def test_writes_change_version(self):
+        url = reverse('api-transactions-list')
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(user=self.user, type=Type.OUTCOME, amount=Decimal('1.00'))
+        revalidated, _ = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertNotEqual(revalidated['ETag'], response['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Food', user=self.user, type=Type.OUTCOME)
+        self.assertEqual(self.revalidate(url, revalidated)[0].status_code, 200)
+
+    def test_if_modified_since(self):
+        url = reverse('api-categories-list')
+        response = self.client.get(url)
+        revalidated = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(revalidated.status_code, 304)
+
+
+@override_settings(DATABASE_REPLICA_ALIAS='replica')
+class ConcurrentConditionalGetTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('dashboard.tasks.rebuild_dashboard_snapshot.apply_async')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        # Токен вместо сессии: запрос из другого потока ничего не пишет
+        token = RefreshToken.for_user(self.user).access_token
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def get_from_other_connection(self, url, **headers):
+        responses = []
+
+        def get():
+            try:
+                responses.append(self.client.get(url, **headers))
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=get)
+        thread.start()
+        thread.join()
+        return responses[0]
+
+    def test_poll_during_write_keeps_old_version(self):
+        url = reverse('api-transactions-list')
+        response = self.client.get(url, **self.headers)
+
+        with db_transaction.atomic():
+            Transaction.objects.create(user=self.user, type=Type.OUTCOME, amount=Decimal('1.00'))
+            # Другое соединение еще не видит строку, новая версия отдала бы старое тело
+            polled = self.get_from_other_connection(
+                url, HTTP_IF_NONE_MATCH=response['ETag'], **self.headers
+            )
+            self.assertEqual(polled.status_code, 304)
+
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **self.headers)
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertEqual(len(revalidated.json()['results']), 1)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Зафиксированные записи ставят пересборку снимка дашборда в очередь
+        patcher = mock.patch('dashboard.tasks.rebuild_dashboard_snapshot.apply_async')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        cache.clear()
+        # Запросы к реплике не выполняются, маршрутизатору достаточно настроек
+        replica = {**connections.settings[DEFAULT_DB_ALIAS], 'TEST': {'MIRROR': DEFAULT_DB_ALIAS}}
+        patcher = mock.patch.dict(connections.settings, {'replica': replica})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replica_inside_scope(self):
+        queryset = Transaction.objects.filter(user=self.user)
+        self.assertEqual(queryset.db, DEFAULT_DB_ALIAS)
+        with read_from_replica(self.user.id):
+            self.assertEqual(queryset.db, 'replica')
+            self.assertEqual(read_alias(), 'replica')
+            # Записи всегда идут в основную базу
+            self.assertEqual(queryset.select_for_update().db, DEFAULT_DB_ALIAS)
+        self.assertEqual(read_alias(), DEFAULT_DB_ALIAS)
+
+    def test_write_sticks_user_to_primary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Account.objects.create(user=self.user, name='Card')
+        with read_from_replica(self.user.id):
+            self.assertEqual(Transaction.objects.all().db, DEFAULT_DB_ALIAS)
+
+        other = User.objects.create_user(password='testpass2', email='testuser2@example.com')
+        with read_from_replica(other.id):
+            self.assertEqual(Transaction.objects.all().db, 'replica')
+
+    @override_settings(DATABASE_REPLICA_ALIAS='missing')
+    def test_without_replica_reads_stay_on_default(self):
+        with read_from_replica(self.user.id):
+            self.assertEqual(Transaction.objects.all().db, DEFAULT_DB_ALIAS)
+
+    def test_view_uses_replica_for_safe_methods(self):
+        @replica_reads
+        def view(request):
+            return read_alias()
+
+        factory = RequestFactory()
+        for method, alias in [('get', 'replica'), ('post', DEFAULT_DB_ALIAS)]:
+            request = getattr(factory, method)('/')
+            request.user = self.user
+            self.assertEqual(view(request), alias)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Transaction, Category, RecurringTransaction, Account, Budget
+from .models import Transaction, Category, RecurringTransaction, Account, Budget, JobRun
 
 
 class TransactionAdmin(admin.ModelAdmin):
@@ -23,8 +23,14 @@ class BudgetAdmin(admin.ModelAdmin):
     pass
 
 
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'started_at', 'finished_at')
+    list_filter = ('name', 'status')
+
+
 admin.site.register(Transaction, TransactionAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(RecurringTransaction, RecurringTransactionAdmin)
 admin.site.register(Account, AccountAdmin)
 admin.site.register(Budget, BudgetAdmin)
+admin.site.register(JobRun, JobRunAdmin)
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+from django.db.models import F, Sum
+
+from .models import Budget, Type
+
+
+class BudgetProgress:
+    """Spent, income and per-category expenses of a budget period"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.spent = Decimal('0')
+        self.income = Decimal('0')
+        self.category_spent = {}
+
+    @property
+    def remaining(self):
+        if self.budget.total_expense_limit:
+            return self.budget.total_expense_limit - self.spent
+        return None
+
+    @property
+    def percentage(self):
+        limit = self.budget.total_expense_limit
+        return (self.spent / limit * 100) if limit and limit > 0 else 0
+
+    def category_progress(self, limits):
+        """Progress of BudgetCategoryLimit rows without extra queries"""
+        progress = []
+        for limit in limits:
+            spent = self.category_spent.get(limit.category_id, Decimal('0'))
+            percentage = (
+                (spent / limit.limit_amount * 100) if limit.limit_amount > 0 else 0
+            )
+            progress.append({
+                'limit': limit,
+                'spent': spent,
+                'remaining': limit.limit_amount - spent,
+                'percentage': min(percentage, 100),
+                'over_budget': spent > limit.limit_amount,
+            })
+        return progress
+
+
+def budget_progress(budgets):
+    """
+    Returns {budget_id: BudgetProgress} for budgets.
+
+    Transactions of all budgets are joined on (user, date range) and
+    grouped by (budget, type, category) in a single query.
+    """
+    progress = {budget.id: BudgetProgress(budget) for budget in budgets}
+    if not progress:
+        return progress
+
+    rows = Budget.objects.filter(
+        pk__in=progress,
+        user__transaction__date__gte=F('start_date'),
+        user__transaction__date__lte=F('end_date'),
+    ).values(
+        'id',
+        type=F('user__transaction__type'),
+        category_id=F('user__transaction__category_id'),
+    ).annotate(
+        total=Sum('user__transaction__amount')
+    ).order_by()
+
+    for row in rows:
+        item = progress[row['id']]
+        if row['type'] == Type.INCOME:
+            item.income += row['total']
+        elif row['type'] == Type.OUTCOME:
+            item.spent += row['total']
+            item.category_spent[row['category_id']] = (
+                item.category_spent.get(row['category_id'], Decimal('0')) + row['total']
+            )
+    return progress
@@ -0,0 +1,61 @@
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+
+from .models import translate_category_name
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+EXPORT_COLUMNS = ('id', 'date', 'type', 'amount', 'category', 'account', 'description')
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object that returns written value instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def _export_rows(qs):
+    rows = qs.order_by(*(qs.query.order_by or ('-date',)), '-id').values_list(
+        'id', 'date', 'type', 'amount',
+        'category__name', 'category__is_system',
+        'account__name', 'description',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    for id, date, type, amount, category, is_system, account, description in rows:
+        category = translate_category_name(category, is_system)
+        yield id, date.isoformat(), type, str(amount), category, account, description
+
+
+def _iter_csv(qs):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in _export_rows(qs):
+        yield writer.writerow(row)
+
+
+def _iter_jsonl(qs):
+    for row in _export_rows(qs):
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n'
+
+
+def export_response(qs, format='csv'):
+    """
+    Streams the queryset as CSV or JSON Lines.
+
+    Rows are read through a server-side cursor and a values_list
+    projection, so memory use does not depend on the number of rows.
+    """
+    content_type, extension = EXPORT_FORMATS[format]
+    rows = _iter_csv(qs) if format == 'csv' else _iter_jsonl(qs)
+    response = StreamingHttpResponse(rows, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="transactions.{extension}"'
+    return response
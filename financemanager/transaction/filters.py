@@ -1,15 +1,15 @@
 from django_filters import DateFilter, FilterSet, Filter, OrderingFilter, ModelChoiceFilter
 from django_filters.widgets import RangeWidget
 from django.forms import DateInput
-from django.db.models import Q
 
 from .models import Transaction, Account
+from .search import search_transactions
 
 
 class DescriptionFilter(Filter):
     def filter(self, qs, value):
         if value:
-            qs = qs.filter(Q(description__icontains=value))
+            qs = search_transactions(qs, value, rank=False)
         return qs
 
 
@@ -58,6 +58,35 @@ class TransactionFilter(FilterSet):
         if user:
             self.filters['account'].queryset = Account.objects.filter(user=user, is_active=True)
 
+    def rollup_scope(self, user_id):
+        """
+        Returns category_totals() arguments equivalent to this filter, or None
+        if the filter uses fields the monthly rollups do not have.
+        """
+        data = {}
+        if self.is_bound:
+            self.errors  # валидация формы, невалидные поля не попадают в cleaned_data
+            data = self.form.cleaned_data
+        if data.get('account') or data.get('description'):
+            return None
+
+        scope = {
+            'user_id': user_id,
+            'date_from': data.get('date_from'),
+            'date_to': data.get('date_to'),
+        }
+        if data.get('type'):
+            scope['type'] = data['type']
+
+        category = data.get('category')
+        if category and category != 'Nocategory':
+            if category == 'Other':
+                scope['category_id'] = None
+            elif str(category).isdigit():
+                scope['category_id'] = int(category)
+            else:
+                return None
+        return scope
 
     class Meta:
         model = Transaction
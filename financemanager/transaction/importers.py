@@ -0,0 +1,296 @@
+import csv
+import io
+import math
+import re
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from financemanager.querycount import query_batch
+
+from .ledger import LedgerEntry, balance_deltas, ledger_changed, monthly_rollup_deltas
+from .models import Account, Category, Transaction, Type
+from .rollups import apply_rollup_deltas
+from .snapshots import rebuild_snapshots
+
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Дельты блока без самой загрузки, не зависят от его размера
+IMPORT_CHUNK_QUERIES = 10
+
+COPY_COLUMNS = (
+    'user_id', 'account_id', 'category_id', 'type', 'amount', 'date', 'description'
+)
+
+_OFX_TAG_RE = re.compile(r'<(/?)([A-Za-z0-9_.]+)>([^<]*)')
+
+
+class StatementRowError(ValueError):
+    pass
+
+
+_AMOUNT_FIELD = Transaction._meta.get_field('amount')
+
+
+def parse_amount(value):
+    value = (value or '').strip().replace(' ', '').replace('\xa0', '')
+    if ',' in value and '.' not in value:
+        value = value.replace(',', '.')
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise StatementRowError(f'Invalid amount: {value!r}')
+
+
+def parse_date(value, date_format):
+    try:
+        return datetime.strptime((value or '').strip(), date_format).date()
+    except ValueError:
+        raise StatementRowError(f'Invalid date: {value!r}')
+
+
+def iter_csv_rows(fileobj, date_format='%Y-%m-%d', delimiter=','):
+    """
+    Yields dicts with date, amount, type, description and category keys.
+
+    Required columns: date, amount. Optional: type, description, category.
+    Without a type column the sign of amount defines the type.
+    """
+    reader = csv.DictReader(fileobj, delimiter=delimiter)
+    for line_no, row in enumerate(reader, start=2):
+        row = {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+        try:
+            amount = parse_amount(row.get('amount'))
+            type = row.get('type', '').upper()
+            if type not in Type.values:
+                type = Type.OUTCOME if amount < 0 else Type.INCOME
+            yield line_no, {
+                'date': parse_date(row.get('date'), date_format),
+                'amount': abs(amount),
+                'type': type,
+                'description': row.get('description') or None,
+                'category': row.get('category') or None,
+            }
+        except StatementRowError as e:
+            yield line_no, e
+
+
+def _iter_ofx_tags(fileobj, read_size=64 * 1024):
+    buffer = ''
+    while True:
+        data = fileobj.read(read_size)
+        buffer += data
+        # Оставляем в буфере последний незакрытый тег до следующего чтения
+        cut = buffer.rfind('<') if data else -1
+        if cut < 0:
+            cut = len(buffer)
+        for match in _OFX_TAG_RE.finditer(buffer, 0, cut):
+            closing, tag, value = match.groups()
+            yield closing, tag.upper(), value.strip()
+        buffer = buffer[cut:]
+        if not data:
+            break
+
+
+def iter_ofx_rows(fileobj):
+    """
+    Yields STMTTRN records of an OFX statement (both SGML and XML flavours)
+    without loading the whole file.
+    """
+    record = None
+    index = 0
+    for closing, tag, value in _iter_ofx_tags(fileobj):
+        if tag == 'STMTTRN':
+            if closing and record is not None:
+                index += 1
+                yield index, _ofx_record_to_row(record)
+                record = None
+            elif not closing:
+                record = {}
+        elif record is not None and not closing and value:
+            record[tag] = value
+
+
+def _ofx_record_to_row(record):
+    try:
+        amount = parse_amount(record.get('TRNAMT'))
+        description = ' '.join(
+            part for part in (record.get('NAME'), record.get('MEMO')) if part
+        )
+        return {
+            'date': parse_date(record.get('DTPOSTED', '')[:8], '%Y%m%d'),
+            'amount': abs(amount),
+            'type': Type.OUTCOME if amount < 0 else Type.INCOME,
+            'description': description[:255] or None,
+            'category': None,
+        }
+    except StatementRowError as e:
+        return e
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class StatementImporter:
+    """
+    Loads statement rows into an account in fixed-size chunks.
+
+    On PostgreSQL chunks are loaded with COPY, elsewhere with bulk_create
+    in batches that fit the database parameter limit. Every chunk is committed in its own transaction
+    together with one balance delta and the rollup deltas, so a large file
+    never holds a long transaction or the account lock, and is checked
+    against its own query budget. Balance snapshots are rebuilt once at
+    the end.
+
+    If the import fails, the chunks loaded so far stay committed and
+    imported tells how many rows they hold.
+    """
+
+    def __init__(self, account, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+        self.account = account
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+        self.elapsed = 0.0
+        self._categories = self._load_categories()
+
+    def _load_categories(self):
+        categories = {}
+        for category in Category.objects.filter(
+            Q(user=self.account.user_id) | Q(is_system=True)
+        ):
+            for name in {category.name, category.translated_name}:
+                categories.setdefault((name.lower(), category.type), category.id)
+        return categories
+
+    def _to_values(self, row):
+        try:
+            _AMOUNT_FIELD.run_validators(row['amount'])
+        except ValidationError as e:
+            # Одна строка вне max_digits оборвала бы вставку всего блока
+            raise StatementRowError(f'Invalid amount: {row["amount"]}: {" ".join(e.messages)}')
+
+        category_id = None
+        if row['category']:
+            category_id = self._categories.get((row['category'].lower(), row['type']))
+        return (
+            self.account.user_id,
+            self.account.id,
+            category_id,
+            row['type'],
+            row['amount'],
+            row['date'],
+            row['description'],
+        )
+
+    def _copy_chunk(self, values):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in values:
+            writer.writerow(['' if v is None else v for v in row])
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {Transaction._meta.db_table} ({", ".join(COPY_COLUMNS)}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+    @staticmethod
+    def _insert_batch_size(values):
+        fields = [Transaction._meta.get_field(column) for column in COPY_COLUMNS]
+        return connection.ops.bulk_batch_size(fields, values)
+
+    def _bulk_create_chunk(self, values):
+        Transaction.objects.bulk_create(
+            [Transaction(**dict(zip(COPY_COLUMNS, row))) for row in values],
+            batch_size=self._insert_batch_size(values),
+        )
+
+    def _chunk_budget(self, values):
+        """Query budget of a chunk: one COPY or one INSERT per bulk_create batch"""
+        loads = 1
+        if connection.vendor != 'postgresql':
+            loads = math.ceil(len(values) / self._insert_batch_size(values))
+        return IMPORT_CHUNK_QUERIES + loads, max(settings.QUERY_REPEAT_LIMIT, loads)
+
+    def _apply_chunk(self, values):
+        entries = [LedgerEntry(*row[:len(LedgerEntry._fields)]) for row in values]
+        apply_rollup_deltas(monthly_rollup_deltas(entries))
+        delta = balance_deltas(entries).get(self.account.id)
+        if delta:
+            Account.objects.filter(pk=self.account.pk).update(
+                balance=F('balance') + delta,
+                updated_at=timezone.now(),
+            )
+
+    def run(self, rows):
+        load_chunk = (
+            self._copy_chunk if connection.vendor == 'postgresql'
+            else self._bulk_create_chunk
+        )
+        started = time.monotonic()
+
+        try:
+            for chunk in _chunks(rows, self.chunk_size):
+                values = []
+                for position, row in chunk:
+                    if not isinstance(row, Exception):
+                        try:
+                            values.append(self._to_values(row))
+                            continue
+                        except StatementRowError as e:
+                            row = e
+                    self.skipped += 1
+                    if len(self.errors) < 100:
+                        self.errors.append(f'{position}: {row}')
+                if values:
+                    # Блок фиксируется вместе со своими дельтами, счет блокируется только на время блока
+                    queries, repeats = self._chunk_budget(values)
+                    with query_batch('import chunk', queries, repeats), db_transaction.atomic():
+                        load_chunk(values)
+                        self._apply_chunk(values)
+                    self.imported += len(values)
+
+                self.elapsed = time.monotonic() - started
+                if self.progress:
+                    self.progress(self)
+        finally:
+            # Снимки пересобираются и после сбоя: загруженные блоки уже зафиксированы
+            if self.imported:
+                with db_transaction.atomic():
+                    rebuild_snapshots(
+                        Account.objects.select_for_update().filter(pk=self.account.pk)
+                    )
+                ledger_changed.send(sender=Transaction, user_ids={self.account.user_id})
+
+        self.elapsed = time.monotonic() - started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+
+def open_statement(path, format=None, encoding='utf-8-sig', **options):
+    """Returns (file, rows iterator) for a CSV or OFX statement."""
+    format = (format or path.rsplit('.', 1)[-1]).lower()
+    if format not in ('csv', 'ofx', 'qfx'):
+        raise ValueError(f'Unsupported statement format: {format}')
+
+    fileobj = open(path, encoding=encoding, newline='' if format == 'csv' else None)
+    if format == 'csv':
+        return fileobj, iter_csv_rows(fileobj, **options)
+    return fileobj, iter_ofx_rows(fileobj)
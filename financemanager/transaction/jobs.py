@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import JobRun, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+LOCK_TIMEOUT = 60
+
+# Запуск, не завершившийся за это время, считается зависшим
+STALE_RUN_AFTER = timedelta(hours=6)
+
+
+def advisory_lock_key(name):
+    """Stable signed 64-bit key of a job name for pg_try_advisory_lock"""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+@contextmanager
+def job_lock(name, timeout=LOCK_TIMEOUT):
+    """
+    Non-blocking lock shared by all workers, yields True if it was taken.
+
+    Uses a PostgreSQL session advisory lock, on other databases falls
+    back to an atomic cache.add() on the Redis cache.
+    """
+    if connection.vendor == 'postgresql':
+        key = advisory_lock_key(name)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+        return
+
+    cache_key = f'job_lock_{name}'
+    token = uuid.uuid4().hex
+    acquired = cache.add(cache_key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(cache_key) == token:
+            cache.delete(cache_key)
+
+
+def start_run(name, stale_after=STALE_RUN_AFTER):
+    """
+    Records the start of a job run and returns it, or returns None if
+    another run of the job is in progress. Overlapping runs are recorded
+    as skipped.
+    """
+    with job_lock(name) as acquired:
+        running = acquired and JobRun.objects.filter(
+            name=name,
+            status=JobStatus.RUNNING,
+            started_at__gte=timezone.now() - stale_after,
+        ).exists()
+        if not acquired or running:
+            JobRun.objects.create(
+                name=name, status=JobStatus.SKIPPED, finished_at=timezone.now()
+            )
+            logger.info(f"Задача {name} уже выполняется, запуск пропущен")
+            return None
+        return JobRun.objects.create(name=name)
+
+
+def finish_run(run_id, status=JobStatus.SUCCESS, stats=None, error=''):
+    JobRun.objects.filter(pk=run_id, status=JobStatus.RUNNING).update(
+        status=status,
+        finished_at=timezone.now(),
+        stats=stats or {},
+        error=error,
+    )
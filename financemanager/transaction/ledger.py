@@ -0,0 +1,170 @@
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Account, Transaction, Type
+from .rollups import apply_rollup_deltas, month_start
+from .snapshots import apply_snapshot_deltas
+
+
+# Sent after ledger entries were applied, with the set of affected user ids.
+# Unlike post_save it also fires for bulk writes. It is sent inside the
+# writer's transaction, receivers that act outside the database (cache,
+# Celery) defer that work with on_commit.
+ledger_changed = Signal()
+
+
+LedgerEntry = namedtuple(
+    'LedgerEntry',
+    ['user_id', 'account_id', 'category_id', 'type', 'amount', 'date']
+)
+
+
+def entry_for(trans):
+    date = trans.date
+    if isinstance(date, datetime):
+        date = date.date()
+    return LedgerEntry(
+        user_id=trans.user_id,
+        account_id=trans.account_id,
+        category_id=trans.category_id,
+        type=trans.type,
+        amount=Decimal(trans.amount),
+        date=date,
+    )
+
+
+def signed_amount(type, amount):
+    return amount if type == Type.INCOME else -amount
+
+
+def balance_deltas(added=(), removed=()):
+    deltas = defaultdict(Decimal)
+    for entry in added:
+        if entry.account_id:
+            deltas[entry.account_id] += signed_amount(entry.type, entry.amount)
+    for entry in removed:
+        if entry.account_id:
+            deltas[entry.account_id] -= signed_amount(entry.type, entry.amount)
+    return deltas
+
+
+def daily_balance_deltas(added=(), removed=()):
+    deltas = defaultdict(Decimal)
+    for entry in added:
+        if entry.account_id:
+            deltas[entry.account_id, entry.date] += signed_amount(entry.type, entry.amount)
+    for entry in removed:
+        if entry.account_id:
+            deltas[entry.account_id, entry.date] -= signed_amount(entry.type, entry.amount)
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def monthly_rollup_deltas(added=(), removed=(), into=None):
+    deltas = defaultdict(lambda: [Decimal('0'), 0]) if into is None else into
+    for entries, sign in ((added, 1), (removed, -1)):
+        for entry in entries:
+            if entry.user_id:
+                key = (entry.user_id, month_start(entry.date), entry.category_id, entry.type)
+                deltas[key][0] += sign * entry.amount
+                deltas[key][1] += sign
+    return deltas
+
+
+def apply_entries(added=(), removed=(), update_accounts=True):
+    """
+    Applies ledger entries to account balances, daily balance snapshots
+    and monthly category rollups as signed deltas.
+
+    Must be called inside the same DB transaction as the write itself.
+    The number of queries does not depend on the number of entries:
+    touched accounts are locked in id order with one query, so that
+    concurrent writers always lock rows in the same sequence, and get
+    their deltas in one UPDATE.
+    """
+    if update_accounts:
+        _apply_account_deltas(added, removed)
+    apply_rollup_deltas(monthly_rollup_deltas(added, removed))
+
+    user_ids = {entry.user_id for entry in (*added, *removed) if entry.user_id}
+    if user_ids:
+        ledger_changed.send(sender=Transaction, user_ids=user_ids)
+
+
+def _apply_account_deltas(added, removed):
+    deltas = {
+        account_id: delta
+        for account_id, delta in balance_deltas(added, removed).items()
+        if delta
+    }
+    day_deltas = daily_balance_deltas(added, removed)
+
+    # Перенос транзакции между днями не меняет баланс, но счет все равно блокируем;
+    # один счет блокирует сам UPDATE
+    touched = sorted(deltas.keys() | {account_id for account_id, _ in day_deltas})
+    if len(touched) > 1 or (touched and not deltas):
+        list(Account.objects.select_for_update().filter(
+            pk__in=touched
+        ).order_by('pk').values_list('pk', flat=True))
+
+    if deltas:
+        Account.objects.filter(pk__in=deltas).update(
+            balance=F('balance') + Case(
+                *(When(pk=account_id, then=Value(delta)) for account_id, delta in deltas.items()),
+                output_field=Account._meta.get_field('balance'),
+            ),
+            updated_at=timezone.now(),
+        )
+    apply_snapshot_deltas(day_deltas)
+
+
+def bulk_create_transactions(transactions, batch_size=1000):
+    """
+    Inserts transactions with bulk_create and applies one balance delta
+    per touched account for the whole batch.
+
+    Model validation in Transaction.save() is skipped, callers are
+    expected to validate the rows themselves.
+    """
+    with db_transaction.atomic():
+        created = Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+        apply_entries(added=[entry_for(trans) for trans in created])
+    return created
+
+
+def recompute_balances(accounts):
+    """
+    Full re-aggregation of balances from transaction history.
+
+    This is a repair operation, regular writes go through apply_entries().
+    """
+    accounts = list(accounts)
+    totals = {
+        row['account_id']: row
+        for row in Transaction.objects.filter(
+            account__in=accounts
+        ).values('account_id').annotate(
+            income=Sum('amount', filter=Q(type=Type.INCOME)),
+            outcome=Sum('amount', filter=Q(type=Type.OUTCOME)),
+        )
+    }
+
+    changed = []
+    for account in accounts:
+        row = totals.get(account.id, {})
+        balance = (
+            account.initial_balance
+            + (row.get('income') or Decimal('0'))
+            - (row.get('outcome') or Decimal('0'))
+        )
+        if account.balance != balance:
+            account.balance = balance
+            changed.append(account)
+
+    Account.objects.bulk_update(changed, ['balance'])
+    return changed
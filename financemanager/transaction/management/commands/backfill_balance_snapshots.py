@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transaction.models import Account
+from transaction.snapshots import rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily account balance snapshots from the transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only rebuild accounts of this user',
+        )
+        parser.add_argument(
+            '--account-id',
+            type=int,
+            help='Only rebuild this account',
+        )
+
+    def handle(self, *args, **options):
+        accounts = Account.objects.all().order_by('id')
+        if options['user_id']:
+            accounts = accounts.filter(user_id=options['user_id'])
+        if options['account_id']:
+            accounts = accounts.filter(id=options['account_id'])
+
+        total = 0
+        for account in accounts:
+            with transaction.atomic():
+                locked = Account.objects.select_for_update().filter(pk=account.pk)
+                created = rebuild_snapshots(locked)
+            total += created
+            self.stdout.write(f'Account {account.id} ({account.name}): {created} snapshots')
+
+        self.stdout.write(self.style.SUCCESS(f'Created {total} snapshots'))
@@ -0,0 +1,418 @@
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from calendar import monthrange
+from contextlib import nullcontext
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from dashboard.tasks import rebuild_dashboard_snapshot
+from financemanager.celery import app as celery_app
+from financemanager.querycount import QueryBudget, track_queries
+from stats.cache import bump_generation
+from transaction.ledger import recompute_balances
+from transaction.models import (
+    Account, Budget, BudgetCategoryLimit, Category, RecurringTransaction,
+    ReccuringTransactionFrequency as Frequency, Transaction, Type
+)
+from transaction.rollups import rebuild_rollups
+from transaction.snapshots import rebuild_snapshots
+from transaction.tasks import process_recurring_transaction
+from utils.benchmarks import p95, rolled_back
+
+User = get_user_model()
+
+
+RESULTS_VERSION = 1
+
+ACCOUNTS = 5
+
+HISTORY_DAYS = 3 * 365
+
+INCOME_SHARE = 0.15
+
+SEED_BATCH_SIZE = 10000
+
+OUTCOME_CATEGORIES = [
+    'Groceries', 'Rent', 'Transport', 'Cafe', 'Health', 'Utilities', 'Shopping', 'Travel'
+]
+
+INCOME_CATEGORIES = ['Salary', 'Freelance', 'Interest']
+
+DESCRIPTION_WORDS = [
+    'coffee', 'lunch', 'dinner', 'taxi', 'metro', 'groceries', 'market', 'pharmacy',
+    'cinema', 'books', 'fuel', 'internet', 'phone', 'gym', 'gift', 'hotel',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'End-to-end benchmark of the main views (through the test client) and '
+        'Celery tasks on seeded datasets of several sizes. Records latency, '
+        'query count and peak memory as JSON and compares it with a baseline. '
+        'Each dataset is seeded and measured in a transaction that is rolled back; '
+        'with --keep-data datasets are committed and reused, run that against a '
+        'dedicated database. Run with DEBUG off.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales',
+            type=int,
+            nargs='+',
+            default=[1000, 100000, 1000000],
+            help='Transactions per user to measure at (default: 1000 100000 1000000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Measured runs of each scenario (default: 20)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Seed of the generated datasets (default: 42)',
+        )
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            default=None,
+            help='Scenarios to run, e.g. dashboard stats task',
+        )
+        parser.add_argument(
+            '--keep-data',
+            action='store_true',
+            help='Commit the datasets and reuse them in later runs instead of rolling '
+                 'them back. Independent dashboard and stats queries then run '
+                 'concurrently, as in production',
+        )
+        parser.add_argument(
+            '--reseed',
+            action='store_true',
+            help='Recreate kept datasets even if a matching one exists',
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark.json',
+            help='File for the JSON results (default: benchmark.json)',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=None,
+            help='JSON results of an earlier run to compare with',
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=0.2,
+            help='Allowed p50 slowdown against the baseline (default: 0.2 = 20%%)',
+        )
+
+    def handle(self, *args, **options):
+        scales = sorted(options['scales'])
+        results = {}
+
+        if not options['keep_data']:
+            self.stdout.write(self.style.WARNING(
+                'Datasets are rolled back after each scale: run_queries calls run one '
+                'by one inside the transaction, use --keep-data to measure them concurrently'
+            ))
+
+        # Задачи, которые ставят представления и сигналы, выполняются в процессе
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            # debug_toolbar не должен попадать в замеры
+            with override_settings(INTERNAL_IPS=[]):
+                for scale in scales:
+                    with nullcontext() if options['keep_data'] else rolled_back():
+                        user = self._dataset(scale, options['seed'], options['reseed'])
+                        self.stdout.write(
+                            f'{"scale":>9} {"scenario":>36} {"p50 ms":>10} {"p95 ms":>10} '
+                            f'{"queries":>8} {"peak KiB":>10} {"status":>6}'
+                        )
+                        results[str(scale)] = self._run_scale(
+                            scale, user, options['repeat'], options['only']
+                        )
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+
+        report = {'meta': self._meta(options, scales), 'results': results}
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        if options['baseline']:
+            self._compare(report, options['baseline'], options['max_regression'])
+
+    def _meta(self, options, scales):
+        return {
+            'version': RESULTS_VERSION,
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'debug': settings.DEBUG,
+            'concurrent_query_workers': settings.CONCURRENT_QUERY_WORKERS,
+            'scales': scales,
+            'repeat': options['repeat'],
+            'seed': options['seed'],
+            'keep_data': options['keep_data'],
+            # В откатываемой транзакции run_queries выполняет запросы по очереди
+            'concurrent_queries': options['keep_data'],
+        }
+
+    def _dataset(self, scale, seed, reseed):
+        """Benchmark user with scale transactions, reused while seed and day match"""
+        today = timezone.now().date()
+        email = f'benchmark-{scale}@example.com'
+        marker = f'seed {seed}, {today.isoformat()}'
+
+        user = User.objects.filter(email=email).first()
+        if user is not None:
+            if (
+                not reseed
+                and user.lastname == marker
+                and Transaction.objects.filter(user=user).count() == scale
+            ):
+                return user
+            user.delete()
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            user = self._seed(email, marker, scale, random.Random(f'{seed}:{scale}'))
+        self.stdout.write(
+            f'Seeded {scale} transactions in {time.perf_counter() - started:.1f}s'
+        )
+        return user
+
+    def _seed(self, email, marker, scale, rng):
+        today = timezone.now().date()
+        user = User.objects.create_user(
+            email=email, password=None, firstname='Benchmark', lastname=marker
+        )
+        accounts = Account.objects.bulk_create(
+            Account(
+                user=user,
+                name=f'Account {n}',
+                account_type='BANK',
+                initial_balance=Decimal('1000.00'),
+            )
+            for n in range(ACCOUNTS)
+        )
+        outcome = Category.objects.bulk_create(
+            Category(user=user, name=name, type=Type.OUTCOME) for name in OUTCOME_CATEGORIES
+        )
+        income = Category.objects.bulk_create(
+            Category(user=user, name=name, type=Type.INCOME) for name in INCOME_CATEGORIES
+        )
+
+        # Вставка без ledger: балансы, снимки и итоги пересчитываются один раз в конце
+        for start in range(0, scale, SEED_BATCH_SIZE):
+            Transaction.objects.bulk_create(
+                (
+                    self._transaction(user, accounts, outcome, income, today, rng)
+                    for _ in range(start, min(start + SEED_BATCH_SIZE, scale))
+                ),
+                batch_size=5000,
+            )
+        recompute_balances(accounts)
+        rebuild_snapshots(accounts)
+        rebuild_rollups([user.id])
+
+        budget = Budget.objects.create(
+            user=user,
+            name='Benchmark',
+            period_type='MONTHLY',
+            start_date=today.replace(day=1),
+            end_date=today.replace(day=monthrange(today.year, today.month)[1]),
+            total_expense_limit=Decimal('100000.00'),
+        )
+        BudgetCategoryLimit.objects.bulk_create(
+            BudgetCategoryLimit(budget=budget, category=category, limit_amount=Decimal('10000.00'))
+            for category in outcome
+        )
+        RecurringTransaction.objects.bulk_create(
+            RecurringTransaction(
+                user=user,
+                account=rng.choice(accounts),
+                category=rng.choice(outcome),
+                type=Type.OUTCOME,
+                amount=Decimal(rng.randint(100, 5000)) / 100,
+                description='Benchmark subscription',
+                start_date=today,
+                frequency=Frequency.DAILY,
+                next_run_date=today,
+            )
+            for _ in range(max(10, scale // 10000))
+        )
+        bump_generation(user.id)
+        return user
+
+    @staticmethod
+    def _transaction(user, accounts, outcome, income, today, rng):
+        is_income = rng.random() < INCOME_SHARE
+        return Transaction(
+            user=user,
+            account=rng.choice(accounts),
+            category=rng.choice(income if is_income else outcome),
+            type=Type.INCOME if is_income else Type.OUTCOME,
+            amount=Decimal(rng.randint(100, 50000)) / 100,
+            date=today - timedelta(days=rng.randrange(HISTORY_DAYS)),
+            description=' '.join(rng.sample(DESCRIPTION_WORDS, 3)),
+        )
+
+    def _scenarios(self, user):
+        """Yields (name, run, reset); reset runs before every measured run"""
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        budget = Budget.objects.filter(user=user).first()
+
+        def invalidate():
+            # Новое поколение данных: снимок и статистика считаются заново
+            bump_generation(user.id)
+
+        pages = [
+            ('dashboard', reverse('dashboard:dashboard'), True),
+            ('stats', reverse('stats:stats'), True),
+            ('transaction_list', reverse('transaction:trans-list'), False),
+            ('transaction_list_part', reverse('transaction:trans-list-part'), False),
+            ('budget_detail', reverse('transaction:budget-detail', args=[budget.id]), False),
+            ('api_transactions', reverse('api-transactions-list'), False),
+        ]
+        for name, url, cached in pages:
+            run = lambda url=url: client.get(url)
+            if cached:
+                yield f'{name}:cold', run, invalidate
+                yield f'{name}:warm', run, None
+            else:
+                yield name, run, None
+
+        def process_recurring():
+            # Задача обрабатывает правила всех пользователей, правила других наборов
+            # отключаются до отката, чтобы результат не зависел от их числа
+            RecurringTransaction.objects.exclude(user=user).update(next_run_date=None)
+            return process_recurring_transaction()
+
+        yield 'task:rebuild_dashboard_snapshot', lambda: rebuild_dashboard_snapshot(user.id), invalidate
+        yield 'task:process_recurring_transaction', self._rolled_back(process_recurring), None
+
+    @staticmethod
+    def _rolled_back(task):
+        """Runs task in a transaction that is rolled back, so every run sees the same data"""
+        def run():
+            with rolled_back():
+                result = task()
+            return result
+
+        return run
+
+    def _run_scale(self, scale, user, repeat, only):
+        results = {}
+        for name, run, reset in self._scenarios(user):
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            results[name] = result = self._measure(run, reset, repeat)
+            self.stdout.write(
+                f'{scale:>9} {name:>36} {result["p50_ms"]:>10.2f} {result["p95_ms"]:>10.2f} '
+                f'{result["queries"]:>8} {result["peak_memory_kib"]:>10} '
+                f'{result["status"] or "":>6}'
+            )
+        return results
+
+    def _measure(self, run, reset, repeat):
+        if reset:
+            reset()
+        # Прогрев: соединения, шаблоны, кеш снимков для теплых замеров
+        run()
+
+        timings, queries = [], []
+        result = None
+        for _ in range(repeat):
+            if reset:
+                reset()
+            with track_queries('benchmark', QueryBudget(repeats=None), strict=False) as log:
+                started = time.perf_counter()
+                result = run()
+                timings.append(time.perf_counter() - started)
+            queries.append(log.count)
+
+        # Память меряется отдельным прогоном, tracemalloc замедляет выполнение
+        if reset:
+            reset()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': getattr(result, 'status_code', None),
+            'bytes': len(result.content) if hasattr(result, 'content') else None,
+            'mean_ms': round(statistics.mean(timings) * 1000, 3),
+            'p50_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(p95(timings) * 1000, 3),
+            'max_ms': round(max(timings) * 1000, 3),
+            'queries': max(queries),
+            'peak_memory_kib': round(peak / 1024),
+        }
+
+    def _compare(self, report, path, max_regression):
+        try:
+            with open(path) as f:
+                previous_report = json.load(f)
+            baseline = previous_report['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
+
+        results = report['results']
+        # Базовые результаты до --keep-data снимались на зафиксированных данных
+        if previous_report.get('meta', {}).get('keep_data', True) != report['meta']['keep_data']:
+            self.stdout.write(self.style.WARNING(
+                f'{path} was measured with{"" if report["meta"]["keep_data"] else "out"} '
+                f'rolled back data, latencies are not directly comparable'
+            ))
+
+        self.stdout.write(
+            f'\n{"scale":>9} {"scenario":>36} {"p50 base":>10} {"p50 now":>10} '
+            f'{"change":>8} {"queries":>10}'
+        )
+        regressions = []
+        for scale, scenarios in results.items():
+            for name, current in scenarios.items():
+                previous = baseline.get(scale, {}).get(name)
+                if previous is None:
+                    continue
+                change = (
+                    current['p50_ms'] / previous['p50_ms'] - 1 if previous['p50_ms'] else 0
+                )
+                self.stdout.write(
+                    f'{scale:>9} {name:>36} {previous["p50_ms"]:>10.2f} '
+                    f'{current["p50_ms"]:>10.2f} {change:>+8.0%} '
+                    f'{previous["queries"]:>4} -> {current["queries"]:<4}'
+                )
+                if (
+                    change > max_regression
+                    or current['queries'] > previous['queries']
+                    or current['status'] != previous['status']
+                ):
+                    regressions.append(f'{name} at {scale}')
+
+        if regressions:
+            raise CommandError(f'Regressions against {path}: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
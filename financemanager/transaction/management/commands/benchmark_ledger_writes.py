@@ -0,0 +1,113 @@
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from transaction.models import Account, Transaction, Type
+from utils.benchmarks import p95, rolled_back
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure per-write latency of transaction create/update/delete '
+        'as the account history grows. All data is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[0, 1000, 10000, 100000],
+            help='History sizes to measure at (default: 0 1000 10000 100000)',
+        )
+        parser.add_argument(
+            '--writes',
+            type=int,
+            default=200,
+            help='Number of writes of each kind per history size (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        writes = options['writes']
+
+        self.stdout.write(
+            f'{"history":>10} {"op":>8} {"mean ms":>10} {"p95 ms":>10} {"queries/op":>12}'
+        )
+        with rolled_back():
+            user = User.objects.create_user(
+                email='ledger-benchmark@example.com', password=None
+            )
+            account = Account.objects.create(
+                name='Benchmark', account_type='BANK', user=user
+            )
+            history = 0
+            for size in sizes:
+                self._seed(user, account, size - history)
+                history = size
+                for op, timings, queries in self._measure(user, account, writes):
+                    self.stdout.write(
+                        f'{size:>10} {op:>8} '
+                        f'{statistics.mean(timings) * 1000:>10.3f} '
+                        f'{p95(timings) * 1000:>10.3f} '
+                        f'{queries / writes:>12.1f}'
+                    )
+
+    def _seed(self, user, account, count):
+        start = date.today() - timedelta(days=365)
+        Transaction.objects.bulk_create(
+            (
+                Transaction(
+                    user=user,
+                    account=account,
+                    type=Type.OUTCOME if i % 3 else Type.INCOME,
+                    amount=Decimal('10.00'),
+                    date=start + timedelta(days=i % 365),
+                )
+                for i in range(max(count, 0))
+            ),
+            batch_size=5000,
+        )
+
+    def _measure(self, user, account, writes):
+        created, updated, deleted = [], [], []
+        objects = []
+
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(writes):
+                started = time.perf_counter()
+                objects.append(Transaction.objects.create(
+                    user=user, account=account, type=Type.OUTCOME, amount=Decimal('5.00')
+                ))
+                created.append(time.perf_counter() - started)
+        create_queries = len(ctx.captured_queries)
+
+        with CaptureQueriesContext(connection) as ctx:
+            for obj in objects:
+                started = time.perf_counter()
+                obj.type = Type.INCOME
+                obj.amount = Decimal('7.00')
+                obj.save()
+                updated.append(time.perf_counter() - started)
+        update_queries = len(ctx.captured_queries)
+
+        with CaptureQueriesContext(connection) as ctx:
+            for obj in objects:
+                started = time.perf_counter()
+                obj.delete()
+                deleted.append(time.perf_counter() - started)
+        delete_queries = len(ctx.captured_queries)
+
+        return [
+            ('create', created, create_queries),
+            ('update', updated, update_queries),
+            ('delete', deleted, delete_queries),
+        ]
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from transaction.importers import DEFAULT_CHUNK_SIZE, StatementImporter, open_statement
+from transaction.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV, OFX or QFX bank statement into an account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the statement file')
+        parser.add_argument(
+            '--account-id',
+            type=int,
+            required=True,
+            help='ID of the account to import transactions into',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ofx', 'qfx'],
+            help='Statement format (default: by file extension)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Rows per load chunk (default: {DEFAULT_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--date-format',
+            default='%Y-%m-%d',
+            help='CSV date format (default: %%Y-%%m-%%d)',
+        )
+        parser.add_argument('--delimiter', default=',', help='CSV delimiter')
+        parser.add_argument('--encoding', default='utf-8-sig', help='File encoding')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(id=options['account_id'])
+        except Account.DoesNotExist:
+            raise CommandError(f'Account with id={options["account_id"]} does not exist')
+
+        csv_options = {}
+        if (options['format'] or options['path'].lower().rsplit('.', 1)[-1]) == 'csv':
+            csv_options = {
+                'date_format': options['date_format'],
+                'delimiter': options['delimiter'],
+            }
+        try:
+            fileobj, rows = open_statement(
+                options['path'],
+                format=options['format'],
+                encoding=options['encoding'],
+                **csv_options,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        with fileobj:
+            importer = StatementImporter(
+                account,
+                chunk_size=options['chunk_size'],
+                progress=self.report_progress,
+            ).run(rows)
+
+        for error in importer.errors:
+            self.stdout.write(self.style.WARNING(f'Skipped row {error}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Imported {importer.imported} transactions into "{account.name}" '
+                f'in {importer.elapsed:.1f}s ({importer.rows_per_second:.0f} rows/s). '
+                f'Skipped: {importer.skipped}'
+            )
+        )
+
+    def report_progress(self, importer):
+        self.stdout.write(
+            f'Imported {importer.imported} rows, '
+            f'{importer.rows_per_second:.0f} rows/s...'
+        )
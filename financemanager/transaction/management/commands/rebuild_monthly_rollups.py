@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transaction.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild monthly income/expense rollups from the raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only rebuild rollups of this user',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = [options['user_id']] if options['user_id'] else None
+
+        with transaction.atomic():
+            created = rebuild_rollups(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Created {created} rollup rows'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transaction.ledger import recompute_balances
+from transaction.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Recalculate account balances from the full transaction history (repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only recalculate accounts of this user',
+        )
+        parser.add_argument(
+            '--account-id',
+            type=int,
+            help='Only recalculate this account',
+        )
+
+    def handle(self, *args, **options):
+        accounts = Account.objects.all().order_by('id')
+        if options['user_id']:
+            accounts = accounts.filter(user_id=options['user_id'])
+        if options['account_id']:
+            accounts = accounts.filter(id=options['account_id'])
+
+        with transaction.atomic():
+            changed = recompute_balances(accounts.select_for_update())
+
+        for account in changed:
+            self.stdout.write(
+                f'Account {account.id} ({account.name}): balance set to {account.balance}'
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Checked {accounts.count()} accounts, fixed {len(changed)}'
+            )
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0015_remove_account_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Closing Balance')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='transaction.account')),
+            ],
+            options={
+                'ordering': ['account', 'date'],
+                'unique_together': {('account', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0016_accountbalancesnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyCategoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('type', models.CharField(choices=[('INCOME', 'Income'), ('OUTCOME', 'Outcome')], max_length=20, verbose_name='Type')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Total')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='transaction.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('user', 'month', 'category', 'type'), name='monthly_rollup_unique_category'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user', 'month', 'type'), name='monthly_rollup_unique_no_category')],
+            },
+        ),
+    ]
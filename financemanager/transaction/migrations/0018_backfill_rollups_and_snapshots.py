@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill(apps, schema_editor):
+    Transaction = apps.get_model('transaction', 'Transaction')
+    Account = apps.get_model('transaction', 'Account')
+    MonthlyCategoryRollup = apps.get_model('transaction', 'MonthlyCategoryRollup')
+    AccountBalanceSnapshot = apps.get_model('transaction', 'AccountBalanceSnapshot')
+
+    rows = Transaction.objects.filter(user__isnull=False).annotate(
+        month=TruncMonth('date')
+    ).values('user_id', 'month', 'category_id', 'type').annotate(
+        total=Sum('amount'), count=Count('id')
+    ).order_by()
+    MonthlyCategoryRollup.objects.bulk_create(
+        (MonthlyCategoryRollup(**row) for row in rows.iterator()),
+        batch_size=5000,
+    )
+
+    for account in Account.objects.all():
+        balance = account.initial_balance
+        snapshots = []
+        for row in Transaction.objects.filter(account=account).values('date').annotate(
+            income=Sum('amount', filter=Q(type='INCOME')),
+            outcome=Sum('amount', filter=Q(type='OUTCOME')),
+        ).order_by('date'):
+            balance += (row['income'] or Decimal('0')) - (row['outcome'] or Decimal('0'))
+            snapshots.append(
+                AccountBalanceSnapshot(account=account, date=row['date'], balance=balance)
+            )
+        AccountBalanceSnapshot.objects.bulk_create(snapshots, batch_size=5000)
+
+
+def clear(apps, schema_editor):
+    apps.get_model('transaction', 'MonthlyCategoryRollup').objects.all().delete()
+    apps.get_model('transaction', 'AccountBalanceSnapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0017_monthlycategoryrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
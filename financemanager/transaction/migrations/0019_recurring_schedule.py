@@ -0,0 +1,82 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:08
+
+from calendar import isleap, monthrange
+from datetime import date, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Копия расписания transaction.recurring на момент миграции, чтобы
+# дальнейшие изменения кода не меняли ее смысл
+def first_run_date(frequency, start_date, end_date, day):
+    day = max(day, start_date)
+
+    if frequency == 'daily':
+        run = day
+    elif frequency == 'weekly':
+        run = day + timedelta(days=-day.weekday() % 7)
+    elif frequency == 'monthly':
+        year, month = day.year, day.month
+        while True:
+            if start_date.day <= monthrange(year, month)[1]:
+                run = date(year, month, start_date.day)
+                if run >= day:
+                    break
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    elif frequency == 'yearly':
+        year = day.year
+        while True:
+            if (start_date.month, start_date.day) != (2, 29) or isleap(year):
+                run = start_date.replace(year=year)
+                if run >= day:
+                    break
+            year += 1
+    else:
+        return None
+
+    if end_date and run > end_date:
+        return None
+    return run
+
+
+def schedule_existing(apps, schema_editor):
+    RecurringTransaction = apps.get_model('transaction', 'RecurringTransaction')
+    # Сегодняшний запуск уже выполнила прежняя версия задачи
+    tomorrow = timezone.now().date() + timedelta(days=1)
+    rules = list(RecurringTransaction.objects.all())
+    for rule in rules:
+        rule.next_run_date = first_run_date(
+            rule.frequency, rule.start_date, rule.end_date, tomorrow
+        )
+    RecurringTransaction.objects.bulk_update(rules, ['next_run_date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0018_backfill_rollups_and_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='next_run_date',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='RecurringTransactionOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recurring', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='transaction.recurringtransaction')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='transaction.transaction')),
+            ],
+            options={
+                'unique_together': {('recurring', 'date')},
+            },
+        ),
+        migrations.RunPython(schedule_existing, migrations.RunPython.noop),
+    ]
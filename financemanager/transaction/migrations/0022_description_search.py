@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from transaction.search import install_search_index
+
+    install_search_index(schema_editor.connection, schema_editor)
+
+
+def uninstall(apps, schema_editor):
+    from transaction.search import uninstall_search_index
+
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0021_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -1,6 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction as db_transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
@@ -16,6 +16,14 @@ class ReccuringTransactionFrequency(models.TextChoices):
     MONTHLY = 'monthly', _('Monthly')
     YEARLY = 'yearly', _('Yearly')
 
+
+class JobStatus(models.TextChoices):
+    RUNNING = 'running', _('Running')
+    SUCCESS = 'success', _('Success')
+    FAILED = 'failed', _('Failed')
+    SKIPPED = 'skipped', _('Skipped')
+
+
 # Словарь переводов для системных категорий
 SYSTEM_CATEGORY_LABELS = {
     # OUTCOME categories
@@ -43,6 +51,21 @@ SYSTEM_CATEGORY_LABELS = {
     'other_income': _("Other Income"),
 }
 
+
+def translate_category_name(name, is_system):
+    """Переводит название категории без загрузки объекта Category"""
+    if is_system and name in SYSTEM_CATEGORY_LABELS:
+        return str(SYSTEM_CATEGORY_LABELS[name])
+    return name
+
+
+def lazy_category_name(name, is_system):
+    """Like translate_category_name, but translated only when rendered"""
+    if is_system and name in SYSTEM_CATEGORY_LABELS:
+        return SYSTEM_CATEGORY_LABELS[name]
+    return name
+
+
 class Category(models.Model):
     name = models.CharField(
         'Name',
@@ -74,9 +97,22 @@ class Category(models.Model):
     @property
     def translated_name(self):
         """Возвращает переведенное название категории"""
-        if self.is_system and self.name in SYSTEM_CATEGORY_LABELS:
-            return str(SYSTEM_CATEGORY_LABELS[self.name])
-        return self.name
+        return translate_category_name(self.name, self.is_system)
+
+    @classmethod
+    def system_labels(cls, names, translate=translate_category_name):
+        """
+        Maps names of system categories to translated labels with one query.
+        Names without a system category are returned unchanged.
+        """
+        names = set(names)
+        system_names = set(cls.objects.filter(
+            is_system=True, name__in=names
+        ).values_list('name', flat=True))
+        return {
+            name: translate(name, name in system_names)
+            for name in names
+        }
 
     def __str__(self):
         return self.translated_name
@@ -109,25 +145,40 @@ class Account(models.Model):
     class Meta:
         unique_together = ('name', 'user')
         ordering = ['name']
+        indexes = [
+            models.Index(
+                fields=['user'],
+                condition=models.Q(is_active=True),
+                name='account_active_user_idx',
+            ),
+        ]
     
     def __str__(self):
         return f'{self.name} ({self.get_account_type_display()})'
     
     def update_balance(self):
-        from django.db.models import Sum, Q
-        
-        income = Transaction.objects.filter(
-            account=self, 
-            type=Type.INCOME
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-        
-        outcome = Transaction.objects.filter(
-            account=self, 
-            type=Type.OUTCOME
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-        
-        self.balance = self.initial_balance + income - outcome
-        self.save(update_fields=['balance'])
+        """Полный пересчет баланса по истории транзакций (только для исправления расхождений)"""
+        from .ledger import recompute_balances
+
+        recompute_balances([self])
+
+
+class AccountBalanceSnapshot(models.Model):
+    """Остаток на счете на конец дня, в который были транзакции"""
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        related_name='balance_snapshots'
+    )
+    date = models.DateField('Date')
+    balance = models.DecimalField('Closing Balance', max_digits=16, decimal_places=2)
+
+    class Meta:
+        unique_together = ('account', 'date')
+        ordering = ['account', 'date']
+
+    def __str__(self):
+        return f'{self.account_id} {self.date}: {self.balance}'
 
 
 class Budget(models.Model):
@@ -149,6 +200,13 @@ class Budget(models.Model):
     
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            models.Index(
+                fields=['user', '-start_date'],
+                condition=models.Q(is_active=True),
+                name='budget_active_user_idx',
+            ),
+        ]
     
     def __str__(self):
         return f'{self.name} ({self.start_date} - {self.end_date})'
@@ -215,6 +273,20 @@ class Transaction(models.Model):
     date = models.DateField(default=timezone.now)
     description = models.TextField(max_length=255, null=True, blank=True)
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, null=True)
+
+    class Meta:
+        indexes = [
+            # Периоды пользователя и постраничная выдача по (date, id)
+            models.Index(fields=['user', 'date', 'id'], name='transaction_user_date_idx'),
+            # Суммы по типу за период читаются из индекса без обращения к таблице
+            models.Index(
+                fields=['user', 'type', 'date'],
+                include=['amount'],
+                name='transaction_user_type_date_idx',
+            ),
+            models.Index(fields=['account', 'type'], name='transaction_account_type_idx'),
+            models.Index(fields=['user', 'amount', 'id'], name='transaction_user_amount_idx'),
+        ]
     
     def clean(self):
         if self.category and self.category.type != self.type:
@@ -224,10 +296,20 @@ class Transaction(models.Model):
             )
     
     def save(self, *args, **kwargs):
+        from .ledger import apply_entries, entry_for
+
         self.full_clean()
-        super().save(*args, **kwargs)
-        if self.account:
-            self.account.update_balance()
+        with db_transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Transaction.objects.select_for_update().filter(
+                    pk=self.pk
+                ).first()
+            super().save(*args, **kwargs)
+            apply_entries(
+                added=[entry_for(self)],
+                removed=[entry_for(previous)] if previous else [],
+            )
     
     def __str__(self):
         return (f'Transaction '
@@ -236,6 +318,37 @@ class Transaction(models.Model):
                 f'date: {self.date}')
 
 
+class MonthlyCategoryRollup(models.Model):
+    """Сумма и количество транзакций пользователя за месяц по категории и типу"""
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='monthly_rollups'
+    )
+    month = models.DateField('Month')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    type = models.CharField("Type", max_length=20, choices=Type.choices)
+    total = models.DecimalField('Total', max_digits=18, decimal_places=2, default=0)
+    count = models.IntegerField('Count', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'month', 'category', 'type'],
+                condition=models.Q(category__isnull=False),
+                name='monthly_rollup_unique_category',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'month', 'type'],
+                condition=models.Q(category__isnull=True),
+                name='monthly_rollup_unique_no_category',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.month:%Y-%m} {self.category_id} {self.type}: {self.total}'
+
+
 class RecurringTransaction(models.Model):
     account = models.ForeignKey(
         Account,
@@ -257,6 +370,73 @@ class RecurringTransaction(models.Model):
         choices=ReccuringTransactionFrequency.choices,
         default=ReccuringTransactionFrequency.MONTHLY
     )
+    # Дата следующего запуска, NULL - правило завершено
+    next_run_date = models.DateField(null=True, blank=True, db_index=True, editable=False)
     
+    # Поля, от которых зависит next_run_date
+    SCHEDULE_FIELDS = ('start_date', 'frequency', 'end_date')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_schedule = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.SCHEDULE_FIELDS
+        }
+        return instance
+
+    def schedule_changed(self):
+        loaded = getattr(self, '_loaded_schedule', {})
+        return any(getattr(self, name) != value for name, value in loaded.items())
+
+    def save(self, *args, **kwargs):
+        from .recurring import first_run_date
+
+        if self._state.adding:
+            if self.next_run_date is None:
+                self.next_run_date = first_run_date(self, timezone.now().date())
+        elif self.schedule_changed():
+            # Расписание считается заново от сегодняшнего дня, прошедшие запуски не создаются
+            self.next_run_date = first_run_date(self, timezone.now().date())
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'next_run_date'}
+        super().save(*args, **kwargs)
+        self._loaded_schedule = {name: getattr(self, name) for name in self.SCHEDULE_FIELDS}
+
     def __str__(self):
         return f'{self.amount}, {self.category}, {self.type}'
+
+
+class RecurringTransactionOccurrence(models.Model):
+    """Processed run of a recurring rule, guards against creating it twice"""
+    recurring = models.ForeignKey(
+        RecurringTransaction, on_delete=models.CASCADE, related_name='occurrences'
+    )
+    date = models.DateField('Date')
+    transaction = models.ForeignKey(
+        Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('recurring', 'date')
+
+    def __str__(self):
+        return f'{self.recurring_id} {self.date}'
+
+
+class JobRun(models.Model):
+    """Run ledger of scheduled jobs"""
+    name = models.CharField('Job', max_length=100)
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.RUNNING)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    stats = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [models.Index(fields=['name', 'status'])]
+
+    def __str__(self):
+        return f'{self.name} {self.started_at:%Y-%m-%d %H:%M}: {self.status}'
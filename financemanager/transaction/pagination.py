@@ -0,0 +1,100 @@
+import base64
+import json
+
+from django.db.models import Q
+
+from .models import Transaction
+
+
+DEFAULT_PAGE_SIZE = 50
+
+DEFAULT_ORDERING = '-date'
+
+# Поля, по которым возможна постраничная выдача; id добавляется для уникальности
+KEYSET_FIELDS = ('date', 'amount')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_ordering(ordering=None):
+    """Returns (field, descending) for '-date', 'amount' and the like"""
+    ordering = ordering or DEFAULT_ORDERING
+    field = ordering.lstrip('-')
+    if field not in KEYSET_FIELDS:
+        raise ValueError(f'Unsupported ordering: {ordering}')
+    return field, ordering.startswith('-')
+
+
+def encode_cursor(ordering, obj):
+    field, _ = keyset_ordering(ordering)
+    # Строки values() приходят словарями
+    if isinstance(obj, dict):
+        value, pk = obj[field], obj['id']
+    else:
+        value, pk = getattr(obj, field), obj.pk
+    payload = json.dumps([ordering, str(value), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(ordering, cursor):
+    """Returns (value, id) of the last row of the previous page"""
+    field, _ = keyset_ordering(ordering)
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_ordering, value, pk = json.loads(payload)
+        value = Transaction._meta.get_field(field).to_python(value)
+        pk = int(pk)
+    except Exception:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}')
+    # Курсор от другой сортировки указывает не на ту позицию
+    if cursor_ordering != ordering or value is None:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}')
+    return value, pk
+
+
+def paginate_keyset(queryset, cursor=None, page_size=None, ordering=None):
+    """
+    Returns a KeysetPage of queryset ordered by (ordering, id).
+
+    The next page starts right after the (value, id) of the last row, so
+    every page is an index range scan of page_size + 1 rows without
+    OFFSET or COUNT, no matter how deep it is.
+    """
+    page_size = page_size or DEFAULT_PAGE_SIZE
+    ordering = ordering or DEFAULT_ORDERING
+    field, descending = keyset_ordering(ordering)
+    queryset = queryset.order_by(ordering, '-pk' if descending else 'pk')
+
+    if cursor:
+        value, pk = decode_cursor(ordering, cursor)
+        if descending:
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}),
+                **{f'{field}__lte': value},
+            )
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}),
+                **{f'{field}__gte': value},
+            )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(ordering, items[-1])
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,194 @@
+import logging
+from calendar import isleap, monthrange
+from datetime import date, timedelta
+
+from django.db import transaction as db_transaction
+from django.db.models import F
+from financemanager.querycount import QueryBudgetExceeded, query_batch
+
+from .ledger import bulk_create_transactions
+from .models import (
+    ReccuringTransactionFrequency as Frequency,
+    RecurringTransaction,
+    RecurringTransactionOccurrence,
+    Transaction,
+)
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BATCH_SIZE = 500
+
+# Запросы одной пачки правил, не зависят от числа правил, счетов и дней
+RECURRING_BATCH_QUERIES = 25
+
+
+def next_occurrence(frequency, start_date, day):
+    """
+    First date on or after day (and not before start_date) the schedule
+    fires on: daily, on Mondays, on the start day of month, or on the
+    start date of every year.
+    """
+    day = max(day, start_date)
+
+    if frequency == Frequency.DAILY:
+        return day
+
+    if frequency == Frequency.WEEKLY:
+        return day + timedelta(days=-day.weekday() % 7)
+
+    if frequency == Frequency.MONTHLY:
+        year, month = day.year, day.month
+        while True:
+            # Месяцы без нужного числа пропускаются
+            if start_date.day <= monthrange(year, month)[1]:
+                candidate = date(year, month, start_date.day)
+                if candidate >= day:
+                    return candidate
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    if frequency == Frequency.YEARLY:
+        year = day.year
+        while True:
+            if (start_date.month, start_date.day) != (2, 29) or isleap(year):
+                candidate = start_date.replace(year=year)
+                if candidate >= day:
+                    return candidate
+            year += 1
+
+    raise ValueError(f'Unknown frequency: {frequency}')
+
+
+def first_run_date(rule, today):
+    """Next run of a new rule, past occurrences are not created"""
+    day = next_occurrence(rule.frequency, rule.start_date, today)
+    if rule.end_date and day > rule.end_date:
+        return None
+    return day
+
+
+def due_dates(rule, today):
+    """
+    Returns (dates, next_run_date): occurrences of rule from its
+    next_run_date up to today, including runs missed while the scheduler
+    was down, and the run after them (None once end_date is passed).
+    """
+    dates = []
+    day = rule.next_run_date
+    while day and day <= today:
+        if rule.end_date and day > rule.end_date:
+            break
+        dates.append(day)
+        day = next_occurrence(rule.frequency, rule.start_date, day + timedelta(days=1))
+
+    if day and rule.end_date and day > rule.end_date:
+        day = None
+    return dates, day
+
+
+def process_recurring_batch(rule_ids, today):
+    """
+    Creates transactions for the due runs of the given rules.
+
+    All transactions of the batch are inserted with one bulk insert and
+    one balance delta per account. Rules locked by a concurrent run are
+    skipped, runs that already have an occurrence record are not created
+    again.
+
+    The bulk insert skips Transaction.clean(), so a rule whose category
+    does not match its type is logged, counted as failed and left due.
+    """
+    stats = {'created': 0, 'skipped': 0, 'failed': 0}
+
+    with db_transaction.atomic():
+        rules = []
+        for rule in RecurringTransaction.objects.select_for_update(
+            skip_locked=True, of=('self',)
+        ).filter(
+            pk__in=rule_ids, next_run_date__lte=today
+        ).annotate(category_type=F('category__type')):
+            if rule.category_type is not None and rule.category_type != rule.type:
+                logger.error(
+                    f"Категория повторяющейся транзакции {rule.id} не соответствует типу {rule.type}"
+                )
+                stats['failed'] += 1
+                continue
+            rules.append(rule)
+        if not rules:
+            return stats
+
+        done = set(RecurringTransactionOccurrence.objects.filter(
+            recurring__in=rules,
+            date__gte=min(rule.next_run_date for rule in rules),
+            date__lte=today,
+        ).values_list('recurring_id', 'date'))
+
+        runs = []
+        for rule in rules:
+            dates, rule.next_run_date = due_dates(rule, today)
+            for day in dates:
+                if (rule.id, day) in done:
+                    stats['skipped'] += 1
+                    continue
+                runs.append((rule, day, Transaction(
+                    account_id=rule.account_id,
+                    user_id=rule.user_id,
+                    amount=rule.amount,
+                    type=rule.type,
+                    category_id=rule.category_id,
+                    description=f"{rule.description} (автоматически создано)",
+                    date=day,
+                )))
+
+        created = bulk_create_transactions([trans for _, _, trans in runs])
+        RecurringTransactionOccurrence.objects.bulk_create([
+            RecurringTransactionOccurrence(recurring=rule, date=day, transaction=trans)
+            for (rule, day, _), trans in zip(runs, created)
+        ])
+        RecurringTransaction.objects.bulk_update(rules, ['next_run_date'])
+        stats['created'] = len(created)
+
+    return stats
+
+
+def due_rule_ids(today, first_id=None, last_id=None):
+    rules = RecurringTransaction.objects.filter(next_run_date__lte=today)
+    if first_id is not None:
+        rules = rules.filter(pk__gte=first_id)
+    if last_id is not None:
+        rules = rules.filter(pk__lte=last_id)
+    return list(rules.order_by('id').values_list('id', flat=True))
+
+
+def shard_ranges(rule_ids, shard_size):
+    """Splits sorted rule ids into (first_id, last_id) ranges of shard_size rules"""
+    return [
+        (rule_ids[start], rule_ids[min(start + shard_size, len(rule_ids)) - 1])
+        for start in range(0, len(rule_ids), shard_size)
+    ]
+
+
+def process_due_recurring(today, first_id=None, last_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Processes due rules, optionally limited to an id range, in batches.
+    A failed batch does not stop the rest.
+    """
+    totals = {'created': 0, 'skipped': 0, 'failed': 0}
+    rule_ids = due_rule_ids(today, first_id, last_id)
+
+    for start in range(0, len(rule_ids), batch_size):
+        batch = rule_ids[start:start + batch_size]
+        try:
+            with query_batch('recurring batch', RECURRING_BATCH_QUERIES):
+                stats = process_recurring_batch(batch, today)
+        except QueryBudgetExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при обработке повторяющихся транзакций {batch[0]}-{batch[-1]}: {e}")
+            totals['failed'] += len(batch)
+            continue
+        totals['created'] += stats['created']
+        totals['skipped'] += stats['skipped']
+        totals['failed'] += stats['failed']
+
+    return totals
@@ -0,0 +1,207 @@
+from calendar import monthrange
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from .models import MonthlyCategoryRollup, Transaction
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month_start(day):
+    return month_start(day) + timedelta(days=monthrange(day.year, day.month)[1])
+
+
+def _sort_key(key):
+    user_id, month, category_id, type = key
+    return user_id, month, category_id or 0, type
+
+
+def _rollup_filter(key):
+    user_id, month, category_id, type = key
+    return Q(user_id=user_id, month=month, category_id=category_id, type=type)
+
+
+def _apply_rollup_delta(key, amount, count):
+    rows = MonthlyCategoryRollup.objects.filter(_rollup_filter(key))
+    changes = {'total': F('total') + amount, 'count': F('count') + count}
+    if rows.update(**changes) or count <= 0:
+        return
+    user_id, month, category_id, type = key
+    try:
+        with db_transaction.atomic():
+            MonthlyCategoryRollup.objects.create(
+                user_id=user_id, month=month, category_id=category_id,
+                type=type, total=amount, count=count
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        rows.update(**changes)
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Applies {(user_id, month, category_id, type): [amount, count]} deltas.
+
+    Several keys are applied with a fixed number of queries: the existing
+    rows are locked, updated with one UPDATE and the rest are created in
+    one INSERT. A missing row is only created for positive counts: a
+    negative delta without a row means the rollup was already removed by
+    a cascade delete.
+    """
+    changes = {
+        key: deltas[key] for key in sorted(deltas, key=_sort_key)
+        if deltas[key][0] or deltas[key][1]
+    }
+    if not changes:
+        return
+    if len(changes) == 1:
+        (key, (amount, count)), = changes.items()
+        _apply_rollup_delta(key, amount, count)
+        return
+
+    try:
+        with db_transaction.atomic():
+            _apply_rollup_batch(changes)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос: применяем по одной
+        for key, (amount, count) in changes.items():
+            _apply_rollup_delta(key, amount, count)
+
+
+def _apply_rollup_batch(changes):
+    rows = MonthlyCategoryRollup.objects.filter(
+        reduce(or_, (_rollup_filter(key) for key in changes))
+    )
+    existing = {
+        (row['user_id'], row['month'], row['category_id'], row['type'])
+        for row in rows.select_for_update().order_by('pk').values(
+            'user_id', 'month', 'category_id', 'type'
+        )
+    }
+    if existing:
+        rows.update(
+            total=F('total') + Case(
+                *(When(_rollup_filter(key), then=Value(changes[key][0])) for key in existing),
+                default=Value(Decimal('0')),
+                output_field=MonthlyCategoryRollup._meta.get_field('total'),
+            ),
+            count=F('count') + Case(
+                *(When(_rollup_filter(key), then=Value(changes[key][1])) for key in existing),
+                default=Value(0),
+                output_field=MonthlyCategoryRollup._meta.get_field('count'),
+            ),
+        )
+    MonthlyCategoryRollup.objects.bulk_create([
+        MonthlyCategoryRollup(
+            user_id=user_id, month=month, category_id=category_id,
+            type=type, total=amount, count=count
+        )
+        for (user_id, month, category_id, type), (amount, count) in changes.items()
+        if (user_id, month, category_id, type) not in existing and count > 0
+    ])
+
+
+def rebuild_rollups(user_ids=None, batch_size=5000):
+    """Rebuilds monthly rollups from the raw transactions"""
+    rollups = MonthlyCategoryRollup.objects.all()
+    transactions = Transaction.objects.filter(user__isnull=False)
+    if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+        transactions = transactions.filter(user_id__in=user_ids)
+    rollups.delete()
+
+    rows = transactions.annotate(month=TruncMonth('date')).values(
+        'user_id', 'month', 'category_id', 'type'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+
+    created = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(MonthlyCategoryRollup(**row))
+        if len(batch) >= batch_size:
+            MonthlyCategoryRollup.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    MonthlyCategoryRollup.objects.bulk_create(batch)
+    return created + len(batch)
+
+
+def _split_range(date_from, date_to):
+    """
+    Splits [date_from, date_to] into whole months [first_month, end_month),
+    served from rollups, and partial edge ranges that have to be read from
+    raw transactions. None means an open bound.
+    """
+    first_month = None
+    if date_from:
+        first_month = date_from if date_from.day == 1 else next_month_start(date_from)
+
+    end_month = None
+    if date_to:
+        end_month = next_month_start(date_to)
+        if end_month - timedelta(days=1) != date_to:
+            end_month = month_start(date_to)
+
+    if first_month and end_month and first_month >= end_month:
+        return None, [(date_from, date_to)]
+
+    raw_ranges = []
+    if date_from and date_from != first_month:
+        raw_ranges.append((date_from, first_month - timedelta(days=1)))
+    if date_to and end_month == month_start(date_to):
+        raw_ranges.append((end_month, date_to))
+    return (first_month, end_month), raw_ranges
+
+
+def category_totals(user_id, date_from=None, date_to=None, **filters):
+    """
+    Income and expense sums and counts per (category_id, type) for the
+    period. Whole months come from the monthly rollups, only partial edge
+    months are aggregated from raw transactions.
+
+    filters are applied to both tables, e.g. type='OUTCOME' or
+    category_id=None for transactions without a category.
+    """
+    if date_from and date_to and date_from > date_to:
+        return []
+
+    months, raw_ranges = _split_range(date_from, date_to)
+    totals = {}
+
+    def add(rows):
+        for row in rows:
+            key = row['category_id'], row['type']
+            total, count = totals.get(key, (Decimal('0'), 0))
+            totals[key] = total + row['total'], count + row['count']
+
+    if months:
+        first_month, end_month = months
+        rollups = MonthlyCategoryRollup.objects.filter(user_id=user_id, **filters)
+        if first_month:
+            rollups = rollups.filter(month__gte=first_month)
+        if end_month:
+            rollups = rollups.filter(month__lt=end_month)
+        add(rollups.values('category_id', 'type').annotate(
+            total=Sum('total'), count=Sum('count')
+        ).order_by())
+
+    for start, end in raw_ranges:
+        add(Transaction.objects.filter(
+            user_id=user_id, date__range=(start, end), **filters
+        ).values('category_id', 'type').annotate(
+            total=Sum('amount'), count=Count('id')
+        ).order_by())
+
+    return [
+        {'category_id': category_id, 'type': type, 'total': total, 'count': count}
+        for (category_id, type), (total, count) in totals.items()
+        if count
+    ]
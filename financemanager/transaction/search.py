@@ -0,0 +1,136 @@
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Transaction
+
+
+# Без стемминга: описания пишут на разных языках
+SEARCH_CONFIG = 'simple'
+
+SEARCH_INDEX_NAME = 'transaction_description_search_idx'
+
+FTS_TABLE = f'{Transaction._meta.db_table}_fts'
+
+MAX_TERMS = 10
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(query):
+    return _TERM_RE.findall((query or '').lower())[:MAX_TERMS]
+
+
+def description_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector('description', config=SEARCH_CONFIG)
+
+
+def _sqlite_statements():
+    table = Transaction._meta.db_table
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"description, content='{table}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) "
+        f"VALUES ('delete', old.id, old.description); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF description ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) "
+        f"VALUES ('delete', old.id, old.description); "
+        f"INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description); END",
+    ]
+
+
+def install_search_index(connection, schema_editor=None):
+    """
+    Creates the description search index if it is missing: a GIN index on
+    to_tsvector(description) on PostgreSQL, an external content FTS5
+    table kept in sync by triggers on SQLite.
+    """
+    table = Transaction._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.indexes import GinIndex
+
+            if SEARCH_INDEX_NAME not in connection.introspection.get_constraints(cursor, table):
+                index = GinIndex(description_vector(), name=SEARCH_INDEX_NAME)
+                if schema_editor is not None:
+                    schema_editor.add_index(Transaction, index)
+                else:
+                    with connection.schema_editor() as editor:
+                        editor.add_index(Transaction, index)
+
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{FTS_TABLE}_%'],
+            )
+            if cursor.fetchone()[0] == 3:
+                return
+            # Пересоздание таблицы при миграциях SQLite удаляет триггеры,
+            # после их восстановления индекс строится заново
+            for statement in _sqlite_statements():
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX_NAME}')
+        elif connection.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def search_transactions(queryset, query, rank=True):
+    """
+    Transactions of queryset whose description has words starting with
+    every word of query, through the full-text index of the database.
+
+    With rank=True rows are annotated with search_rank, higher is more
+    relevant. Other databases fall back to description__icontains.
+    """
+    terms = search_terms(query)
+    vendor = connections[queryset.db].vendor
+
+    if not terms or vendor not in ('postgresql', 'sqlite'):
+        queryset = queryset.filter(description__icontains=query)
+        return queryset.annotate(search_rank=Value(0.0)) if rank else queryset
+
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            search_type='raw',
+            config=SEARCH_CONFIG,
+        )
+        # Выражение совпадает с выражением индекса, поэтому используется GIN
+        queryset = queryset.alias(search=description_vector()).filter(search=search_query)
+        if rank:
+            queryset = queryset.annotate(search_rank=SearchRank(description_vector(), search_query))
+        return queryset
+
+    match = ' '.join(f'"{term}"*' for term in terms)
+    queryset = queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]
+    ))
+    if rank:
+        # rank в FTS5 - это bm25, меньше значит релевантнее
+        queryset = queryset.annotate(search_rank=RawSQL(
+            f'SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'AND rowid = {Transaction._meta.db_table}.id',
+            [match],
+            output_field=FloatField(),
+        ))
+    return queryset
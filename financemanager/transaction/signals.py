@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_migrate
+from django.dispatch import receiver
+
+from .ledger import apply_entries, entry_for
+from .models import Account, Transaction
+from .search import install_search_index
+
+SEARCH_MIGRATION = ('transaction', '0022_description_search')
+
+
+@receiver(post_delete, sender=Transaction)
+def revert_ledger_entry(sender, instance, origin=None, **kwargs):
+    # Срабатывает и для каскадного удаления (например, при удалении категории).
+    # Если удаляется пользователь, пересчитывать нечего, а при удалении
+    # счета обновляются только месячные итоги.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is get_user_model():
+        return
+    apply_entries(
+        removed=[entry_for(instance)],
+        update_accounts=origin_model is not Account,
+    )
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    # SQLite пересоздает таблицу при изменении столбцов и теряет триггеры FTS5
+    if sender.name != 'transaction':
+        return
+    connection = connections[using]
+    if SEARCH_MIGRATION not in MigrationRecorder(connection).applied_migrations():
+        return
+    install_search_index(connection)
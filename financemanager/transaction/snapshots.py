@@ -0,0 +1,166 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, DateField, F, OuterRef, Q, Subquery, Sum, Value, When
+
+from .models import Account, AccountBalanceSnapshot, Transaction, Type
+
+
+def _opening_balances(first_days):
+    """Closing balance before the given day of each account, one query"""
+    previous = AccountBalanceSnapshot.objects.filter(
+        account_id=OuterRef('pk'), date__lt=OuterRef('first_day')
+    ).order_by('-date').values('balance')[:1]
+    return {
+        account_id: initial_balance if opening is None else opening
+        for account_id, initial_balance, opening in Account.objects.filter(
+            pk__in=first_days
+        ).annotate(
+            first_day=Case(
+                *(When(pk=account_id, then=Value(day)) for account_id, day in first_days.items()),
+                output_field=DateField(),
+            ),
+        ).annotate(
+            opening=Subquery(previous)
+        ).values_list('pk', 'initial_balance', 'opening')
+    }
+
+
+def _create_snapshots(keys):
+    """
+    Creates the snapshots of (account_id, day) keys, sorted, with the
+    closing balance before each day.
+    """
+    days = defaultdict(list)
+    for account_id, day in keys:
+        days[account_id].append(day)
+    opening = _opening_balances({account_id: dates[0] for account_id, dates in days.items()})
+
+    # Снимки между новыми днями одного счета: их баланс открывает следующий новый день
+    between = defaultdict(list)
+    ranges = [
+        Q(account_id=account_id, date__range=(dates[0], dates[-1]))
+        for account_id, dates in days.items() if len(dates) > 1
+    ]
+    if ranges:
+        for account_id, day, balance in AccountBalanceSnapshot.objects.filter(
+            reduce(or_, ranges)
+        ).order_by('date').values_list('account_id', 'date', 'balance'):
+            between[account_id].append((day, balance))
+
+    snapshots = []
+    for account_id, day in keys:
+        if account_id not in opening:
+            # Счет уже удален (каскадное удаление транзакций)
+            continue
+        earlier = between[account_id][:bisect_left(between[account_id], (day,))]
+        balance = earlier[-1][1] if earlier else opening[account_id]
+        snapshots.append(AccountBalanceSnapshot(account_id=account_id, date=day, balance=balance))
+    AccountBalanceSnapshot.objects.bulk_create(snapshots)
+
+
+def apply_snapshot_deltas(deltas):
+    """
+    Shifts the closing balance of the transaction day and every later
+    snapshot of the account by the delta.
+
+    Missing day snapshots are created first, then one UPDATE adds to
+    every snapshot the sum of the deltas on or before its date, so the
+    number of queries does not depend on the number of accounts and days.
+
+    Expects the account rows to be locked by the caller.
+    """
+    if not deltas:
+        return
+    keys = sorted(deltas)
+    days = defaultdict(list)
+    for account_id, day in keys:
+        days[account_id].append(day)
+
+    existing = set(AccountBalanceSnapshot.objects.filter(
+        account_id__in=days, date__in={day for _, day in keys}
+    ).values_list('account_id', 'date'))
+    missing = [key for key in keys if key not in existing]
+    if missing:
+        _create_snapshots(missing)
+
+    shifts = []
+    for account_id, dates in days.items():
+        cumulative = []
+        total = Decimal('0')
+        for day in dates:
+            total += deltas[account_id, day]
+            cumulative.append((day, total))
+        # Условия CASE проверяются по порядку: сначала самый поздний день счета
+        shifts.extend(
+            When(account_id=account_id, date__gte=day, then=Value(total))
+            for day, total in reversed(cumulative)
+        )
+    AccountBalanceSnapshot.objects.filter(reduce(or_, (
+        Q(account_id=account_id, date__gte=dates[0]) for account_id, dates in days.items()
+    ))).update(
+        balance=F('balance') + Case(
+            *shifts,
+            default=Value(Decimal('0')),
+            output_field=AccountBalanceSnapshot._meta.get_field('balance'),
+        )
+    )
+
+
+def rebuild_snapshots(accounts, batch_size=5000):
+    """Rebuilds snapshots of the accounts from the full transaction history"""
+    created = 0
+    for account in accounts:
+        AccountBalanceSnapshot.objects.filter(account=account).delete()
+
+        rows = Transaction.objects.filter(account=account).values('date').annotate(
+            income=Sum('amount', filter=Q(type=Type.INCOME)),
+            outcome=Sum('amount', filter=Q(type=Type.OUTCOME)),
+        ).order_by('date')
+
+        balance = account.initial_balance
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            balance += (row['income'] or Decimal('0')) - (row['outcome'] or Decimal('0'))
+            batch.append(
+                AccountBalanceSnapshot(account=account, date=row['date'], balance=balance)
+            )
+            if len(batch) >= batch_size:
+                AccountBalanceSnapshot.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        AccountBalanceSnapshot.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def balance_on_date(account, day):
+    """Balance at the end of the day, one indexed lookup"""
+    balance = account.balance_snapshots.filter(date__lte=day).order_by(
+        '-date'
+    ).values_list('balance', flat=True).first()
+    return account.initial_balance if balance is None else balance
+
+
+def balance_history(account, start, end):
+    """Daily closing balances from start to end (inclusive)"""
+    opening = balance_on_date(account, start - timedelta(days=1))
+    changes = dict(
+        account.balance_snapshots.filter(
+            date__range=(start, end)
+        ).values_list('date', 'balance')
+    )
+
+    labels, values = [], []
+    balance = opening
+    day = start
+    while day <= end:
+        balance = changes.get(day, balance)
+        labels.append(day.isoformat())
+        values.append(float(balance))
+        day += timedelta(days=1)
+    return {'labels': labels, 'balances': values}
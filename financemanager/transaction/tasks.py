@@ -1,71 +1,127 @@
-from celery import shared_task
+from datetime import date
+
+from celery import chord, shared_task
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from .models import RecurringTransaction, Transaction
+from financemanager.querycount import query_budget
+from .importers import DEFAULT_CHUNK_SIZE, StatementImporter, open_statement
+from .jobs import finish_run, start_run
+from .models import Account, JobStatus
+from .recurring import due_rule_ids, process_due_recurring, shard_ranges
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+RECURRING_JOB = 'process-recurring-transactions'
+
+
 @shared_task
-def process_recurring_transaction():
+@query_budget(8)
+def process_recurring_transaction(shard_size=None):
+    """Splits due rules into id-range shards and runs them as a chord"""
+    run = None
     try:
-        today = timezone.now().date()
+        run = start_run(RECURRING_JOB)
+        if run is None:
+            return "Обработка уже выполняется"
         
-        try:
-            recur_transactions = RecurringTransaction.objects.filter(
-                start_date__lte=today
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при получении повторяющихся транзакций: {e}")
-            return f"Ошибка: {e}"
+        today = timezone.now().date()
+        shards = shard_ranges(due_rule_ids(today), shard_size or settings.RECURRING_SHARD_SIZE)
         
-        created_count = 0
+        if not shards:
+            finish_run(run.id, stats={'date': today.isoformat(), 'shards': 0})
+            logger.info("Нет повторяющихся транзакций для обработки")
+            return "Создано транзакций: 0"
         
-        for t in recur_transactions:
-            try:
-                should_create = False
-                
-                if t.frequency == 'daily':
-                    should_create = True
-                elif t.frequency == 'weekly' and today.weekday() == 0:
-                    should_create = True
-                elif t.frequency == 'monthly' and today.day == t.start_date.day:
-                    should_create = True
-                elif t.frequency == 'yearly' and today.month == t.start_date.month and today.day == t.start_date.day:
-                    should_create = True
-                
-                if should_create:
-                    existing_transaction = Transaction.objects.filter(
-                        user=t.user,
-                        account=t.account,
-                        amount=t.amount,
-                        type=t.type,
-                        category=t.category,
-                        date=today
-                    ).first()
-                    
-                    if not existing_transaction:
-                        with transaction.atomic():
-                            Transaction.objects.create(
-                                account=t.account,
-                                user=t.user,
-                                amount=t.amount,
-                                type=t.type,
-                                category=t.category,
-                                description=f"{t.description} (автоматически создано)",
-                                date=today
-                            )
-                        created_count += 1
-                        logger.info(f"Создана повторяющаяся транзакция для пользователя {t.user.id}")
-                        
-            except Exception as e:
-                logger.error(f"Ошибка при создании транзакции для {t.id}: {e}")
-                continue
+        chord(
+            process_recurring_shard.s(first_id, last_id, today.isoformat())
+            for first_id, last_id in shards
+        )(
+            summarize_recurring_run.s(today.isoformat(), run.id).on_error(
+                recurring_run_failed.si(run.id)
+            )
+        )
         
-        logger.info(f"Обработка повторяющихся транзакций завершена. Создано: {created_count}")
-        return f"Создано транзакций: {created_count}"
+        logger.info(f"Запущено шардов повторяющихся транзакций: {len(shards)}")
+        return f"Запущено шардов: {len(shards)}"
         
     except Exception as e:
         logger.error(f"Критическая ошибка в process_recurring_transaction: {e}")
+        if run is not None:
+            finish_run(run.id, JobStatus.FAILED, error=str(e))
         return f"Критическая ошибка: {e}"
+
+
+@shared_task
+@query_budget(3)
+def process_recurring_shard(first_id, last_id, day):
+    result = {'first_id': first_id, 'last_id': last_id}
+    try:
+        result.update(process_due_recurring(date.fromisoformat(day), first_id, last_id))
+    except Exception as e:
+        logger.error(f"Ошибка в шарде повторяющихся транзакций {first_id}-{last_id}: {e}")
+        result.update(created=0, skipped=0, failed=0, error=str(e))
+    return result
+
+
+@shared_task
+def summarize_recurring_run(results, day, run_id=None):
+    summary = {
+        'date': day,
+        'shards': len(results),
+        'failed_shards': sum(1 for r in results if r.get('error')),
+        'created': sum(r['created'] for r in results),
+        'skipped': sum(r['skipped'] for r in results),
+        'failed': sum(r['failed'] for r in results),
+    }
+    logger.info(
+        f"Обработка повторяющихся транзакций за {day} завершена. "
+        f"Шардов: {summary['shards']}, создано: {summary['created']}, "
+        f"пропущено: {summary['skipped']}, ошибок: {summary['failed']}"
+    )
+    if run_id is not None:
+        finish_run(
+            run_id,
+            JobStatus.FAILED if summary['failed_shards'] else JobStatus.SUCCESS,
+            stats=summary,
+        )
+    return summary
+
+
+@shared_task
+def recurring_run_failed(run_id):
+    finish_run(run_id, JobStatus.FAILED, error="Шард или сводка завершились с ошибкой")
+
+
+@shared_task
+@query_budget(12)
+def import_transactions(path, account_id, format=None, chunk_size=DEFAULT_CHUNK_SIZE, **csv_options):
+    try:
+        account = Account.objects.get(id=account_id)
+    except Account.DoesNotExist:
+        logger.error(f"Счет {account_id} не найден")
+        return f"Ошибка: счет {account_id} не найден"
+
+    def report_progress(importer):
+        logger.info(
+            f"Импорт в счет {account_id}: {importer.imported} строк, "
+            f"{importer.rows_per_second:.0f} строк/с"
+        )
+
+    fileobj, rows = open_statement(path, format=format, **csv_options)
+    with fileobj:
+        importer = StatementImporter(
+            account, chunk_size=chunk_size, progress=report_progress
+        ).run(rows)
+
+    logger.info(
+        f"Импорт завершен: {importer.imported} строк за {importer.elapsed:.1f}с, "
+        f"пропущено: {importer.skipped}"
+    )
+    return {
+        'imported': importer.imported,
+        'skipped': importer.skipped,
+        'errors': importer.errors,
+        'elapsed': importer.elapsed,
+    }
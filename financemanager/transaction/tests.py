@@ -0,0 +1,880 @@
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from authapp.models import Currency
+from transaction.budgets import budget_progress
+from transaction.importers import StatementImporter, iter_csv_rows, iter_ofx_rows
+from transaction.models import (
+    Account, Budget, BudgetCategoryLimit, Category, MonthlyCategoryRollup,
+    JobRun, JobStatus, RecurringTransaction, RecurringTransactionOccurrence, Transaction, Type
+)
+from dashboard.snapshots import dashboard_payload
+from dashboard.tasks import rebuild_dashboard_snapshot
+from financemanager.querycount import (
+    QueryBudget, QueryBudgetExceeded, assert_query_budget, fingerprint,
+    query_batch,
+)
+from stats.views import stats_payload
+from transaction.jobs import finish_run, job_lock, start_run
+from transaction.ledger import bulk_create_transactions
+from transaction.pagination import InvalidCursor, paginate_keyset
+from transaction.recurring import next_occurrence, process_due_recurring, shard_ranges
+from transaction.tasks import process_recurring_transaction
+from transaction.rollups import category_totals, rebuild_rollups
+from transaction.search import FTS_TABLE, install_search_index, search_transactions
+from transaction.snapshots import balance_history, balance_on_date, rebuild_snapshots
+from transaction.filters import TransactionFilter
+from utils.benchmarks import p95, rolled_back
+from utils.query_plans import capture_full_scans
+
+User = get_user_model()
+
+
+class LedgerBalanceTests(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.create(name='USD', symbol='$')
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com',
+            currency=self.currency
+        )
+        self.account = Account.objects.create(
+            name='Main',
+            account_type='BANK',
+            user=self.user,
+            initial_balance=Decimal('100.00'),
+            balance=Decimal('100.00')
+        )
+        self.other_account = Account.objects.create(
+            name='Cash',
+            account_type='CASH',
+            user=self.user
+        )
+        self.food = Category.objects.create(name='Food', is_system=True, type=Type.OUTCOME)
+        self.salary = Category.objects.create(name='Salary', is_system=True, type=Type.INCOME)
+
+    def balance(self, account):
+        account.refresh_from_db()
+        return account.balance
+
+    def test_create_applies_delta(self):
+        Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.INCOME,
+            category=self.salary, amount=Decimal('50.00')
+        )
+        Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.OUTCOME,
+            category=self.food, amount=Decimal('20.00')
+        )
+        self.assertEqual(self.balance(self.account), Decimal('130.00'))
+
+    def test_update_amount_type_and_account(self):
+        trans = Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.OUTCOME,
+            amount=Decimal('20.00')
+        )
+        trans.amount = Decimal('25.00')
+        trans.save()
+        self.assertEqual(self.balance(self.account), Decimal('75.00'))
+
+        trans.type = Type.INCOME
+        trans.save()
+        self.assertEqual(self.balance(self.account), Decimal('125.00'))
+
+        trans.account = self.other_account
+        trans.save()
+        self.assertEqual(self.balance(self.account), Decimal('100.00'))
+        self.assertEqual(self.balance(self.other_account), Decimal('25.00'))
+
+    def test_delete_reverts_delta(self):
+        trans = Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.OUTCOME,
+            category=self.food, amount=Decimal('20.00')
+        )
+        trans.delete()
+        self.assertEqual(self.balance(self.account), Decimal('100.00'))
+
+    def test_cascade_delete_reverts_delta(self):
+        category = Category.objects.create(name='Pets', user=self.user, type=Type.OUTCOME)
+        Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.OUTCOME,
+            category=category, amount=Decimal('30.00')
+        )
+        category.delete()
+        self.assertEqual(self.balance(self.account), Decimal('100.00'))
+
+    def test_write_cost_does_not_depend_on_history(self):
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, account=self.account, type=Type.OUTCOME, amount=1)
+            for _ in range(500)
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            Transaction.objects.create(
+                user=self.user, account=self.account, type=Type.OUTCOME, amount=1
+            )
+        self.assertFalse(
+            any('SUM(' in q['sql'].upper() for q in ctx.captured_queries)
+        )
+
+    def test_batch_cost_does_not_depend_on_entries(self):
+        Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.OUTCOME,
+            category=self.food, amount=Decimal('1.00'), date=date(2025, 1, 5)
+        )
+        entries = [
+            Transaction(
+                user=self.user, account=account, type=type, category=category,
+                amount=Decimal('2.50'), date=date(2025, month, day)
+            )
+            for account in (self.account, self.other_account)
+            for month in (1, 2)
+            for day in range(1, 11)
+            for type, category in ((Type.OUTCOME, self.food), (Type.INCOME, self.salary))
+            if (day + month) % 3 or type == Type.OUTCOME
+        ]
+        with assert_query_budget(queries=15):
+            bulk_create_transactions(entries)
+
+        self.assertEqual(self.balance(self.account), Decimal('81.50'))
+        accounts = (self.account, self.other_account)
+        history = [balance_history(account, date(2025, 1, 1), date(2025, 2, 28)) for account in accounts]
+        rollups = sorted(MonthlyCategoryRollup.objects.values_list(
+            'month', 'category', 'type', 'total', 'count'
+        ), key=str)
+        rebuild_snapshots(accounts)
+        rebuild_rollups([self.user.id])
+        self.assertEqual(history, [
+            balance_history(account, date(2025, 1, 1), date(2025, 2, 28)) for account in accounts
+        ])
+        self.assertEqual(rollups, sorted(MonthlyCategoryRollup.objects.values_list(
+            'month', 'category', 'type', 'total', 'count'
+        ), key=str))
+
+    def test_update_balance_repairs_drift(self):
+        Transaction.objects.create(
+            user=self.user, account=self.account, type=Type.OUTCOME, amount=Decimal('20.00')
+        )
+        Account.objects.filter(pk=self.account.pk).update(balance=0)
+        self.account.refresh_from_db()
+        self.account.update_balance()
+        self.assertEqual(self.balance(self.account), Decimal('80.00'))
+
+
+class StatementImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.account = Account.objects.create(
+            name='Main',
+            account_type='BANK',
+            user=self.user,
+            initial_balance=Decimal('10.00'),
+            balance=Decimal('10.00')
+        )
+        self.food = Category.objects.create(name='Food', is_system=True, type=Type.OUTCOME)
+
+    def run_import(self, content, **options):
+        rows = iter_csv_rows(io.StringIO(content), **options)
+        return StatementImporter(self.account, chunk_size=2).run(rows)
+
+    def test_csv_import(self):
+        importer = self.run_import(
+            'date,amount,description,category\n'
+            '2025-01-01,-12.50,Lunch,food\n'
+            '2025-01-02,100,Salary,\n'
+            'broken,1,,\n'
+            '2025-01-03,-7.50,Dinner,Food\n'
+        )
+        self.assertEqual((importer.imported, importer.skipped), (3, 1))
+        self.assertEqual(
+            Transaction.objects.filter(account=self.account, category=self.food).count(), 2
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('90.00'))
+
+    def test_amount_overflow_skips_the_row(self):
+        importer = self.run_import(
+            'date,amount\n'
+            '2025-01-01,-2.00\n'
+            '2025-01-02,-12345678901234567.00\n'
+            '2025-01-03,-1.005\n'
+            '2025-01-04,-3.00\n'
+        )
+        self.assertEqual((importer.imported, importer.skipped), (2, 2))
+        self.assertTrue(importer.errors[0].startswith('3: Invalid amount'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('5.00'))
+
+    def test_chunk_fits_parameter_limit(self):
+        with assert_query_budget():
+            importer = StatementImporter(self.account, chunk_size=1000).run(iter_csv_rows(
+                io.StringIO('date,amount\n' + '2025-01-01,-0.01\n' * 1000)
+            ))
+        self.assertEqual(importer.imported, 1000)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('0.00'))
+
+    def test_failure_keeps_loaded_chunks(self):
+        def rows():
+            yield from iter_csv_rows(io.StringIO(
+                'date,amount\n2025-01-01,-2.00\n2025-01-02,-3.00\n'
+            ))
+            raise OSError('connection reset')
+
+        importer = StatementImporter(self.account, chunk_size=2)
+        with self.assertRaises(OSError):
+            importer.run(rows())
+
+        self.assertEqual(importer.imported, 2)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('5.00'))
+        self.assertEqual(balance_on_date(self.account, date(2025, 1, 2)), Decimal('5.00'))
+        self.assertEqual(
+            sum(row['total'] for row in category_totals(self.user.id)), Decimal('5.00')
+        )
+
+    def test_ofx_rows(self):
+        ofx = (
+            'OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>'
+            '<BANKTRANLIST>\n'
+            '<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20250105120000\n<TRNAMT>-20.00\n'
+            '<NAME>Shop\n</STMTTRN>\n'
+            '<STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20250106</DTPOSTED>'
+            '<TRNAMT>5.25</TRNAMT><MEMO>Refund</MEMO></STMTTRN>\n'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+        )
+        rows = [row for _, row in iter_ofx_rows(io.StringIO(ofx))]
+        self.assertEqual(
+            [(r['date'], r['amount'], r['type'], r['description']) for r in rows],
+            [
+                (date(2025, 1, 5), Decimal('20.00'), Type.OUTCOME, 'Shop'),
+                (date(2025, 1, 6), Decimal('5.25'), Type.INCOME, 'Refund'),
+            ]
+        )
+
+
+class BalanceSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.account = Account.objects.create(
+            name='Main',
+            account_type='BANK',
+            user=self.user,
+            initial_balance=Decimal('100.00'),
+            balance=Decimal('100.00')
+        )
+
+    def create(self, day, amount, type=Type.OUTCOME):
+        return Transaction.objects.create(
+            user=self.user, account=self.account, type=type,
+            amount=Decimal(amount), date=date(2025, 1, day)
+        )
+
+    def balance_on(self, day):
+        return balance_on_date(self.account, date(2025, 1, day))
+
+    def test_snapshots_follow_writes(self):
+        self.create(5, '10.00')
+        self.create(10, '50.00', Type.INCOME)
+        backdated = self.create(3, '5.00')
+
+        self.assertEqual(self.balance_on(1), Decimal('100.00'))
+        self.assertEqual(self.balance_on(3), Decimal('95.00'))
+        self.assertEqual(self.balance_on(7), Decimal('85.00'))
+        self.assertEqual(self.balance_on(31), Decimal('135.00'))
+
+        backdated.date = date(2025, 1, 8)
+        backdated.save()
+        self.assertEqual(self.balance_on(3), Decimal('100.00'))
+        self.assertEqual(self.balance_on(8), Decimal('85.00'))
+
+        backdated.delete()
+        self.assertEqual(self.balance_on(31), Decimal('140.00'))
+
+    def test_rebuild_matches_incremental(self):
+        for day, amount in [(2, '1.00'), (2, '2.50'), (4, '7.00'), (9, '3.00')]:
+            self.create(day, amount)
+        incremental = list(self.account.balance_snapshots.values_list('date', 'balance'))
+
+        rebuild_snapshots([self.account])
+        rebuilt = list(self.account.balance_snapshots.values_list('date', 'balance'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_balance_history(self):
+        self.create(2, '10.00')
+        history = balance_history(self.account, date(2025, 1, 1), date(2025, 1, 3))
+        self.assertEqual(history['labels'], ['2025-01-01', '2025-01-02', '2025-01-03'])
+        self.assertEqual(history['balances'], [100.0, 90.0, 90.0])
+
+
+class MonthlyRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.account = Account.objects.create(
+            name='Main',
+            account_type='BANK',
+            user=self.user
+        )
+        self.food = Category.objects.create(name='Food', user=self.user, type=Type.OUTCOME)
+
+    def create(self, day, amount, category=None, type=Type.OUTCOME):
+        return Transaction.objects.create(
+            user=self.user, account=self.account, type=type, category=category,
+            amount=Decimal(amount), date=day
+        )
+
+    def rollups(self):
+        return sorted(
+            MonthlyCategoryRollup.objects.filter(count__gt=0).values_list(
+                'month', 'category_id', 'type', 'total', 'count'
+            ),
+            key=str
+        )
+
+    def raw_totals(self, date_from, date_to):
+        totals = {}
+        for trans in Transaction.objects.filter(date__range=(date_from, date_to)):
+            total, count = totals.get((trans.category_id, trans.type), (Decimal('0'), 0))
+            totals[trans.category_id, trans.type] = total + trans.amount, count + 1
+        return totals
+
+    def test_rebuild_matches_incremental(self):
+        self.create(date(2025, 1, 5), '10.00', self.food)
+        self.create(date(2025, 1, 20), '5.00')
+        moved = self.create(date(2025, 2, 1), '7.00', self.food)
+        self.create(date(2025, 2, 3), '100.00', type=Type.INCOME)
+        moved.date = date(2025, 3, 1)
+        moved.category = None
+        moved.save()
+        incremental = self.rollups()
+
+        rebuild_rollups([self.user.id])
+        self.assertEqual(incremental, self.rollups())
+
+    def test_category_totals_with_partial_months(self):
+        for day in (date(2025, 1, 1), date(2025, 1, 14), date(2025, 1, 31),
+                    date(2025, 2, 15), date(2025, 3, 10), date(2025, 3, 11)):
+            self.create(day, '3.50', self.food)
+            self.create(day, '1.25')
+
+        for date_from, date_to in [
+            (date(2025, 1, 14), date(2025, 3, 10)),
+            (date(2025, 1, 1), date(2025, 2, 28)),
+            (date(2025, 1, 2), date(2025, 1, 31)),
+            (date(2025, 3, 10), date(2025, 3, 10)),
+        ]:
+            totals = {
+                (row['category_id'], row['type']): (row['total'], row['count'])
+                for row in category_totals(self.user.id, date_from, date_to)
+            }
+            self.assertEqual(totals, self.raw_totals(date_from, date_to))
+
+    def test_category_delete_drops_rollups(self):
+        self.create(date(2025, 1, 5), '10.00', self.food)
+        self.food.delete()
+        self.assertFalse(MonthlyCategoryRollup.objects.exists())
+
+
+class BudgetProgressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        other = User.objects.create_user(password='testpass2', email='testuser2@example.com')
+        self.food = Category.objects.create(name='Food', user=self.user, type=Type.OUTCOME)
+        self.fun = Category.objects.create(name='Fun', user=self.user, type=Type.OUTCOME)
+        self.january = Budget.objects.create(
+            name='January', user=self.user, period_type='MONTHLY',
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 31),
+            total_expense_limit=Decimal('100.00')
+        )
+        self.quarter = Budget.objects.create(
+            name='Quarter', user=self.user, period_type='QUARTERLY',
+            start_date=date(2025, 1, 15), end_date=date(2025, 3, 31)
+        )
+        self.limit = BudgetCategoryLimit.objects.create(
+            budget=self.january, category=self.food, limit_amount=Decimal('20.00')
+        )
+        for user, day, type, category, amount in [
+            (self.user, date(2025, 1, 10), Type.OUTCOME, self.food, '15.00'),
+            (self.user, date(2025, 1, 20), Type.OUTCOME, self.food, '10.00'),
+            (self.user, date(2025, 1, 20), Type.OUTCOME, self.fun, '5.00'),
+            (self.user, date(2025, 2, 1), Type.INCOME, None, '300.00'),
+            (self.user, date(2025, 4, 1), Type.OUTCOME, None, '1.00'),
+            (other, date(2025, 1, 20), Type.OUTCOME, None, '50.00'),
+        ]:
+            Transaction.objects.create(
+                user=user, type=type, category=category, amount=Decimal(amount), date=day
+            )
+
+    def test_matches_per_budget_aggregates(self):
+        budgets = [self.january, self.quarter]
+        with self.assertNumQueries(1):
+            progress = budget_progress(budgets)
+
+        for budget in budgets:
+            self.assertEqual(progress[budget.id].spent, budget.get_spent_amount())
+            self.assertEqual(progress[budget.id].income, budget.get_income_amount())
+            self.assertEqual(progress[budget.id].remaining, budget.get_remaining_budget())
+
+        [item] = progress[self.january.id].category_progress([self.limit])
+        self.assertEqual(item['spent'], self.limit.get_spent_amount())
+        self.assertEqual(item['remaining'], self.limit.get_remaining_limit())
+        self.assertTrue(item['over_budget'])
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('transaction:budget-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['budgets'][1].progress.spent, Decimal('30.00'))
+
+        response = self.client.get(reverse('transaction:budget-detail', args=[self.january.pk]))
+        self.assertEqual(response.context['spent_amount'], Decimal('30.00'))
+        self.assertEqual(response.context['category_progress'][0]['spent'], Decimal('25.00'))
+
+        response = self.client.get(reverse('transaction:budget-progress-api', args=[self.quarter.pk]))
+        self.assertEqual(response.json(), {
+            'spent': 15.0, 'income': 300.0, 'remaining': 0.0, 'total_limit': 0.0
+        })
+
+
+class RecurringSchedulerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.account = Account.objects.create(
+            name='Main',
+            account_type='BANK',
+            user=self.user,
+            initial_balance=Decimal('100.00'),
+            balance=Decimal('100.00')
+        )
+        self.today = date(2025, 1, 10)
+
+    def rule(self, **kwargs):
+        options = {
+            'user': self.user, 'account': self.account, 'amount': Decimal('5.00'),
+            'type': Type.OUTCOME, 'description': 'Coffee', 'frequency': 'daily',
+            'start_date': date(2025, 1, 1), 'next_run_date': date(2025, 1, 8),
+        }
+        options.update(kwargs)
+        return RecurringTransaction.objects.create(**options)
+
+    def test_next_occurrence(self):
+        self.assertEqual(
+            next_occurrence('weekly', date(2025, 1, 1), date(2025, 1, 8)), date(2025, 1, 13)
+        )
+        self.assertEqual(
+            next_occurrence('monthly', date(2025, 1, 31), date(2025, 2, 1)), date(2025, 3, 31)
+        )
+        self.assertEqual(
+            next_occurrence('yearly', date(2024, 2, 29), date(2024, 3, 1)), date(2028, 2, 29)
+        )
+
+    def test_new_rule_starts_from_today(self):
+        rule = RecurringTransaction.objects.create(
+            user=self.user, amount=1, frequency='daily', start_date=date(2000, 1, 1)
+        )
+        self.assertEqual(rule.next_run_date, timezone.now().date())
+
+    def test_schedule_edit_recomputes_next_run(self):
+        today = timezone.now().date()
+        rule = RecurringTransaction.objects.get(pk=self.rule().pk)
+        rule.description = 'Tea'
+        rule.save()
+        self.assertEqual(rule.next_run_date, date(2025, 1, 8))
+
+        rule.start_date = today + timedelta(days=3)
+        rule.save(update_fields=['start_date'])
+        rule.refresh_from_db()
+        self.assertEqual(rule.next_run_date, today + timedelta(days=3))
+
+        rule.end_date = today
+        rule.save()
+        self.assertIsNone(RecurringTransaction.objects.get(pk=rule.pk).next_run_date)
+
+    def test_catch_up_is_idempotent(self):
+        rule = self.rule()
+        stats = process_due_recurring(self.today)
+        self.assertEqual(stats, {'created': 3, 'skipped': 0, 'failed': 0})
+        self.assertEqual(
+            list(Transaction.objects.order_by('date').values_list('date', flat=True)),
+            [date(2025, 1, 8), date(2025, 1, 9), date(2025, 1, 10)]
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('85.00'))
+        rule.refresh_from_db()
+        self.assertEqual(rule.next_run_date, date(2025, 1, 11))
+
+        self.assertEqual(process_due_recurring(self.today)['created'], 0)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_existing_occurrence_is_skipped(self):
+        rule = self.rule()
+        RecurringTransactionOccurrence.objects.create(recurring=rule, date=date(2025, 1, 9))
+        stats = process_due_recurring(self.today)
+        self.assertEqual((stats['created'], stats['skipped']), (2, 1))
+
+    def test_category_type_mismatch_is_skipped(self):
+        salary = Category.objects.create(name='Salary', user=self.user, type=Type.INCOME)
+        bad = self.rule(category=salary)
+        good = self.rule()
+        with self.assertLogs('transaction.recurring', 'ERROR'):
+            stats = process_due_recurring(self.today)
+        self.assertEqual(stats, {'created': 3, 'skipped': 0, 'failed': 1})
+        self.assertFalse(Transaction.objects.filter(category=salary).exists())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('85.00'))
+        bad.refresh_from_db()
+        self.assertEqual(bad.next_run_date, date(2025, 1, 8))
+        good.refresh_from_db()
+        self.assertEqual(good.next_run_date, date(2025, 1, 11))
+
+    def test_end_date(self):
+        rule = self.rule(end_date=date(2025, 1, 9))
+        self.assertEqual(process_due_recurring(self.today)['created'], 2)
+        rule.refresh_from_db()
+        self.assertIsNone(rule.next_run_date)
+
+    def test_sharded_run(self):
+        rules = [self.rule(next_run_date=timezone.now().date()) for _ in range(5)]
+        ids = [rule.id for rule in rules]
+        self.assertEqual(
+            shard_ranges(ids, 2), [(ids[0], ids[1]), (ids[2], ids[3]), (ids[4], ids[4])]
+        )
+
+        app = process_recurring_transaction.app
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+        self.assertEqual(process_recurring_transaction(shard_size=2), 'Запущено шардов: 3')
+        self.assertEqual(Transaction.objects.count(), 5)
+
+        run = JobRun.objects.get()
+        self.assertEqual(run.status, JobStatus.SUCCESS)
+        self.assertEqual((run.stats['shards'], run.stats['created']), (3, 5))
+
+
+class JobRunTests(TestCase):
+    def test_lock_is_exclusive(self):
+        with job_lock('job') as first:
+            with job_lock('job') as second:
+                self.assertTrue(first)
+                self.assertFalse(second)
+        with job_lock('job') as again:
+            self.assertTrue(again)
+
+    def test_overlapping_run_is_skipped(self):
+        run = start_run('job')
+        self.assertIsNone(start_run('job'))
+        finish_run(run.id, stats={'created': 1})
+
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.stats), (JobStatus.SUCCESS, {'created': 1}))
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(JobRun.objects.filter(status=JobStatus.SKIPPED).count(), 1)
+        self.assertIsNotNone(start_run('job'))
+
+    def test_stale_run_does_not_block(self):
+        JobRun.objects.create(name='job', started_at=timezone.now() - timedelta(days=1))
+        self.assertIsNotNone(start_run('job'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        for day, amount in [(1, '5.00'), (1, '3.00'), (2, '5.00'), (3, '1.00'), (3, '2.00')]:
+            Transaction.objects.create(
+                user=self.user, type=Type.OUTCOME,
+                amount=Decimal(amount), date=date(2025, 1, day)
+            )
+        self.qs = Transaction.objects.filter(user=self.user)
+
+    def collect(self, ordering=None, page_size=2):
+        rows, cursor = [], None
+        while True:
+            page = paginate_keyset(self.qs, cursor, page_size=page_size, ordering=ordering)
+            rows.extend(page)
+            if page.next_cursor is None:
+                return rows
+            cursor = page.next_cursor
+
+    def test_pages_cover_all_rows_in_order(self):
+        for ordering, key in [
+            ('-date', lambda t: (t.date, t.id)),
+            ('amount', lambda t: (-t.amount, -t.id)),
+        ]:
+            with self.subTest(ordering=ordering):
+                rows = self.collect(ordering)
+                self.assertEqual(rows, sorted(self.qs, key=key, reverse=True))
+
+    def test_deep_page_uses_no_offset(self):
+        page = paginate_keyset(self.qs, page_size=2)
+        with CaptureQueriesContext(connection) as queries:
+            paginate_keyset(self.qs, page.next_cursor, page_size=2)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+    def test_cursor_of_other_ordering_is_rejected(self):
+        cursor = paginate_keyset(self.qs, page_size=2).next_cursor
+        with self.assertRaises(InvalidCursor):
+            paginate_keyset(self.qs, cursor, ordering='amount')
+        with self.assertRaises(InvalidCursor):
+            paginate_keyset(self.qs, 'garbage')
+
+    def test_list_fragment_scrolls(self):
+        self.client.force_login(self.user)
+        url = reverse('transaction:trans-list-part')
+        with mock.patch('transaction.pagination.DEFAULT_PAGE_SIZE', 3):
+            response = self.client.get(url, {'sort_by': '-amount'})
+            self.assertContains(response, '<table')
+            self.assertEqual(len(response.context['page']), 3)
+
+            response = self.client.get(response.context['next_url'])
+            self.assertNotContains(response, '<table')
+            self.assertEqual(len(response.context['page']), 2)
+            self.assertIsNone(response.context['next_url'])
+
+        response = self.client.get(url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """Hot queries must be index searches, not full scans, on a larger dataset"""
+
+    TABLES = {
+        Transaction._meta.db_table, Account._meta.db_table, Budget._meta.db_table
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create_user(password='testpass1', email=f'plan{n}@example.com')
+            for n in range(20)
+        ]
+        cls.user = users[0]
+        food = Category.objects.create(name='Food', is_system=True, type=Type.OUTCOME)
+
+        transactions = []
+        for user in users:
+            accounts = [
+                Account.objects.create(name=f'Account {n}', user=user, is_active=n < 2)
+                for n in range(3)
+            ]
+            Budget.objects.create(
+                name='Old', user=user, period_type='MONTHLY',
+                start_date=date(2020, 1, 1), end_date=date(2020, 1, 31)
+            )
+            for n in range(300):
+                transactions.append(Transaction(
+                    user=user,
+                    account=accounts[n % 3],
+                    category=food if n % 2 else None,
+                    type=Type.OUTCOME if n % 4 else Type.INCOME,
+                    amount=Decimal(n % 50 + 1),
+                    date=timezone.now().date() - timedelta(days=n % 120),
+                    description=f'Payment {n} coffee' if n % 10 == 0 else f'Payment {n}',
+                ))
+        Transaction.objects.bulk_create(transactions)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoFullScans(self, func):
+        with capture_full_scans(self.TABLES) as scans:
+            func()
+        self.assertEqual(scans, [])
+
+    def test_stats_queries(self):
+        today = timezone.now().date()
+        params = QueryDict(f'date_from={today - timedelta(days=30)}&type=OUTCOME')
+        self.assertNoFullScans(lambda: stats_payload(self.user.id, params))
+
+    def test_dashboard_queries(self):
+        params = QueryDict(f'date={timezone.now().date()}')
+        self.assertNoFullScans(lambda: dashboard_payload(self.user.id, params))
+
+    def test_search_queries(self):
+        qs = Transaction.objects.filter(user=self.user)
+        self.assertNoFullScans(lambda: list(search_transactions(qs, 'coff')))
+
+    def test_list_queries(self):
+        qs = Transaction.objects.filter(user=self.user)
+        for ordering in ('-date', 'amount'):
+            with self.subTest(ordering=ordering):
+                page = paginate_keyset(qs, page_size=20, ordering=ordering)
+                self.assertNoFullScans(
+                    lambda: paginate_keyset(qs, page.next_cursor, page_size=20, ordering=ordering)
+                )
+
+
+class DescriptionSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.other = User.objects.create_user(
+            password='testpass2',
+            email='testuser2@example.com'
+        )
+        for user, description in [
+            (self.user, 'Coffee at Starbucks'),
+            (self.user, 'Coffee beans, coffee filters and more coffee'),
+            (self.user, 'Taxi to airport'),
+            (self.user, 'Кофе с собой'),
+            (self.user, None),
+            (self.other, 'Coffee'),
+        ]:
+            Transaction.objects.create(
+                user=user, type=Type.OUTCOME, amount=Decimal('1.00'), description=description
+            )
+        self.qs = Transaction.objects.filter(user=self.user)
+
+    def descriptions(self, query, **kwargs):
+        return sorted(t.description for t in search_transactions(self.qs, query, **kwargs))
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.descriptions('COF'), [
+            'Coffee at Starbucks', 'Coffee beans, coffee filters and more coffee'
+        ])
+        self.assertEqual(self.descriptions('coffee star'), ['Coffee at Starbucks'])
+        self.assertEqual(self.descriptions('коф'), ['Кофе с собой'])
+        self.assertEqual(self.descriptions('tea'), [])
+
+    def test_ranking(self):
+        results = search_transactions(self.qs, 'coffee').order_by('-search_rank')
+        self.assertEqual(
+            results[0].description, 'Coffee beans, coffee filters and more coffee'
+        )
+
+    def test_index_follows_writes(self):
+        taxi = self.qs.get(description='Taxi to airport')
+        taxi.description = 'Coffee to go'
+        taxi.save()
+        self.qs.get(description='Coffee at Starbucks').delete()
+        self.assertEqual(self.descriptions('coffee', rank=False), [
+            'Coffee beans, coffee filters and more coffee', 'Coffee to go'
+        ])
+        self.assertEqual(self.descriptions('taxi'), [])
+
+    def test_punctuation_falls_back_to_icontains(self):
+        self.assertEqual(self.descriptions(','), ['Coffee beans, coffee filters and more coffee'])
+
+    def test_transaction_filter(self):
+        transaction_filter = TransactionFilter({'description': 'star'}, queryset=self.qs)
+        self.assertEqual(
+            [t.description for t in transaction_filter.qs], ['Coffee at Starbucks']
+        )
+
+    def test_restores_dropped_triggers(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 triggers exist on SQLite only')
+        with connection.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER {FTS_TABLE}_{suffix}')
+        Transaction.objects.create(
+            user=self.user, type=Type.OUTCOME, amount=Decimal('1.00'), description='Coffee again'
+        )
+        install_search_index(connection)
+        self.assertIn('Coffee again', self.descriptions('again'))
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            password='testpass1',
+            email='testuser1@example.com'
+        )
+        self.client.force_login(self.user)
+        for n in range(8):
+            category = Category.objects.create(name=f'Category {n}', user=self.user, type=Type.OUTCOME)
+            Transaction.objects.create(
+                user=self.user, category=category, type=Type.OUTCOME, amount=Decimal('1.00')
+            )
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 5 AND name = 'it''s'  AND x IN (%s, %s, %s)"),
+            fingerprint("SELECT * FROM t WHERE id = 17 AND name = 'b' AND x IN (%s)"),
+        )
+
+    def test_n_plus_one_loop_fails(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget():
+                [t.category.name for t in Transaction.objects.filter(user=self.user)]
+
+        with assert_query_budget(queries=1):
+            [t.category.name for t in Transaction.objects.filter(user=self.user).select_related('category')]
+
+    def test_category_page_has_no_n_plus_one(self):
+        # Шаблон списка проверял cat.user и загружал пользователя на каждую строку
+        with assert_query_budget():
+            self.assertEqual(self.client.get(reverse('transaction:category')).status_code, 200)
+
+    def test_view_over_budget(self):
+        url = reverse('transaction:trans-list-part')
+        with mock.patch.object(resolve(url).func, 'query_budget', QueryBudget(2)):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(url)
+
+            with override_settings(QUERY_BUDGET_STRICT=False):
+                with self.assertLogs('financemanager.querycount', 'WARNING') as logs:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIn('transaction:trans-list-part', logs.output[0])
+
+    def test_query_batch_is_checked_on_its_own(self):
+        with assert_query_budget(queries=2) as log:
+            list(Transaction.objects.filter(user=self.user))
+            for category in Category.objects.filter(user=self.user)[:3]:
+                with query_batch('batch', queries=1):
+                    list(category.transaction_set.all())
+        self.assertEqual((log.own_count, log.nested), (2, 3))
+
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_batch('batch', queries=1):
+                list(Category.objects.filter(user=self.user))
+                list(Transaction.objects.filter(user=self.user))
+
+    def test_task_over_budget(self):
+        with mock.patch.object(rebuild_dashboard_snapshot.run, 'query_budget', QueryBudget(1)):
+            with self.assertRaises(QueryBudgetExceeded):
+                rebuild_dashboard_snapshot(self.user.id)
+
+
+class BenchmarkHelperTests(TestCase):
+    def test_p95_is_nearest_rank(self):
+        self.assertEqual(p95([]), 0)
+        self.assertEqual(p95([3]), 3)
+        self.assertEqual(p95([5, 1, 4, 2, 3]), 5)
+        self.assertEqual(p95(range(1, 21)), 19)
+        self.assertEqual(p95(range(1, 101)), 95)
+
+    def test_rolled_back(self):
+        with rolled_back():
+            User.objects.create_user(password='testpass1', email='testuser1@example.com')
+            self.assertTrue(User.objects.exists())
+        self.assertFalse(User.objects.exists())
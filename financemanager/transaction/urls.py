@@ -10,6 +10,7 @@ urlpatterns = [
     path('create/', views.TransactionCreate.as_view(), name='create-trans'),
     path('create-rec/', views.RecurringTransactionCreate.as_view(), name='create-rec-trans'),
     path('history/', views.transaction_list, name='trans-list'),
+    path('history/export/', views.transaction_export, name='trans-export'),
     path('transaction/delete/<pk>', views.transaction_delete, name='trans-delete'),
     path('recur-trans/delete/<pk>', views.recur_transaction_delete, name='recur-trans-delete'),
     path('category/', views.CategoryView.as_view(), name='category'),
@@ -30,6 +31,7 @@ urlpatterns = [
     path('budgets/<int:pk>/delete/', views.budget_delete, name='budget-delete'),
     
     path('api/account/<int:account_id>/balance/', views.get_account_balance, name='account-balance-api'),
+    path('api/account/<int:account_id>/balance-history/', views.account_balance_history, name='account-balance-history-api'),
     path('api/budget/<int:budget_id>/progress/', views.budget_progress_api, name='budget-progress-api'),
     
 ]
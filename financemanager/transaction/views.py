@@ -1,3 +1,4 @@
+from datetime import date, timedelta
 from decimal import Decimal
 
 from django.contrib import messages
@@ -5,14 +6,21 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db import IntegrityError, connection
 from django.db.models import Q, Sum
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, UpdateView
 from django.views.generic.list import ListView
+from financemanager.querycount import query_budget
+from financemanager.routers import replica_reads
+from stats.conditional import user_data_condition
 
+from .budgets import budget_progress
+from .exporters import EXPORT_FORMATS, export_response
 from .filters import TransactionFilter
 from .forms import (
     AccountForm,
@@ -23,6 +31,7 @@ from .forms import (
     RecuringTransactionForm,
     TransactionCreateForm,
 )
+from .ledger import ledger_changed
 from .models import (
     Account,
     Budget,
@@ -32,6 +41,8 @@ from .models import (
     Transaction,
     Type,
 )
+from .pagination import InvalidCursor, paginate_keyset
+from .snapshots import balance_history
 
 
 class AccountListView(LoginRequiredMixin, ListView):
@@ -70,6 +81,7 @@ class AccountUpdateView(LoginRequiredMixin, UpdateView):
         return super().form_valid(form)
 
 
+@query_budget(12)
 class AccountDetailView(LoginRequiredMixin, DetailView):
     model = Account
     template_name = "transaction/account_detail.html"
@@ -130,6 +142,8 @@ def account_delete(request, pk):
     return redirect("transaction:account-list")
 
 
+@method_decorator(replica_reads, name="get")
+@query_budget(9)
 class BudgetListView(LoginRequiredMixin, ListView):
     model = Budget
     template_name = "transaction/budget_list.html"
@@ -138,6 +152,15 @@ class BudgetListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         return Budget.objects.filter(user=self.request.user).order_by("-start_date")
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        budgets = list(context["budgets"])
+        progress = budget_progress(budgets)
+        for budget in budgets:
+            budget.progress = progress[budget.id]
+        context["budgets"] = budgets
+        return context
+
 
 class BudgetCreateView(LoginRequiredMixin, CreateView):
     model = Budget
@@ -223,6 +246,8 @@ class BudgetUpdateView(LoginRequiredMixin, UpdateView):
         return context
 
 
+@method_decorator(replica_reads, name="get")
+@query_budget(11)
 class BudgetDetailView(LoginRequiredMixin, DetailView):
     model = Budget
     template_name = "transaction/budget_detail.html"
@@ -233,31 +258,13 @@ class BudgetDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        budget = self.get_object()
-
-        spent_amount = budget.get_spent_amount()
-        income_amount = budget.get_income_amount()
-        remaining_budget = budget.get_remaining_budget()
+        budget = self.object
 
-        category_limits = BudgetCategoryLimit.objects.filter(budget=budget)
-        category_progress = []
-
-        for limit in category_limits:
-            spent = limit.get_spent_amount()
-            remaining = limit.get_remaining_limit()
-            percentage = (
-                (spent / limit.limit_amount * 100) if limit.limit_amount > 0 else 0
-            )
-
-            category_progress.append(
-                {
-                    "limit": limit,
-                    "spent": spent,
-                    "remaining": remaining,
-                    "percentage": min(percentage, 100),
-                    "over_budget": spent > limit.limit_amount,
-                }
-            )
+        progress = budget_progress([budget])[budget.id]
+        category_limits = BudgetCategoryLimit.objects.filter(
+            budget=budget
+        ).select_related("category")
+        category_progress = progress.category_progress(category_limits)
 
         transactions = (
             Transaction.objects.filter(
@@ -269,14 +276,12 @@ class BudgetDetailView(LoginRequiredMixin, DetailView):
 
         context.update(
             {
-                "spent_amount": spent_amount,
-                "income_amount": income_amount,
-                "remaining_budget": remaining_budget,
+                "spent_amount": progress.spent,
+                "income_amount": progress.income,
+                "remaining_budget": progress.remaining,
                 "category_progress": category_progress,
                 "transactions": transactions,
-                "budget_percentage": (spent_amount / budget.total_expense_limit * 100)
-                if budget.total_expense_limit and budget.total_expense_limit > 0
-                else 0,
+                "budget_percentage": progress.percentage,
             }
         )
 
@@ -334,6 +339,8 @@ class TransactionCreate(LoginRequiredMixin, CreateView):
                         form.instance.description or "",
                     ],
                 )
+            # Процедура пишет мимо ORM, поэтому сигналы моделей не срабатывают
+            ledger_changed.send(sender=Transaction, user_ids={self.request.user.id})
 
             messages.success(self.request, "Transaction created successfully!")
             return redirect(self.success_url)
@@ -348,12 +355,7 @@ def transaction_delete(request, pk):
     trans = get_object_or_404(Transaction, id=pk, user=request.user)
 
     if request.method == "POST":
-        account = trans.account
         trans.delete()
-
-        if account:
-            account.update_balance()
-
         messages.success(request, "Transaction deleted successfully!")
 
     list_filter = TransactionFilter(
@@ -361,12 +363,11 @@ def transaction_delete(request, pk):
         queryset=Transaction.objects.filter(user=request.user).order_by("-date"),
     )
 
-    return render(
-        request, "transaction/transaction_list_part.html", {"list_filter": list_filter}
-    )
+    return render_transaction_page(request, list_filter)
 
 
 @login_required
+@user_data_condition
 def get_categories_by_type(request):
     transaction_type = request.GET.get("type")
     user_categories = Category.objects.filter(
@@ -378,6 +379,7 @@ def get_categories_by_type(request):
 
 
 @login_required
+@user_data_condition
 def get_account_balance(request, account_id):
     try:
         account = Account.objects.get(id=account_id, user=request.user)
@@ -392,14 +394,43 @@ def get_account_balance(request, account_id):
 
 
 @login_required
+@replica_reads
+@user_data_condition
+@query_budget(10)
+def account_balance_history(request, account_id):
+    account = get_object_or_404(Account, id=account_id, user=request.user)
+
+    end_date = timezone.now().date()
+    try:
+        if request.GET.get("end"):
+            end_date = date.fromisoformat(request.GET["end"])
+        start_date = (
+            date.fromisoformat(request.GET["start"])
+            if request.GET.get("start")
+            else end_date - timedelta(days=30)
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid date"}, status=400)
+
+    if start_date > end_date or (end_date - start_date).days > 3660:
+        return JsonResponse({"error": "Invalid date range"}, status=400)
+
+    return JsonResponse(balance_history(account, start_date, end_date))
+
+
+@login_required
+@replica_reads
+@user_data_condition
+@query_budget(9)
 def budget_progress_api(request, budget_id):
     try:
         budget = Budget.objects.get(id=budget_id, user=request.user)
+        progress = budget_progress([budget])[budget.id]
 
         data = {
-            "spent": float(budget.get_spent_amount()),
-            "income": float(budget.get_income_amount()),
-            "remaining": float(budget.get_remaining_budget() or 0),
+            "spent": float(progress.spent),
+            "income": float(progress.income),
+            "remaining": float(progress.remaining or 0),
             "total_limit": float(budget.total_expense_limit or 0),
         }
 
@@ -501,6 +532,7 @@ def recur_transaction_delete(request, pk):
 
 
 @login_required
+@query_budget(8)
 def transaction_list(request):
     filter = TransactionFilter(
         request.GET,
@@ -510,13 +542,60 @@ def transaction_list(request):
     return render(request, "transaction/transaction_list.html", {"filter": filter})
 
 
+def render_transaction_page(request, list_filter):
+    """
+    Renders one keyset page of the filtered list: the whole table for the
+    first page, only the next rows for ?cursor= requests of infinite scroll.
+    """
+    sort_by = None
+    if list_filter.is_valid():
+        sort_by = list_filter.form.cleaned_data.get("sort_by")
+    cursor = request.GET.get("cursor")
+    try:
+        page = paginate_keyset(
+            list_filter.qs.select_related("category"),
+            cursor=cursor,
+            ordering=sort_by[0] if sort_by else None,
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    next_url = None
+    if page.next_cursor:
+        query = request.GET.copy()
+        query["cursor"] = page.next_cursor
+        next_url = f"{reverse('transaction:trans-list-part')}?{query.urlencode()}"
+
+    template = (
+        "transaction/transaction_list_rows.html"
+        if cursor
+        else "transaction/transaction_list_part.html"
+    )
+    return render(request, template, {"page": page, "next_url": next_url})
+
+
 @login_required
+@replica_reads
+@user_data_condition
+@query_budget(8)
 def transaction_list_part(request):
     list_filter = TransactionFilter(
         request.GET,
         queryset=Transaction.objects.filter(user=request.user).order_by("-date"),
         user=request.user,
     )
-    return render(
-        request, "transaction/transaction_list_part.html", {"list_filter": list_filter}
+    return render_transaction_page(request, list_filter)
+
+
+@login_required
+def transaction_export(request):
+    export_format = request.GET.get("export_format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unsupported export format")
+
+    list_filter = TransactionFilter(
+        request.GET,
+        queryset=Transaction.objects.filter(user=request.user).order_by("-date"),
+        user=request.user,
     )
+    return export_response(list_filter.qs, export_format)
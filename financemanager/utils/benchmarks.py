@@ -0,0 +1,27 @@
+import math
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Runs the block in a transaction that is always rolled back"""
+    try:
+        with transaction.atomic(using=using):
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def p95(timings):
+    """95th percentile by the nearest-rank method, 0 for no timings"""
+    if not timings:
+        return 0
+    ordered = sorted(timings)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
@@ -0,0 +1,97 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_worker = threading.local()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.CONCURRENT_QUERY_WORKERS,
+                thread_name_prefix='queries',
+            )
+    return _executor
+
+
+def _in_transaction():
+    return any(
+        connection.in_atomic_block
+        for connection in connections.all(initialized_only=True)
+    )
+
+
+def shutdown_workers():
+    """Stops the worker threads, their connections are closed with them"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _keep_connections():
+    # CONN_MAX_AGE=0 закрыл бы соединение после каждого вызова: поток продлевает
+    # срок своих соединений до QUERY_WORKER_CONN_MAX_AGE от их открытия
+    opened = getattr(_worker, 'opened', {})
+    _worker.opened = {}
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is None:
+            continue
+        key = connection.alias, id(connection.connection)
+        close_at = opened.get(key, time.monotonic() + settings.QUERY_WORKER_CONN_MAX_AGE)
+        _worker.opened[key] = connection.close_at = close_at
+
+
+def _run_in_worker(context, call):
+    # Неисправные и истекшие соединения закрываются, как после запроса
+    _worker.active = True
+    close_old_connections()
+    try:
+        return context.run(call)
+    finally:
+        _keep_connections()
+        close_old_connections()
+        _worker.active = False
+
+
+def run_queries(*calls):
+    """
+    Runs independent callables that query the database and returns their
+    results in order.
+
+    Calls run concurrently in a thread pool of CONCURRENT_QUERY_WORKERS
+    threads, each on its own connection, so the total time approaches the
+    slowest call instead of the sum. Workers keep their connections for
+    QUERY_WORKER_CONN_MAX_AGE seconds instead of connecting per call.
+    Context variables (read replica scope, active language) are passed to
+    the workers.
+
+    Inside a transaction other connections do not see its writes, so the
+    calls run one by one in the current thread, as they do in the workers
+    themselves.
+    """
+    if (
+        len(calls) < 2
+        or settings.CONCURRENT_QUERY_WORKERS < 2
+        or getattr(_worker, 'active', False)
+        or _in_transaction()
+    ):
+        return [call() for call in calls]
+
+    executor = _get_executor()
+    futures = [
+        executor.submit(_run_in_worker, contextvars.copy_context(), call)
+        for call in calls
+    ]
+    return [future.result() for future in futures]
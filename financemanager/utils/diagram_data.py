@@ -1,53 +1,115 @@
-from datetime import timedelta
-import pandas as pd
+from datetime import datetime, timedelta
 from django.db.models import Sum, Count
-from django.db.models.functions import TruncDate
-from django.db.models import CharField
-from django.db.models.functions import Cast
-from transaction.models import Category
+from django.db.models.functions import ExtractIsoWeekDay, ExtractIsoYear, ExtractWeek
+from transaction.models import Category, translate_category_name
+from transaction.rollups import category_totals
+
+from .concurrency import run_queries
+
+
+def aggregate_period(qs, scope=None):
+    """
+    Totals, per-day series and per-category expense sums and counts of qs.
+
+    Without scope they come from a single query grouped by (date, type,
+    category). scope - category_totals() arguments describing qs: totals
+    and categories are then read from the monthly rollups, only the
+    per-day series is grouped from raw rows.
+    """
+    if scope is not None:
+        return _aggregate_with_rollups(qs, scope)
+
+    rows = qs.values(
+        'date', 'type', 'category__id', 'category__name', 'category__is_system'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+
+    totals = {'INCOME': 0, 'OUTCOME': 0}
+    days = {}
+    categories = {}
+    for row in rows:
+        type = row['type']
+        totals[type] = totals.get(type, 0) + row['total']
+
+        day = days.setdefault(row['date'].isoformat(), {})
+        day[type] = day.get(type, 0) + row['total']
+
+        if type == 'OUTCOME':
+            key = row['category__id'], row['category__name'], row['category__is_system']
+            total, count = categories.get(key, (0, 0))
+            categories[key] = total + row['total'], count + row['count']
+
+    return _period_aggregate(totals, days, categories)
+
+
+def _aggregate_with_rollups(qs, scope):
+    days = {}
+    for row in qs.values('date', 'type').annotate(total=Sum('amount')).order_by():
+        day = days.setdefault(row['date'].isoformat(), {})
+        day[row['type']] = day.get(row['type'], 0) + row['total']
+
+    totals = {'INCOME': 0, 'OUTCOME': 0}
+    expenses = []
+    for row in category_totals(**scope):
+        totals[row['type']] = totals.get(row['type'], 0) + row['total']
+        if row['type'] == 'OUTCOME':
+            expenses.append(row)
+
+    names = {
+        category_id: (name, is_system)
+        for category_id, name, is_system in Category.objects.filter(
+            id__in=[row['category_id'] for row in expenses if row['category_id']]
+        ).values_list('id', 'name', 'is_system')
+    }
+    categories = {}
+    for row in expenses:
+        name, is_system = names.get(row['category_id'], (None, None))
+        categories[row['category_id'], name, is_system] = row['total'], row['count']
 
+    return _period_aggregate(totals, days, categories)
 
-def period_stats(qs):
-    total_income = qs.filter(
-        type='INCOME',
-    ).aggregate(total=Sum('amount'))['total'] or 0
 
-    total_expense = qs.filter(
-        type='OUTCOME',
-    ).aggregate(total=Sum('amount'))['total'] or 0
+def _period_aggregate(totals, days, categories):
+    return {
+        'totals': totals,
+        'days': days,
+        'expense_categories': [
+            {
+                'category__id': category_id,
+                'category__name': category_name,
+                'category__is_system': is_system,
+                'total': total,
+                'count': count,
+            }
+            for (category_id, category_name, is_system), (total, count) in sorted(
+                categories.items(), key=lambda item: (item[0][1] or '', item[0][0] or 0)
+            )
+        ],
+    }
 
-    balance = total_income - total_expense
-    
-    transactions = qs.annotate(
-        day=Cast(TruncDate('date'), CharField())
-    ).values('day', 'type').annotate(total=Sum('amount'))
 
-    labels = sorted(set(t['day'] for t in transactions))
+def period_stats(qs, aggregate=None, scope=None, translate=translate_category_name):
+    if aggregate is None:
+        aggregate = aggregate_period(qs, scope)
 
-    income_data = [0] * len(labels)
-    expense_data = [0] * len(labels)
+    total_income = aggregate['totals']['INCOME']
+    total_expense = aggregate['totals']['OUTCOME']
+    balance = total_income - total_expense
 
-    for t in transactions:
-        index = labels.index(t['day'])
-        if t['type'] == 'INCOME':
-            income_data[index] = float(t['total'])
-        elif t['type'] == 'OUTCOME':
-            expense_data[index] = float(t['total'])
+    days = aggregate['days']
+    labels = sorted(days)
+    income_data = [
+        float(days[day]['INCOME']) if 'INCOME' in days[day] else 0 for day in labels
+    ]
+    expense_data = [
+        float(days[day]['OUTCOME']) if 'OUTCOME' in days[day] else 0 for day in labels
+    ]
 
-    expense_categories_raw = qs.filter(
-        type='OUTCOME',
-    ).values('category__name', 'category__id').annotate(total=Sum('amount'))
-    
     # Обрабатываем переводы для категорий
     expense_categories = []
-    for item in expense_categories_raw:
+    for item in aggregate['expense_categories']:
         category_name = item['category__name']
         if category_name and item['category__id']:
-            try:
-                category = Category.objects.get(id=item['category__id'])
-                translated_name = category.translated_name
-            except Category.DoesNotExist:
-                translated_name = category_name
+            translated_name = translate(category_name, item['category__is_system'])
         else:
             translated_name = category_name or 'Other'
         
@@ -67,37 +129,21 @@ def period_stats(qs):
     }
 
 
-def weekday_to_number(weekday):
-    match weekday:
-        case "Monday":
-            return 0
-        case "Tuesday":
-            return 1
-        case "Wednesday":
-            return 2
-        case "Thursday":
-            return 3
-        case "Friday":
-            return 4
-        case "Saturday":
-            return 5
-        case "Sunday":
-            return 6
-
-
-def expense_frequency_data(qs):
-    qs = qs.filter(type="OUTCOME").values('category__name', 'category__id').annotate(count=Count('id'))
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def expense_frequency_data(qs, aggregate=None):
+    if aggregate is None:
+        aggregate = aggregate_period(qs)
+
     expense_frequency_categories = []
     expense_frequency_values = []
 
-    for t in qs:
+    for t in aggregate['expense_categories']:
         if t['category__name'] and t['category__id']:
-            try:
-                category = Category.objects.get(id=t['category__id'])
-                translated_name = category.translated_name
-            except Category.DoesNotExist:
-                translated_name = t['category__name']
-            expense_frequency_categories.append(translated_name)
+            expense_frequency_categories.append(
+                translate_category_name(t['category__name'], t['category__is_system'])
+            )
         else:
             expense_frequency_categories.append('Other')
 
@@ -109,65 +155,61 @@ def expense_frequency_data(qs):
     }
 
 
+def week_label(year, week):
+    # Как и раньше, понедельник берется по номеру недели %W, а не ISO
+    monday = datetime.strptime(f'{year}-{week}-1', '%Y-%W-%w')
+    sunday = monday + timedelta(days=6)
+    return f"{monday.day}{monday.strftime('%B')[:3]}-{sunday.day}{sunday.strftime('%B')[:3]}"
+
+
 def get_data_for_heatmap(qs):
+    """
+    Expense sums per ISO year, ISO week and weekday. Bucketing happens in
+    the database, only the aggregated rows are formatted here.
+    """
+    rows = qs.filter(type="OUTCOME").annotate(
+        iso_year=ExtractIsoYear('date'),
+        iso_week=ExtractWeek('date'),
+        iso_weekday=ExtractIsoWeekDay('date'),
+    ).values('iso_year', 'iso_week', 'iso_weekday').annotate(
+        amount=Sum('amount')
+    ).order_by('iso_year', 'iso_week', 'iso_weekday')
+
     heatmap_list = []
     weeks_names_for_heatmap = []
-    hm_data = qs.filter(type="OUTCOME").order_by('date').values('date', 'amount')
-    
-    data_list = [
-        {
-            'date': item['date'],
-            'amount': float(item['amount'])
-        }
-        for item in hm_data
-    ]
-
-    if data_list:
-        df = pd.DataFrame(data_list)
-        df['weekday'] = pd.to_datetime(df['date']).dt.day_name()
-        df['week'] = pd.to_datetime(df['date']).dt.isocalendar().week
-        df['year'] = pd.to_datetime(df['date']).dt.isocalendar().year
-        heatmap_data = df.groupby(['year', 'week', 'weekday'])['amount'].sum().reset_index()
-
-        heatmap_data['weekday_num'] = heatmap_data['weekday'].map(weekday_to_number)
-        heatmap_data = heatmap_data.sort_values(by=['year', 'week', 'weekday_num'])
-
-        heatmap_data['monday_date'] = pd.to_datetime(
-            heatmap_data['year'].astype(str) + '-' + 
-            heatmap_data['week'].astype(str) + '-1', 
-            format='%Y-%W-%w'
-        )
-        heatmap_data['sunday_date'] = heatmap_data['monday_date'] + timedelta(days=6)
-
-        heatmap_data['week_label'] = heatmap_data.apply(
-            lambda row: 
-            f"{row['monday_date'].day}{row['monday_date'].month_name()[:3]}" + \
-            f"-{row['sunday_date'].day}{row['sunday_date'].month_name()[:3]}",
-            axis=1
-        )
-
-        weeks_names_for_heatmap = heatmap_data[['week', 'week_label']].drop_duplicates()
-        weeks_names_for_heatmap = weeks_names_for_heatmap['week_label'].to_list()
-
-        heatmap_list = [
-            {
-                'x': row['weekday'],
-                'y': f"{row['week_label']}",
-                'heat': row['amount']
-            }
-            for _, row in heatmap_data.iterrows()
-        ]
+    seen_weeks = set()
+    labels = {}
+    for row in rows:
+        year, week = row['iso_year'], row['iso_week']
+        if (year, week) not in labels:
+            labels[year, week] = week_label(year, week)
+        label = labels[year, week]
+
+        if (week, label) not in seen_weeks:
+            seen_weeks.add((week, label))
+            weeks_names_for_heatmap.append(label)
+
+        heatmap_list.append({
+            'x': WEEKDAY_NAMES[row['iso_weekday'] - 1],
+            'y': label,
+            'heat': float(row['amount'])
+        })
     return {
         'heatmap': heatmap_list,
         'weeks_names_for_heatmap': weeks_names_for_heatmap,
-        'day_names_for_heatmap': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+        'day_names_for_heatmap': list(WEEKDAY_NAMES)
     }
 
 
-def extended_period_stats(qs):
+def extended_period_stats(qs, scope=None):
     qs = qs.select_related('category', 'account', 'user')
-    
-    data = period_stats(qs)
-    data.update(get_data_for_heatmap(qs))
-    data.update(expense_frequency_data(qs))
+    # Агрегаты периода и тепловая карта не зависят друг от друга
+    aggregate, heatmap = run_queries(
+        lambda: aggregate_period(qs, scope),
+        lambda: get_data_for_heatmap(qs),
+    )
+
+    data = period_stats(qs, aggregate)
+    data.update(heatmap)
+    data.update(expense_frequency_data(qs, aggregate))
     return data
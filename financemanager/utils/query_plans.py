@@ -0,0 +1,51 @@
+import re
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+_PG_SEQ_SCAN_RE = re.compile(r'Seq Scan on "?(\w+)"?')
+
+# SEARCH - поиск по индексу, SCAN - полный проход по таблице или индексу
+_SQLITE_SCAN_RE = re.compile(r'^SCAN "?(\w+)"?')
+
+
+def explain(sql, params=None, using=DEFAULT_DB_ALIAS):
+    """Plan lines of sql on PostgreSQL or SQLite"""
+    connection = connections[using]
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan, vendor):
+    """Tables read by a sequential (full) scan in plan lines"""
+    pattern = _SQLITE_SCAN_RE if vendor == 'sqlite' else _PG_SEQ_SCAN_RE
+    return {
+        match.group(1)
+        for line in plan
+        if (match := pattern.search(line.strip()))
+    }
+
+
+@contextmanager
+def capture_full_scans(tables, using=DEFAULT_DB_ALIAS):
+    """
+    Collects SELECT queries run inside the block and explains them after.
+    Yields a list filled with (sql, table) for every full scan of one of
+    tables, so a test can assertEqual(scans, []).
+    """
+    connection = connections[using]
+    scans = []
+    with CaptureQueriesContext(connection) as queries:
+        yield scans
+
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        for table in full_scans(explain(sql, using=using), connection.vendor):
+            if table in tables:
+                scans.append((sql, table))